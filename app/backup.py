@@ -0,0 +1,723 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Iterable
+
+from app.config import settings
+from app.db import engine, db_access, exclusive_db, reload_db, JOURNAL_TABLES, SCHEMA_VERSION, REQUIRED_TABLES
+from app.utils import now_tz
+
+log = logging.getLogger(__name__)
+
+# ====== Бэкап базы: согласованный снимок без остановки бота ======
+#
+# Живой data.db не копируется напрямую: пока идёт запись (планировщик,
+# хендлеры), копия может оказаться «разорванной». Вместо этого делаем снимок
+# через SQLite backup API (sqlite3.Connection.backup) во временный файл —
+# порциями по BACKUP_STEP_PAGES страниц с паузой между ними, чтобы писатели
+# не ждали. Снимок и ZIP-сжатие выполняются в отдельном потоке, event loop
+# бота при этом не блокируется.
+
+BACKUP_DIR = Path("./data/backups")
+BACKUP_PREFIX = "xmplus_backup_"
+BACKUP_TS_FORMAT = "%Y%m%d_%H%M%S"
+# Автоматические бэкапы помечаются суффиксом; ротация трогает только их
+AUTO_SUFFIX = "_auto"
+# Инкрементальные бэкапы (только журнал изменений с последнего полного)
+INC_SUFFIX = "_inc"
+# Журнал автоматических бэкапов: размер и длительность каждого запуска
+BACKUP_LOG = BACKUP_DIR / "backup_log.jsonl"
+# Индекс архивов: размер, SHA-256, строки по таблицам, длительность, file_id
+MANIFEST_PATH = BACKUP_DIR / "manifest.json"
+
+# Пауза между порциями копирования — окно для писателей
+BACKUP_STEP_SLEEP = 0.005
+# Если во время пошагового копирования базу меняют слишком часто (каждое
+# изменение перезапускает копирование), делаем снимок одним шагом
+BACKUP_MAX_RESTARTS = 5
+
+# Переменные окружения, которые кладём в архив (.env)
+BACKUP_ENV_KEYS = (
+    "BOT_TOKEN", "OWNER_CHAT_ID", "BOT_MODE", "DEALER_NAME",
+    "TIMEZONE", "CHECK_INTERVAL_MINUTES", "PRE_NOTIFY_HOURS",
+    "NOTIFY_EVERY_MINUTES", "MAX_NOTIFICATIONS", "DATABASE_URL",
+)
+TZ_OVERRIDE_PATH = Path("/app/.tz_override")
+
+# Файлы внутри архива
+ARCHIVE_DB = "data/data.db"
+ARCHIVE_META = "meta.json"
+ARCHIVE_JOURNAL = "journal.jsonl"
+KIND_FULL = "full"
+KIND_INCREMENTAL = "incremental"
+
+# Ключ app_settings: имя полного бэкапа, от которого считаются инкременты
+BACKUP_BASE_KEY = "backup_base"
+
+ProgressFunc = Callable[[str], Awaitable[None]]
+
+
+def find_db_path() -> Path | None:
+    """Найти файл БД: пробуем несколько вариантов пути."""
+    candidates = [
+        Path("/app/data/data.db"),       # абсолютный путь в Docker
+        Path("./data/data.db"),          # относительный (WORKDIR /app)
+        Path("data/data.db"),            # без ./
+    ]
+    # Также пробуем извлечь путь из DATABASE_URL
+    url = os.environ.get("DATABASE_URL", "")
+    if ":///" in url:
+        raw = url.split("///", 1)[1].split("?")[0]
+        candidates.insert(0, Path(raw))
+    for p in candidates:
+        if p.exists():
+            return p
+    return None
+
+
+def backup_env_content() -> str:
+    env_lines = [f"{k}={os.environ[k]}" for k in BACKUP_ENV_KEYS if k in os.environ]
+    return "\n".join(env_lines) + "\n"
+
+
+class _SnapshotRestarted(Exception):
+    pass
+
+
+def snapshot_sqlite(
+    src: Path,
+    dest: Path,
+    pages: int | None = None,
+    on_step: Callable[[int, int], None] | None = None,
+) -> None:
+    """
+    Согласованная копия базы src → dest через backup API (вызывается в потоке).
+    on_step(скопировано, всего) вызывается после каждой порции.
+    """
+    if pages is None:
+        pages = settings.BACKUP_STEP_PAGES
+    restarts = 0
+    last_remaining: int | None = None
+
+    def progress(status: int, remaining: int, total: int) -> None:
+        nonlocal restarts, last_remaining
+        # Запись в базу из другого соединения перезапускает копирование
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise _SnapshotRestarted()
+        last_remaining = remaining
+        if on_step is not None:
+            on_step(total - remaining, total)
+        time.sleep(BACKUP_STEP_SLEEP)
+
+    source = sqlite3.connect(f"file:{src}?mode=ro", uri=True, timeout=30)
+    try:
+        target = sqlite3.connect(dest)
+        try:
+            try:
+                source.backup(target, pages=pages, progress=progress)
+            except _SnapshotRestarted:
+                log.info("Backup of %s restarted %s times, copying in one step", src, restarts)
+                source.backup(target, pages=-1)
+            # Проверка, что снимок читается
+            target.execute("PRAGMA schema_version").fetchone()
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+def _journal_mark(conn: sqlite3.Connection) -> int:
+    """Последний выданный id журнала (0 — журнала нет или он пуст с самого начала)."""
+    try:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_journal'").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return int(row[0]) if row else 0
+
+
+def _seal_snapshot(snapshot: Path, zip_name: str) -> tuple[int, dict[str, int]]:
+    """
+    Подготовить снимок к архивации: запомнить отметку журнала, очистить
+    журнал в копии (он уже отражён в данных) и записать в копию, что её
+    база для инкрементов — она сама. Возвращает (отметка журнала, строк по таблицам).
+    """
+    conn = sqlite3.connect(snapshot)
+    try:
+        mark = _journal_mark(conn)
+        try:
+            conn.execute("DELETE FROM change_journal")
+        except sqlite3.OperationalError:
+            pass
+        conn.execute(
+            "INSERT OR REPLACE INTO app_settings (key, value) VALUES (?, ?)", (BACKUP_BASE_KEY, zip_name),
+        )
+        conn.commit()
+        tables = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+            "AND name != 'change_journal' ORDER BY name"
+        )]
+        rows = {t: conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in tables}
+        return mark, rows
+    finally:
+        conn.close()
+
+
+def write_backup_zip(
+    snapshot: Path, zip_path: Path, env_content: str, tz_path: Path, meta: dict,
+) -> list[str]:
+    """Собрать ZIP из снимка (вызывается в потоке). Возвращает содержимое архива."""
+    tmp_zip = zip_path.with_suffix(".zip.part")
+    with zipfile.ZipFile(tmp_zip, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.write(snapshot, ARCHIVE_DB)
+        zf.writestr(".env", env_content)
+        zf.writestr(ARCHIVE_META, json.dumps(meta, ensure_ascii=False))
+        if tz_path.exists():
+            zf.write(tz_path, ".tz_override")
+    os.replace(tmp_zip, zip_path)
+
+    # Проверяем что data.db действительно попало в архив
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        return zf.namelist()
+
+
+async def _set_backup_base(zip_name: str, mark: int) -> None:
+    """После полного бэкапа: он становится базой инкрементов, старый журнал не нужен."""
+    async with db_access(), engine.begin() as conn:
+        await conn.exec_driver_sql(
+            "INSERT OR REPLACE INTO app_settings (key, value) VALUES (?, ?)", (BACKUP_BASE_KEY, zip_name),
+        )
+        await conn.exec_driver_sql("DELETE FROM change_journal WHERE id <= ?", (mark,))
+
+
+async def prune_journal(keep_days: float, max_rows: int) -> int:
+    """
+    Ограничить журнал изменений независимо от полных бэкапов: удалить строки
+    старше keep_days и всё сверх последних max_rows (0 — без ограничения).
+    Инкремент поверх обрезанного журнала невозможен — _write_incremental_zip
+    заметит разрыв и попросит полный бэкап. Возвращает число удалённых строк.
+    """
+    removed = 0
+    async with db_access(), engine.begin() as conn:
+        if keep_days > 0:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=keep_days)
+            result = await conn.exec_driver_sql(
+                "DELETE FROM change_journal WHERE changed_at < ?", (cutoff.strftime("%Y-%m-%d %H:%M:%S.%f"),),
+            )
+            removed += result.rowcount or 0
+        if max_rows > 0:
+            result = await conn.exec_driver_sql(
+                "DELETE FROM change_journal WHERE id <= (SELECT MAX(id) FROM change_journal) - ?", (max_rows,),
+            )
+            removed += result.rowcount or 0
+    return removed
+
+
+async def clear_journal() -> int:
+    """Очистить журнал целиком (инкрементальные бэкапы выключены — он не нужен)."""
+    async with db_access(), engine.begin() as conn:
+        result = await conn.exec_driver_sql("DELETE FROM change_journal")
+    return result.rowcount or 0
+
+
+async def create_backup(zip_path: Path, progress: ProgressFunc | None = None) -> list[str]:
+    """
+    Полный бэкап: снимок базы + ZIP в zip_path, запись в manifest.json. Вся
+    работа с файлами — в отдельном потоке. progress(text) — необязательный
+    отчёт о ходе работы.
+    """
+    db_path = find_db_path()
+    if db_path is None:
+        raise FileNotFoundError(
+            "Файл базы данных не найден! "
+            f"DATABASE_URL: {os.environ.get('DATABASE_URL', '(не задан)')}, CWD: {Path.cwd()}"
+        )
+    zip_path.parent.mkdir(parents=True, exist_ok=True)
+    loop = asyncio.get_running_loop()
+
+    def on_step(done: int, total: int) -> None:
+        if progress is not None and total:
+            asyncio.run_coroutine_threadsafe(
+                progress(f"Снимок базы: {done * 100 // total}%"), loop,
+            )
+
+    started = time.monotonic()
+    with tempfile.TemporaryDirectory(dir=zip_path.parent) as tmp:
+        snapshot = Path(tmp) / "data.db"
+        async with db_access():
+            await asyncio.to_thread(snapshot_sqlite, db_path, snapshot, None, on_step)
+        mark, rows = await asyncio.to_thread(_seal_snapshot, snapshot, zip_path.name)
+        log.info("DB snapshot %s: %.2fs", snapshot.stat().st_size, time.monotonic() - started)
+        if progress is not None:
+            await progress("Сжимаю архив…")
+        meta = {"kind": KIND_FULL, "journal_mark": mark}
+        names = await asyncio.to_thread(
+            write_backup_zip, snapshot, zip_path, backup_env_content(), TZ_OVERRIDE_PATH, meta,
+        )
+    if ARCHIVE_DB not in names:
+        raise RuntimeError(f"data/data.db не в архиве. Содержимое: {names}")
+    await asyncio.to_thread(
+        _register_archive, zip_path,
+        {"kind": KIND_FULL, "journal_mark": mark, "rows": rows, "duration": time.monotonic() - started},
+    )
+    await _set_backup_base(zip_path.name, mark)
+    return names
+
+
+# ====== Инкрементальные бэкапы: журнал изменений с последнего полного ======
+#
+# Триггеры на items, dealers, balance_txns, payments, routers пишут каждую
+# изменённую строку в change_journal (см. app/db.py). Полный бэкап запоминает
+# отметку журнала (journal_mark) и становится базой; инкрементальный архив
+# содержит только строки журнала после этой отметки — килобайты вместо всей
+# базы. Восстановление: базовый полный архив + повтор журнала.
+
+
+def read_archive_meta(archive: Path) -> dict:
+    """meta.json архива. У старых полных бэкапов его нет — отметка журнала неизвестна."""
+    with zipfile.ZipFile(archive, "r") as zf:
+        names = zf.namelist()
+        if ARCHIVE_META in names:
+            return json.loads(zf.read(ARCHIVE_META))
+        if ARCHIVE_DB in names:
+            return {"kind": KIND_FULL, "journal_mark": None}
+    raise ValueError("Архив не содержит data/data.db — это не бэкап XMPLUS.")
+
+
+def incremental_backup_name(now: datetime) -> str:
+    return f"{BACKUP_PREFIX}{now.strftime(BACKUP_TS_FORMAT)}{INC_SUFFIX}.zip"
+
+
+def _write_incremental_zip(db_path: Path, zip_path: Path) -> int | None:
+    """
+    Инкремент от текущей базы (в потоке). Возвращает число строк журнала
+    (0 — изменений не было, архив не создан) или None, если базового полного
+    бэкапа нет и нужен полный.
+    """
+    started = time.monotonic()
+    source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+    try:
+        row = source.execute(
+            "SELECT value FROM app_settings WHERE key = ?", (BACKUP_BASE_KEY,)
+        ).fetchone()
+        base = BACKUP_DIR / row[0] if row else None
+        if base is None or not base.exists():
+            return None
+        entry = load_manifest().get(base.name, {})
+        mark = entry["journal_mark"] if "journal_mark" in entry else read_archive_meta(base).get("journal_mark")
+        if mark is None:
+            return None
+        # Журнал обрезан (prune_journal) после отметки базы: изменения потеряны,
+        # инкремент собрать нельзя — нужен полный бэкап
+        first = source.execute("SELECT MIN(id) FROM change_journal WHERE id > ?", (mark,)).fetchone()[0]
+        if _journal_mark(source) > mark and first != mark + 1:
+            log.info("Change journal was pruned after mark %s, full backup required", mark)
+            return None
+
+        tmp_zip = zip_path.with_suffix(".zip.part")
+        count = 0
+        last_id = mark
+        per_table: dict[str, int] = {}
+        rows = source.execute(
+            "SELECT id, table_name, row_id, op, row_json, changed_at FROM change_journal "
+            "WHERE id > ? ORDER BY id", (mark,),
+        )
+        with zipfile.ZipFile(tmp_zip, "w", zipfile.ZIP_DEFLATED) as zf:
+            with zf.open(ARCHIVE_JOURNAL, "w") as raw, io.TextIOWrapper(raw, encoding="utf-8") as out:
+                for jid, table, row_id, op, row_json, changed_at in rows:
+                    out.write(json.dumps({
+                        "id": jid, "table": table, "row_id": row_id, "op": op,
+                        "row": json.loads(row_json) if row_json else None,
+                        "changed_at": changed_at,
+                    }, ensure_ascii=False) + "\n")
+                    count += 1
+                    last_id = jid
+                    per_table[table] = per_table.get(table, 0) + 1
+            zf.writestr(ARCHIVE_META, json.dumps({
+                "kind": KIND_INCREMENTAL, "base": base.name,
+                "from_id": mark, "to_id": last_id, "rows": count,
+            }, ensure_ascii=False))
+    finally:
+        source.close()
+    if count == 0:
+        tmp_zip.unlink(missing_ok=True)
+        return 0
+    os.replace(tmp_zip, zip_path)
+    _register_archive(zip_path, {
+        "kind": KIND_INCREMENTAL, "base": base.name, "rows": per_table,
+        "duration": time.monotonic() - started,
+    })
+    return count
+
+
+async def create_incremental_backup(zip_path: Path) -> int | None:
+    """См. _write_incremental_zip."""
+    db_path = find_db_path()
+    if db_path is None:
+        raise FileNotFoundError("Файл базы данных не найден!")
+    zip_path.parent.mkdir(parents=True, exist_ok=True)
+    async with db_access():
+        return await asyncio.to_thread(_write_incremental_zip, db_path, zip_path)
+
+
+def replay_journal(db: Path, lines: Iterable[str]) -> int:
+    """
+    Применить строки журнала к базе db (в потоке). Триггеры журнала в базе
+    остаются: повторённые изменения снова попадают в журнал, и следующий
+    инкремент от той же базы их не потеряет.
+    """
+    conn = sqlite3.connect(db)
+    try:
+        columns: dict[str, set[str]] = {}
+        count = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            table = entry["table"]
+            if table not in JOURNAL_TABLES:
+                continue
+            if entry["op"] == "D":
+                conn.execute(f"DELETE FROM {table} WHERE id = ?", (entry["row_id"],))
+            else:
+                if table not in columns:
+                    columns[table] = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+                row = {k: v for k, v in entry["row"].items() if k in columns[table]}
+                names = ", ".join(f'"{k}"' for k in row)
+                marks = ", ".join("?" for _ in row)
+                conn.execute(f"INSERT OR REPLACE INTO {table} ({names}) VALUES ({marks})", tuple(row.values()))
+            count += 1
+        conn.commit()
+        return count
+    finally:
+        conn.close()
+
+
+def _extract_db(archive: Path, dest: Path) -> None:
+    with zipfile.ZipFile(archive, "r") as zf, zf.open(ARCHIVE_DB) as src, open(dest, "wb") as out:
+        shutil.copyfileobj(src, out)
+
+
+def build_restored_db(archive: Path, dest: Path) -> dict:
+    """
+    Собрать базу из архива в dest (в потоке). Полный архив — распаковка;
+    инкрементальный — базовый полный архив с сервера + повтор журнала.
+    Возвращает meta архива.
+    """
+    dest.unlink(missing_ok=True)
+    meta = read_archive_meta(archive)
+    if meta.get("kind") != KIND_INCREMENTAL:
+        _extract_db(archive, dest)
+        return meta
+    base = BACKUP_DIR / meta["base"]
+    if not base.exists():
+        raise FileNotFoundError(f"Базовый полный бэкап {meta['base']} не найден на сервере.")
+    _extract_db(base, dest)
+    with zipfile.ZipFile(archive, "r") as zf, zf.open(ARCHIVE_JOURNAL) as raw:
+        meta["replayed"] = replay_journal(dest, io.TextIOWrapper(raw, encoding="utf-8"))
+    return meta
+
+
+# ====== Автоматические бэкапы: ротация «дед-отец-сын» ======
+
+
+def gfs_keep(
+    stamps: Iterable[datetime], hourly: int, daily: int, weekly: int,
+) -> set[datetime]:
+    """
+    Какие бэкапы оставить: самый свежий в каждом из последних `hourly` часов,
+    `daily` дней и `weekly` недель (ISO). Самый новый бэкап остаётся всегда.
+    """
+    ordered = sorted(set(stamps), reverse=True)
+    keep: set[datetime] = set(ordered[:1])
+    for limit, bucket in (
+        (hourly, lambda d: (d.date(), d.hour)),
+        (daily, lambda d: d.date()),
+        (weekly, lambda d: d.isocalendar()[:2]),
+    ):
+        seen: set = set()
+        for d in ordered:
+            if len(seen) >= limit:
+                break
+            b = bucket(d)
+            if b not in seen:
+                seen.add(b)
+                keep.add(d)
+    return keep
+
+
+def auto_backup_name(now: datetime) -> str:
+    return f"{BACKUP_PREFIX}{now.strftime(BACKUP_TS_FORMAT)}{AUTO_SUFFIX}.zip"
+
+
+def _auto_backups() -> dict[datetime, Path]:
+    out: dict[datetime, Path] = {}
+    for f in BACKUP_DIR.glob(f"{BACKUP_PREFIX}*{AUTO_SUFFIX}.zip"):
+        ts = f.stem[len(BACKUP_PREFIX):-len(AUTO_SUFFIX)]
+        try:
+            out[datetime.strptime(ts, BACKUP_TS_FORMAT)] = f
+        except ValueError:
+            continue
+    return out
+
+
+def apply_retention(hourly: int, daily: int, weekly: int) -> list[Path]:
+    """
+    Удалить автоматические бэкапы вне окна хранения и инкременты, чей
+    базовый полный бэкап уже удалён. Возвращает удалённые файлы.
+    """
+    backups = _auto_backups()
+    keep = gfs_keep(backups, hourly, daily, weekly)
+    removed = []
+    for ts, path in backups.items():
+        if ts not in keep:
+            path.unlink(missing_ok=True)
+            removed.append(path)
+    manifest = load_manifest()
+    for path in BACKUP_DIR.glob(f"{BACKUP_PREFIX}*{INC_SUFFIX}.zip"):
+        base = manifest.get(path.name, {}).get("base")
+        if base is None:
+            try:
+                base = read_archive_meta(path).get("base")
+            except (zipfile.BadZipFile, ValueError, KeyError):
+                continue
+        if base and not (BACKUP_DIR / base).exists():
+            path.unlink(missing_ok=True)
+            removed.append(path)
+    remove_from_manifest(*(p.name for p in removed))
+    return removed
+
+
+def record_backup_run(
+    name: str, size: int, duration: float, ok: bool, error: str | None = None, kind: str = KIND_FULL,
+) -> None:
+    """Дописать запуск в журнал BACKUP_LOG (JSON Lines)."""
+    BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+    entry = {
+        "at": now_tz().isoformat(timespec="seconds"),
+        "file": name,
+        "kind": kind,
+        "size": size,
+        "duration": round(duration, 3),
+        "ok": ok,
+    }
+    if error:
+        entry["error"] = error
+    with open(BACKUP_LOG, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+# ====== Горячее восстановление ======
+#
+# База собирается из архива во временный файл рядом с рабочим, проверяется
+# (integrity_check, версия схемы) в отдельном потоке и только потом атомарно
+# подменяет рабочий файл (os.replace). После этого соединения переоткрываются
+# и кэши сбрасываются — бот продолжает работу на восстановленных данных без
+# перезапуска контейнера.
+
+DEFAULT_DB_PATH = Path("./data/data.db")
+
+
+def verify_db(path: Path) -> None:
+    """Проверить базу перед подменой (в потоке). ValueError — если с ней что-то не так."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        try:
+            problems = [r[0] for r in conn.execute("PRAGMA integrity_check").fetchall()]
+        except sqlite3.DatabaseError as e:
+            raise ValueError(f"Файл в архиве не является базой SQLite: {e}") from e
+        if problems != ["ok"]:
+            raise ValueError("База повреждена (integrity_check): " + "; ".join(problems[:5]))
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise ValueError(
+                f"Бэкап сделан более новой версией бота (схема {version}, у этого бота {SCHEMA_VERSION}). "
+                "Обновите бота и повторите."
+            )
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        missing = [t for t in REQUIRED_TABLES if t not in tables]
+        if missing:
+            raise ValueError(f"В базе нет таблиц: {', '.join(missing)}")
+    finally:
+        conn.close()
+
+
+async def restore_backup(archive: Path, progress: ProgressFunc | None = None) -> dict:
+    """
+    Восстановить базу из архива (полного или инкрементального) без перезапуска.
+    Файл подменяется под exclusive_db: планировщик и запись FSM на паузе,
+    открытые сессии закрыты — никто не пишет в старый файл и не оставляет
+    журнал отката, который SQLite применил бы к новому. Текущая база
+    предварительно сохраняется как data.db.pre_restore_<ts>.
+    Возвращает meta архива.
+    """
+    db_path = find_db_path() or DEFAULT_DB_PATH
+    tmp_db = db_path.with_name("_restore_tmp.db")
+    try:
+        if progress is not None:
+            await progress("Распаковываю архив…")
+        meta = await asyncio.to_thread(build_restored_db, archive, tmp_db)
+        if progress is not None:
+            await progress("Проверяю базу (integrity_check)…")
+        await asyncio.to_thread(verify_db, tmp_db)
+
+        if progress is not None:
+            await progress("Жду завершения операций с базой…")
+        async with exclusive_db():
+            # Резервная копия текущей базы — согласованным снимком
+            if db_path.exists():
+                if progress is not None:
+                    await progress("Сохраняю текущую базу…")
+                safe = db_path.with_name(f"{db_path.name}.pre_restore_{now_tz().strftime(BACKUP_TS_FORMAT)}")
+                await asyncio.to_thread(snapshot_sqlite, db_path, safe, -1)
+
+            await engine.dispose()
+            # Соединений нет: оставшийся журнал — от прерванной записи в старый файл
+            for suffix in ("-journal", "-wal", "-shm"):
+                leftover = db_path.with_name(db_path.name + suffix)
+                if leftover.exists():
+                    log.warning("Removing leftover %s before restore", leftover.name)
+                    leftover.unlink()
+            os.replace(tmp_db, db_path)
+            with zipfile.ZipFile(archive, "r") as zf:
+                if ".tz_override" in zf.namelist():
+                    TZ_OVERRIDE_PATH.write_bytes(zf.read(".tz_override"))
+            await reload_db()
+    finally:
+        tmp_db.unlink(missing_ok=True)
+    log.info("Database restored from %s", archive.name)
+    return meta
+
+
+# ====== manifest.json: индекс архивов ======
+#
+# Список бэкапов читает один небольшой файл вместо glob + stat по каталогу.
+# После первой отправки архива в Telegram в манифест пишется file_id —
+# повторная отправка того же архива идёт по file_id, без загрузки файла.
+# Если манифеста нет или он повреждён, он пересобирается по каталогу. При
+# чтении списка манифест сверяется с каталогом (только имена файлов):
+# архивы, положенные вручную, добавляются, удалённые вручную — убираются.
+
+_manifest_lock = threading.Lock()
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _scan_archive(path: Path) -> dict:
+    st = path.stat()
+    entry: dict = {
+        "size": st.st_size,
+        "sha256": _sha256(path),
+        "created_at": datetime.fromtimestamp(st.st_mtime).isoformat(timespec="seconds"),
+    }
+    try:
+        meta = read_archive_meta(path)
+    except (zipfile.BadZipFile, ValueError):
+        return entry
+    entry["kind"] = meta.get("kind", KIND_FULL)
+    for key in ("journal_mark", "base"):
+        if meta.get(key) is not None:
+            entry[key] = meta[key]
+    return entry
+
+
+def _read_manifest_unlocked() -> dict[str, dict]:
+    try:
+        return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))["backups"]
+    except FileNotFoundError:
+        pass
+    except (ValueError, KeyError, TypeError, OSError) as e:
+        log.warning("Backup manifest is broken (%s), rebuilding", e)
+    backups = {p.name: _scan_archive(p) for p in BACKUP_DIR.glob(f"{BACKUP_PREFIX}*.zip")}
+    _write_manifest_unlocked(backups)
+    return backups
+
+
+def _write_manifest_unlocked(backups: dict[str, dict]) -> None:
+    BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = MANIFEST_PATH.with_suffix(".json.part")
+    tmp.write_text(json.dumps({"backups": backups}, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def _reconcile_unlocked(backups: dict[str, dict]) -> dict[str, dict]:
+    """Сверить манифест с каталогом: новые архивы просканировать, исчезнувшие убрать."""
+    present = {p.name: p for p in BACKUP_DIR.glob(f"{BACKUP_PREFIX}*.zip")}
+    added = [name for name in present if name not in backups]
+    removed = [name for name in backups if name not in present]
+    if not added and not removed:
+        return backups
+    for name in removed:
+        del backups[name]
+    for name in added:
+        try:
+            backups[name] = _scan_archive(present[name])
+        except FileNotFoundError:
+            # Удалили, пока сканировали
+            pass
+    log.info("Backup manifest reconciled: +%d, -%d", len(added), len(removed))
+    _write_manifest_unlocked(backups)
+    return backups
+
+
+def load_manifest() -> dict[str, dict]:
+    """
+    {имя архива: запись}, сверенный с каталогом. Вызывать из потока:
+    новые архивы сканируются (sha256).
+    """
+    with _manifest_lock:
+        return _reconcile_unlocked(_read_manifest_unlocked())
+
+
+def _register_archive(zip_path: Path, fields: dict) -> None:
+    entry = {
+        "size": zip_path.stat().st_size,
+        "sha256": _sha256(zip_path),
+        "created_at": now_tz().isoformat(timespec="seconds"),
+        **fields,
+    }
+    if "duration" in entry:
+        entry["duration"] = round(entry["duration"], 3)
+    with _manifest_lock:
+        backups = _read_manifest_unlocked()
+        backups[zip_path.name] = entry
+        _write_manifest_unlocked(backups)
+
+
+def remove_from_manifest(*names: str) -> None:
+    if not names:
+        return
+    with _manifest_lock:
+        backups = _read_manifest_unlocked()
+        for name in names:
+            backups.pop(name, None)
+        _write_manifest_unlocked(backups)
+
+
+def set_manifest_file_id(name: str, file_id: str) -> None:
+    """Запомнить file_id архива после отправки в Telegram."""
+    with _manifest_lock:
+        backups = _read_manifest_unlocked()
+        if name in backups:
+            backups[name]["file_id"] = file_id
+            _write_manifest_unlocked(backups)
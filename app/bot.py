@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import logging
+import time
 
 from datetime import datetime, timezone, timedelta
 import csv, io, html, json, os, re, calendar, zipfile, shutil
@@ -37,12 +38,20 @@ from sqlalchemy import select, delete, update
 from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
 
 from app.db import (
-    SessionLocal, engine, Item, RouterItem, Dealer, DealerOrder, BalanceTxn, PaymentMethod, PaymentVariant, Payment,
-    get_price, set_price, apply_balance_change, MAIN_CODE, list_dealers, get_dealer,
-    list_payment_methods, get_payment_method,
-    list_payment_variants, get_payment_variant,
+    SessionLocal, engine, Item, RouterItem, Dealer, DealerOrder, BalanceTxn, Payment,
+    get_price, set_price, apply_balance_change, MAIN_CODE, list_dealers, get_dealer, register_cache_reset,
 )
+from app.catalog import list_payment_methods, get_payment_method, list_payment_variants, get_payment_variant
+from app.statements import get_statements, parse_month, previous_month, statement_text
 from app.config import settings
+from app.multibot import current_dealer, admin_bot, send_to_dealer
+from app.leader import lease
+from app.outbound import gateway as outbound_gateway
+from app.tasks import runner, Job
+from app.export import (
+    export_items_csv, items_export_query,
+    export_delta_jsonl, parse_delta_cursor, format_delta_cursor, DeltaCursorExpired,
+)
 from app.utils import (
     parse_amount,
     parse_datetime_human,
@@ -105,7 +114,7 @@ async def _notify_fail(bot: Bot, dest_name: str, err: Exception) -> None:
     owner = int(settings.OWNER_CHAT_ID) if settings.OWNER_CHAT_ID else None
     if owner:
         try:
-            await bot.send_message(
+            await admin_bot(bot).send_message(
                 owner,
                 f"\u26a0\ufe0f \u041d\u0435 \u0443\u0434\u0430\u043b\u043e\u0441\u044c \u043e\u0442\u043f\u0440\u0430\u0432\u0438\u0442\u044c \u0441\u043e\u043e\u0431\u0449\u0435\u043d\u0438\u0435: {dest_name}\n\u041f\u0440\u0438\u0447\u0438\u043d\u0430: {err}",
             )
@@ -125,10 +134,17 @@ BOT_COMMANDS_ADMIN = [
     BotCommand(command="next", description="Ближайшие истечения"),
     BotCommand(command="dealers", description="Раздел диллеры"),
     BotCommand(command="balance", description="Балансы и долги дилеров"),
+    BotCommand(command="statement", description="Выписки дилеров за месяц"),
+    BotCommand(command="forecast", description="Прогноз продлений и выручки"),
     BotCommand(command="pay", description="Методы оплаты"),
     BotCommand(command="edit", description="Редактировать ключ"),
     BotCommand(command="status", description="Статус бота"),
     BotCommand(command="backup", description="Бэкап базы данных"),
+    BotCommand(command="delta", description="Выгрузка изменений (JSONL) с курсора"),
+    BotCommand(command="jobs", description="Фоновые задачи"),
+    BotCommand(command="perf", description="Скорость обработчиков и запросов к БД"),
+    BotCommand(command="slow", description="Медленные запросы к БД"),
+    BotCommand(command="bottoken", description="Собственные боты дилеров"),
     BotCommand(command="timezone", description="Показать/сменить локальное время (TZ)"),
     BotCommand(command="cancel", description="Отменить текущий ввод"),
     BotCommand(command="menu", description="Показать клавиатуру"),
@@ -144,6 +160,7 @@ BOT_COMMANDS_DEALER = [
     BotCommand(command="order", description="Заказать новые ключи"),
     BotCommand(command="edit", description="Изменить имя клиента"),
     BotCommand(command="balance", description="Ваш баланс (долг)"),
+    BotCommand(command="statement", description="Выписка за месяц"),
     BotCommand(command="pay", description="Оплата и реквизиты"),
     BotCommand(command="status", description="Статус"),
 ]
@@ -154,18 +171,48 @@ def is_dealer_mode() -> bool:
 
 # ====== Роли пользователей и контроль доступа (единый бот) ======
 
-async def resolve_role(user_id: int) -> str:
-    """
-    Роль: 'owner' (администратор), 'dealer' (дилер из БД) или 'none' (нет доступа).
-    В legacy dealer-контейнере владелец = сам дилер, остальные — 'none'.
-    """
+# Роль проверяется фильтрами на каждом апдейте — кэшируем на ROLE_CACHE_SECONDS.
+# Ключ — (дилер, в чьём боте апдейт; user_id): в боте дилера «дилер» — только он сам.
+ROLE_CACHE_SECONDS = 60
+ROLE_CACHE_MAX = 10000
+_role_cache: dict[tuple[str | None, int], tuple[str, float]] = {}
+
+
+@register_cache_reset
+def reset_role_cache() -> None:
+    """Сбросить кэш ролей (после изменения дилеров)."""
+    _role_cache.clear()
+
+
+async def _resolve_role(user_id: int, scope: str | None) -> str:
     if settings.OWNER_CHAT_ID and str(user_id) == str(settings.OWNER_CHAT_ID):
         return "owner"
     if is_dealer_mode():
         return "none"
     async with SessionLocal() as session:
-        found = (await session.execute(select(Dealer.id).where(Dealer.chat_id == user_id))).first()
-    return "dealer" if found else "none"
+        code = (await session.execute(select(Dealer.code).where(Dealer.chat_id == user_id))).scalars().first()
+    if code is None or (scope is not None and code != scope):
+        return "none"
+    return "dealer"
+
+
+async def resolve_role(user_id: int) -> str:
+    """
+    Роль: 'owner' (администратор), 'dealer' (дилер из БД) или 'none' (нет доступа).
+    В legacy dealer-контейнере владелец = сам дилер, остальные — 'none'.
+    В боте дилера (admin-процесс) роль 'dealer' — только у этого дилера.
+    """
+    scope = None if is_dealer_mode() else current_dealer()
+    key = (scope, user_id)
+    now = time.monotonic()
+    hit = _role_cache.get(key)
+    if hit is not None and hit[1] > now:
+        return hit[0]
+    role = await _resolve_role(user_id, scope)
+    if len(_role_cache) >= ROLE_CACHE_MAX:
+        _role_cache.clear()
+    _role_cache[key] = (role, now + ROLE_CACHE_SECONDS)
+    return role
 
 
 async def dealer_by_chat(user_id: int) -> Dealer | None:
@@ -235,16 +282,6 @@ def split_text_chunks(header: str, lines: list[str]) -> list[str]:
         chunks.append(current.rstrip())
     return chunks
 
-async def build_items_csv_bytes(items) -> bytes:
-    buf = io.StringIO()
-    w = csv.writer(buf)
-    w.writerow(["user_id", "username", "note", "due_date"])
-    for it in items:
-        w.writerow([it.user_id, it.username, getattr(it, "note", "") or "", fmt_dt_human(it.due_date)])
-    data = buf.getvalue().encode("utf-8")
-    buf.close()
-    return data
-
 # Вариант A: фиксированные ширины колонок
 UID_W = 5
 UNAME_W = 8
@@ -268,9 +305,27 @@ def make_table_lines_without_id(items) -> tuple[str, list[str]]:
 def send_pre_chunk(message: Message, text: str):
     return message.answer(f"<pre>{html.escape(text, quote=False)}</pre>", parse_mode="HTML")
 
+async def send_table(message: Message, header: str, lines: list[str], filename: str, numbered: bool = True) -> None:
+    """
+    Таблица страницами <pre>, а если страниц больше LIST_MAX_CHUNKS —
+    одним .txt-документом (вместо пачки сообщений и flood wait).
+    """
+    chunks = split_text_chunks(header, lines)
+    if len(chunks) > settings.LIST_MAX_CHUNKS:
+        data = (header + "\n" + "\n".join(lines) + "\n").encode("utf-8")
+        await message.answer_document(
+            BufferedInputFile(data, filename=filename),
+            caption=f"Строк: {len(lines)} ({len(chunks)} стр.) — таблица отправлена файлом.",
+        )
+        return
+    for i, ch in enumerate(chunks, 1):
+        suffix = f"\n(стр. {i}/{len(chunks)})" if numbered and len(chunks) > 1 else ""
+        await send_pre_chunk(message, ch + suffix)
+
 def dealer_filter(query):
-    if is_dealer_mode():
-        return query.where(Item.dealer == settings.DEALER_NAME)
+    code = current_dealer()
+    if code:
+        return query.where(Item.dealer == code)
     return query
 
 async def set_bot_commands(bot: Bot) -> None:
@@ -295,11 +350,20 @@ async def set_bot_commands(bot: Bot) -> None:
     except Exception:
         pass
 
+async def set_dealer_bot_commands(bot: Bot) -> None:
+    """Меню собственного бота дилера — набор команд дилера."""
+    await bot.set_my_commands(commands=BOT_COMMANDS_DEALER, scope=BotCommandScopeDefault())
+    try:
+        await bot.set_chat_menu_button(menu_button=MenuButtonCommands())
+    except Exception:
+        pass
+
 @router.message(CommandStart())
 @router.message(F.text == "/start")
 async def on_start(message: Message) -> None:
-    role = "dealer" if is_dealer_mode() else "admin"
-    who = f" ({settings.DEALER_NAME})" if is_dealer_mode() else ""
+    code = current_dealer()
+    role = "dealer" if code else "admin"
+    who = f" ({code})" if code else ""
     await message.answer(
         f"✅ XMPLUS запущен [{role}{who}].\n"
         "Команды — в меню (кнопка с квадратами) и на клавиатуре ниже.",
@@ -329,11 +393,16 @@ async def on_status(message: Message) -> None:
     async with SessionLocal() as session:
         q = dealer_filter(select(Item))
         total = (await session.execute(q)).scalars().unique().all()
-    role = "dealer" if is_dealer_mode() else "admin"
-    who = f" ({settings.DEALER_NAME})" if is_dealer_mode() else ""
+    code = current_dealer()
+    role = "dealer" if code else "admin"
+    who = f" ({code})" if code else ""
+    out = outbound_gateway.metrics()
     await message.answer(
         f"Бот работает ✅\nРежим: {role}{who}\nВ базе записей (в пределах вашей видимости): {len(total)}\n"
-        f"ACTIVE_TZ: {get_active_timezone_name()} (UTC{tz_offset_str()})",
+        f"ACTIVE_TZ: {get_active_timezone_name()} (UTC{tz_offset_str()})\n"
+        f"Планировщик: {'ведущий' if lease.is_leader() else 'резерв'} ({lease.holder})\n"
+        f"Отправка: очередь {out['queued_interactive']}+{out['queued_bulk']}, "
+        f"отправлено {out['sent']}, 429: {out['retry_after']}, ошибок {out['failed']}",
     )
 
 # ==== Таймзона ====
@@ -374,15 +443,55 @@ async def tz_set(cb: CallbackQuery) -> None:
 async def on_cancel(message: Message, state: FSMContext) -> None:
     await state.clear()
     await message.answer("Отменено.", reply_markup=main_menu_kb())
-async def list_export_csv(cb: CallbackQuery) -> None:
-    async with SessionLocal() as session:
-        q = dealer_filter(select(Item).order_by(Item.due_date.asc()))
-        items = (await session.execute(q)).scalars().all()
-    data = await build_items_csv_bytes(items)
-    await cb.message.answer_document(
-        BufferedInputFile(data, filename="clients_export.csv"),
-        caption=f"Экспорт: {len(items)} записей"
-    )
+
+
+@router.callback_query(F.data == "list:export_csv")
+async def list_export_csv(cb: CallbackQuery, bot: Bot) -> None:
+    await cb.answer("Готовлю экспорт…")
+
+    async def job_body(job: Job) -> str:
+        await job.progress("Выгружаю записи…", force=True)
+        doc, count = await export_items_csv(dealer_filter(items_export_query()), "clients_export.csv")
+        try:
+            await job.progress(f"Отправляю файл ({count} записей)…", force=True)
+            await cb.message.answer_document(doc, caption=f"Экспорт: {count} записей")
+        finally:
+            doc.close()
+        return f"Записей: {count}"
+
+    await runner.start(bot, cb.message.chat.id, "Экспорт CSV", job_body, key="export:all")
+
+
+@_admin.message(Command("delta"))
+async def on_delta_export(message: Message) -> None:
+    """Выгрузка изменений после курсора: /delta [курсор]. Без курсора — всё текущее состояние."""
+    parts = (message.text or "").split(maxsplit=1)
+    since = None
+    if len(parts) > 1:
+        since = parse_delta_cursor(parts[1])
+        if since is None:
+            await message.answer("Неверный курсор. Формат: /delta 2025-01-31T12:00:00.000000")
+            return
+    try:
+        doc, count, cursor = await export_delta_jsonl(since)
+    except DeltaCursorExpired:
+        await message.answer(
+            f"Курсор старше {settings.DELTA_KEEP_DAYS} дн.: удаления за это время уже не хранятся. "
+            "Запросите полную выгрузку: /delta"
+        )
+        return
+    cursor_txt = format_delta_cursor(cursor)
+    try:
+        await message.answer_document(
+            doc,
+            caption=(
+                f"Изменений: {count}\n"
+                f"Следующая выгрузка: <code>/delta {cursor_txt}</code>"
+            ),
+            parse_mode="HTML",
+        )
+    finally:
+        doc.close()
 
 
 # ==== Редактирование ключей (админ) ====
@@ -565,10 +674,7 @@ async def on_list(message: Message) -> None:
         await message.answer("Список пуст.")
         return
     header, lines = make_table_lines_without_id(items)
-    chunks = split_text_chunks(header, lines)
-    for i, ch in enumerate(chunks, 1):
-        suffix = f"\n(стр. {i}/{len(chunks)})" if len(chunks) > 1 else ""
-        await send_pre_chunk(message, ch + suffix)
+    await send_table(message, header, lines, "clients.txt")
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="⬇️ Экспорт CSV", callback_data="list:export_csv")]
     ])
@@ -587,10 +693,7 @@ async def on_disabled(message: Message) -> None:
         return
     header, lines = make_table_lines_without_id(expired)
     header = "Disabled (просроченные):\n" + "-" * 40 + "\n" + header
-    chunks = split_text_chunks(header, lines)
-    for i, ch in enumerate(chunks, 1):
-        suffix = f"\n(стр. {i}/{len(chunks)})" if len(chunks) > 1 else ""
-        await send_pre_chunk(message, ch + suffix)
+    await send_table(message, header, lines, "disabled.txt")
 
 @router.message(Command("next"))
 @router.message(F.text.in_(["/next", "⏰ Ближайшие"]))
@@ -606,10 +709,7 @@ async def on_next(message: Message) -> None:
         return
     header, lines = make_table_lines_without_id(window)
     header = "Ближайшие (до 3 дней):\n" + "-" * 40 + "\n" + header
-    chunks = split_text_chunks(header, lines)
-    for i, ch in enumerate(chunks, 1):
-        suffix = f"\n(стр. {i}/{len(chunks)})" if len(chunks) > 1 else ""
-        await send_pre_chunk(message, ch + suffix)
+    await send_table(message, header, lines, "next.txt")
 
 # ====== Кабинет дилера (единый бот, роль 'dealer') ======
 
@@ -650,10 +750,7 @@ async def dealer_on_list(message: Message, state: FSMContext) -> None:
         await message.answer("Список пуст.")
         return
     header, lines = make_table_lines_without_id(items)
-    chunks = split_text_chunks(header, lines)
-    for i, ch in enumerate(chunks, 1):
-        suffix = f"\n(стр. {i}/{len(chunks)})" if len(chunks) > 1 else ""
-        await send_pre_chunk(message, ch + suffix)
+    await send_table(message, header, lines, "clients.txt")
     await message.answer(f"Всего записей: {len(items)}")
 
 
@@ -674,10 +771,7 @@ async def dealer_on_disabled(message: Message, state: FSMContext) -> None:
         return
     header, lines = make_table_lines_without_id(expired)
     header = "Disabled (просроченные):\n" + "-" * 40 + "\n" + header
-    chunks = split_text_chunks(header, lines)
-    for i, ch in enumerate(chunks, 1):
-        suffix = f"\n(стр. {i}/{len(chunks)})" if len(chunks) > 1 else ""
-        await send_pre_chunk(message, ch + suffix)
+    await send_table(message, header, lines, "disabled.txt")
 
 
 @dealer_router.message(Command("next"))
@@ -698,10 +792,7 @@ async def dealer_on_next(message: Message, state: FSMContext) -> None:
         return
     header, lines = make_table_lines_without_id(window)
     header = "Ближайшие (до 3 дней):\n" + "-" * 40 + "\n" + header
-    chunks = split_text_chunks(header, lines)
-    for i, ch in enumerate(chunks, 1):
-        suffix = f"\n(стр. {i}/{len(chunks)})" if len(chunks) > 1 else ""
-        await send_pre_chunk(message, ch + suffix)
+    await send_table(message, header, lines, "next.txt")
 
 
 @dealer_router.message(Command("status"))
@@ -911,7 +1002,7 @@ async def dealer_order_collect_name(message: Message, state: FSMContext, bot: Bo
             [InlineKeyboardButton(text="▶️ Выполнить", callback_data=f"oful:{oid}")],
         ])
         try:
-            await bot.send_message(owner_chat, admin_text, reply_markup=kb)
+            await admin_bot(bot).send_message(owner_chat, admin_text, reply_markup=kb)
         except Exception as e:
             log.warning("Failed to send order to admin: %s", e)
     await message.answer(
@@ -1041,7 +1132,7 @@ async def dealer_renew_comment(message: Message, state: FSMContext, bot: Bot) ->
             InlineKeyboardButton(text="❌ Отклонить", callback_data=f"rreq:no:{it.id}"),
         ]])
         try:
-            await bot.send_message(owner_chat, admin_text, reply_markup=kb)
+            await admin_bot(bot).send_message(owner_chat, admin_text, reply_markup=kb)
         except Exception as e:
 
             log.warning("Failed to send renew request to admin: %s", e)
@@ -1086,9 +1177,30 @@ async def dealer_on_balance(message: Message, state: FSMContext) -> None:
             lines.append(_fmt_txn(t))
     else:
         lines.append("Операций пока нет.")
+    lines.append("")
+    lines.append("Выписка за месяц: /statement ГГГГ-ММ")
     await message.answer("\n".join(lines))
 
 
+@dealer_router.message(Command("statement"))
+async def dealer_on_statement(message: Message, state: FSMContext) -> None:
+    """Выписка за месяц: /statement [ГГГГ-ММ]. Без месяца — за прошлый."""
+    await state.clear()
+    d = await dealer_by_chat(message.from_user.id)
+    if not d:
+        return
+    parts = (message.text or "").split(maxsplit=1)
+    month = parse_month(parts[1]) if len(parts) > 1 else previous_month(now_tz().date())
+    if month is None:
+        await message.answer("Неверный месяц. Формат: /statement 2025-01")
+        return
+    st = (await get_statements(month, d.code)).get(d.code)
+    if st is None:
+        await message.answer("Выписка недоступна.")
+        return
+    await message.answer(statement_text(st, d.title))
+
+
 # ===== Оплата (дилер) =====
 
 
@@ -1241,7 +1353,7 @@ async def dealer_pay_amount(message: Message, state: FSMContext, bot: Bot) -> No
             InlineKeyboardButton(text="❌ Отклонить", callback_data=f"pay:no:{pay_id}"),
         ]])
         try:
-            await bot.send_message(owner_chat, admin_text, reply_markup=kb)
+            await admin_bot(bot).send_message(owner_chat, admin_text, reply_markup=kb)
         except Exception as e:
 
             log.warning("Failed to send payment request to admin: %s", e)
@@ -1322,8 +1434,8 @@ async def renew_request_reject(cb: CallbackQuery, bot: Bot) -> None:
     d = await get_dealer(dealer_code) if dealer_code and dealer_code != MAIN_CODE else None
     if d and d.chat_id is not None:
         try:
-            await bot.send_message(
-                d.chat_id,
+            await send_to_dealer(
+                d.code, bot, d.chat_id,
                 "❌ Запрос на продление отклонён администратором.\n"
                 f"Клиент: USERID={user_id}, USERNAME={username}",
             )
@@ -1492,7 +1604,7 @@ async def oful_confirm(cb: CallbackQuery, state: FSMContext, bot: Bot) -> None:
             f"Ваш долг: {bal_abs}"
         )
         try:
-            await bot.send_message(dealer_chat_id, dealer_text, parse_mode="HTML")
+            await send_to_dealer(dealer_code, bot, dealer_chat_id, dealer_text, parse_mode="HTML")
         except Exception:
             await cb.message.answer(f"⚠️ Не удалось отправить ключ дилеру (chat_id={dealer_chat_id}).")
 
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+from sqlalchemy import select
+
+from app.db import SessionLocal, PaymentMethod, PaymentVariant, register_cache_reset
+
+# ====== Каталог методов и видов оплаты ======
+#
+# Методы и виды меняются редко, а читаются на каждом нажатии в /pay (админ и
+# дилеры). Каталог грузится одним запросом (методы LEFT JOIN виды) в
+# неизменяемую структуру и отдаётся из памяти:
+# - обработчики pm:* / pv:*, меняющие методы и виды, вызывают invalidate_catalog();
+# - после восстановления базы каталог сбрасывается вместе с остальными кэшами;
+# - правки с другой реплики подхватываются не позже чем через CATALOG_TTL_SECONDS.
+
+CATALOG_TTL_SECONDS = 60
+
+
+@dataclass(frozen=True)
+class CatalogVariant:
+    id: int
+    method_id: int
+    name: str
+    requisites: str
+    active: bool
+
+
+@dataclass(frozen=True)
+class CatalogMethod:
+    id: int
+    name: str
+    requisites: str
+    active: bool
+    variants: tuple[CatalogVariant, ...]
+
+
+@dataclass(frozen=True)
+class PaymentCatalog:
+    methods: tuple[CatalogMethod, ...]
+    method_by_id: Mapping[int, CatalogMethod]
+    variant_by_id: Mapping[int, CatalogVariant]
+
+    @classmethod
+    def build(cls, rows) -> "PaymentCatalog":
+        """Из строк (PaymentMethod, PaymentVariant | None), отсортированных по id метода и вида."""
+        order: list[PaymentMethod] = []
+        variants: dict[int, list[CatalogVariant]] = {}
+        for m, v in rows:
+            if m.id not in variants:
+                order.append(m)
+                variants[m.id] = []
+            if v is not None:
+                variants[m.id].append(CatalogVariant(
+                    id=v.id, method_id=v.method_id, name=v.name, requisites=v.requisites or "", active=bool(v.active),
+                ))
+        methods = tuple(
+            CatalogMethod(
+                id=m.id, name=m.name, requisites=m.requisites or "", active=bool(m.active),
+                variants=tuple(variants[m.id]),
+            )
+            for m in order
+        )
+        return cls(
+            methods=methods,
+            method_by_id=MappingProxyType({m.id: m for m in methods}),
+            variant_by_id=MappingProxyType({v.id: v for m in methods for v in m.variants}),
+        )
+
+
+_catalog: Optional[PaymentCatalog] = None
+_loaded_at = 0.0
+# Растёт при каждом сбросе: каталог, загруженный до сброса, не сохраняется
+_generation = 0
+_lock = asyncio.Lock()
+
+
+@register_cache_reset
+def invalidate_catalog() -> None:
+    global _catalog, _generation
+    _catalog = None
+    _generation += 1
+
+
+async def _load() -> PaymentCatalog:
+    async with SessionLocal() as session:
+        rows = (await session.execute(
+            select(PaymentMethod, PaymentVariant)
+            .outerjoin(PaymentVariant, PaymentVariant.method_id == PaymentMethod.id)
+            .order_by(PaymentMethod.id.asc(), PaymentVariant.id.asc())
+        )).all()
+    return PaymentCatalog.build(rows)
+
+
+async def get_catalog() -> PaymentCatalog:
+    global _catalog, _loaded_at
+    cat = _catalog
+    if cat is not None and time.monotonic() - _loaded_at < CATALOG_TTL_SECONDS:
+        return cat
+    async with _lock:
+        if _catalog is not None and time.monotonic() - _loaded_at < CATALOG_TTL_SECONDS:
+            return _catalog
+        generation = _generation
+        cat = await _load()
+        if generation == _generation:
+            _catalog = cat
+            _loaded_at = time.monotonic()
+        return cat
+
+
+async def list_payment_methods(active_only: bool = False) -> list[CatalogMethod]:
+    """Все методы оплаты (опционально — только активные)."""
+    methods = (await get_catalog()).methods
+    return [m for m in methods if m.active] if active_only else list(methods)
+
+
+async def get_payment_method(pm_id: int) -> CatalogMethod | None:
+    """Метод оплаты по id."""
+    return (await get_catalog()).method_by_id.get(pm_id)
+
+
+async def list_payment_variants(method_id: int, active_only: bool = False) -> list[CatalogVariant]:
+    """Варианты оплаты по методу (опционально — только активные)."""
+    m = (await get_catalog()).method_by_id.get(method_id)
+    if m is None:
+        return []
+    return [v for v in m.variants if v.active] if active_only else list(m.variants)
+
+
+async def get_payment_variant(var_id: int) -> CatalogVariant | None:
+    """Вариант оплаты по id."""
+    return (await get_catalog()).variant_by_id.get(var_id)
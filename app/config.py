@@ -25,4 +25,78 @@ class Settings:
     # Дилер-бот (read-only): sqlite+aiosqlite:///file:/app/data/data.db?mode=ro&uri=true
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./data/data.db")
 
+    # Исходящие сообщения (лимиты Telegram): всего в секунду, в один чат в секунду,
+    # запас подряд в один чат, повторов после 429
+    OUTBOUND_GLOBAL_RATE: float = float(os.getenv("OUTBOUND_GLOBAL_RATE", "25"))
+    OUTBOUND_CHAT_RATE: float = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+    OUTBOUND_CHAT_BURST: float = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+    OUTBOUND_MAX_RETRIES: int = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+
+    # Списки: больше стольких страниц-сообщений — отправляем таблицу одним файлом
+    LIST_MAX_CHUNKS: int = int(os.getenv("LIST_MAX_CHUNKS", "3"))
+
+    # Экспорт CSV: сжимать файл gzip (clients_export.csv.gz)
+    EXPORT_GZIP: bool = os.getenv("EXPORT_GZIP", "0").strip().lower() in ("1", "true", "yes")
+    # Выгрузка изменений (/delta): сколько дней хранить отметки об удалениях (0 — всегда);
+    # курсор старше этого принимается только полной выгрузкой
+    DELTA_KEEP_DAYS: int = int(os.getenv("DELTA_KEEP_DAYS", "30"))
+
+    # Бэкап: сколько страниц БД копировать за один шаг снимка (между шагами пишут другие)
+    BACKUP_STEP_PAGES: int = int(os.getenv("BACKUP_STEP_PAGES", "1024"))
+    # Автоматический бэкап: интервал в часах (0 — выключен), сколько хранить
+    # почасовых / дневных / недельных архивов, отправлять ли архив владельцу
+    BACKUP_INTERVAL_HOURS: float = float(os.getenv("BACKUP_INTERVAL_HOURS", "6"))
+    BACKUP_KEEP_HOURLY: int = int(os.getenv("BACKUP_KEEP_HOURLY", "24"))
+    BACKUP_KEEP_DAILY: int = int(os.getenv("BACKUP_KEEP_DAILY", "7"))
+    BACKUP_KEEP_WEEKLY: int = int(os.getenv("BACKUP_KEEP_WEEKLY", "4"))
+    # Инкрементальный бэкап (только изменения с последнего полного): интервал в минутах, 0 — выключен
+    BACKUP_INCREMENTAL_MINUTES: int = int(os.getenv("BACKUP_INCREMENTAL_MINUTES", "60"))
+    # Журнал изменений для инкрементов обычно чистит полный бэкап; без полных бэкапов
+    # он ограничен сроком (дни) и числом строк (0 — без ограничения). Обрезанный
+    # журнал — следующий инкремент заменяется полным бэкапом
+    JOURNAL_KEEP_DAYS: float = float(os.getenv("JOURNAL_KEEP_DAYS", "7"))
+    JOURNAL_MAX_ROWS: int = int(os.getenv("JOURNAL_MAX_ROWS", "100000"))
+    BACKUP_SEND_TO_OWNER: bool = os.getenv("BACKUP_SEND_TO_OWNER", "0").strip().lower() in ("1", "true", "yes")
+
+    # Сверка балансов дилеров с историей операций (и снимки баланса): интервал в часах, 0 — выключена
+    BALANCE_RECONCILE_HOURS: float = float(os.getenv("BALANCE_RECONCILE_HOURS", "6"))
+
+    # Состояния мастеров (FSM): sqlite — в БД, переживают перезапуск; memory — в памяти.
+    # Размер кэша в памяти, период записи в БД (сек), через сколько часов
+    # брошенный мастер удаляется
+    FSM_STORAGE: str = os.getenv("FSM_STORAGE", "sqlite").strip().lower()
+    FSM_CACHE_SIZE: int = int(os.getenv("FSM_CACHE_SIZE", "1000"))
+    FSM_FLUSH_SECONDS: float = float(os.getenv("FSM_FLUSH_SECONDS", "1"))
+    FSM_TTL_HOURS: float = float(os.getenv("FSM_TTL_HOURS", "24"))
+
+    # Получение апдейтов: пустой WEBHOOK_URL — long polling; иначе вебхук на
+    # WEBHOOK_URL + WEBHOOK_PATH, встроенный сервер слушает WEBHOOK_HOST:WEBHOOK_PORT.
+    # WEBHOOK_SECRET проверяется в каждом запросе (пусто — выводится из токена),
+    # WEBHOOK_MAX_INFLIGHT — сколько апдейтов обрабатывается одновременно
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "").strip().rstrip("/")
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/webhook").strip()
+    WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "").strip()
+    WEBHOOK_MAX_INFLIGHT: int = int(os.getenv("WEBHOOK_MAX_INFLIGHT", "40"))
+
+    # Адрес Bot API (свой сервер или локальная заглушка для тестов); пусто — api.telegram.org
+    TELEGRAM_API_URL: str = os.getenv("TELEGRAM_API_URL", "").strip().rstrip("/")
+
+    # Несколько реплик admin-бота: периодические задачи выполняет только держатель
+    # аренды в БД. Срок аренды в секундах (продлевается каждую треть срока); 0 — без выборов
+    LEADER_LEASE_SECONDS: int = int(os.getenv("LEADER_LEASE_SECONDS", "30"))
+
+    # Журнал медленных запросов к БД: порог в мс (0 — выключен), файл с ротацией
+    SLOW_QUERY_MS: float = float(os.getenv("SLOW_QUERY_MS", "0"))
+    SLOW_QUERY_LOG: str = os.getenv("SLOW_QUERY_LOG", "data/slow_queries.jsonl")
+    SLOW_QUERY_LOG_MAX_BYTES: int = int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", str(1024 * 1024)))
+    SLOW_QUERY_LOG_BACKUPS: int = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "3"))
+
+    # Проверка живости: HTTP /health (JSON) и /metrics (Prometheus); порт 0 — выключено.
+    # HEALTH_MAX_LOOP_LAG — при какой задержке event loop (сек) считать бота зависшим
+    HEALTH_HOST: str = os.getenv("HEALTH_HOST", "0.0.0.0")
+    HEALTH_PORT: int = int(os.getenv("HEALTH_PORT", "8081"))
+    HEALTH_MAX_LOOP_LAG: float = float(os.getenv("HEALTH_MAX_LOOP_LAG", "5"))
+
 settings = Settings()
\ No newline at end of file
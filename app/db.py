@@ -1,14 +1,19 @@
 from __future__ import annotations
 
-from typing import Optional
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
 from datetime import datetime, timezone
 
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import Integer, BigInteger, Float, Boolean, String, DateTime, select
+from sqlalchemy import Integer, BigInteger, Float, Boolean, String, Text, DateTime, Index, func, select, update
 
 from app.config import settings
 
+log = logging.getLogger(__name__)
+
 
 # Async-движок под aiosqlite
 engine = create_async_engine(
@@ -17,11 +22,102 @@ engine = create_async_engine(
     pool_pre_ping=True,
 )
 
+# ====== Пропуск к базе на время замены файла ======
+#
+# engine.dispose() закрывает только свободные соединения пула: соединение,
+# взятое сессией, продолжило бы писать в старый (уже подменённый) файл, а
+# незавершённая транзакция оставила бы рядом с новым файлом data.db-journal,
+# который SQLite откатил бы в восстановленную базу. Поэтому каждая сессия
+# SessionLocal на время жизни держит пропуск, а замена файла (exclusive_db)
+# ставит фоновых писателей на паузу, закрывает вход новым сессиям и ждёт,
+# пока текущие закроются.
+
+# Сколько ждать закрытия открытых сессий перед заменой файла (секунды)
+DB_PAUSE_TIMEOUT = 60.0
+
+
+class _DbGate:
+    def __init__(self) -> None:
+        self.active = 0
+        # Сессии по задачам: вложенная сессия не ждёт паузы, иначе задача ждала бы сама себя
+        self._held: dict[Optional[asyncio.Task], int] = {}
+        # Пока идёт замена: новые сессии (кроме сессий самой замены) ждут это событие
+        self._resume: asyncio.Event | None = None
+        self._idle: asyncio.Event | None = None
+        self._owner: Optional[asyncio.Task] = None
+
+    async def enter(self) -> None:
+        task = asyncio.current_task()
+        if not self._held.get(task) and task is not self._owner:
+            while self._resume is not None:
+                await self._resume.wait()
+        self.active += 1
+        self._held[task] = self._held.get(task, 0) + 1
+
+    def leave(self) -> None:
+        task = asyncio.current_task()
+        self.active -= 1
+        if self._held.get(task, 0) > 1:
+            self._held[task] -= 1
+        else:
+            self._held.pop(task, None)
+        if self.active == 0 and self._idle is not None:
+            self._idle.set()
+
+    @asynccontextmanager
+    async def exclusive(self, timeout: float) -> AsyncIterator[None]:
+        while self._resume is not None:
+            await self._resume.wait()
+        resume = self._resume = asyncio.Event()
+        idle = self._idle = asyncio.Event()
+        if self.active == 0:
+            idle.set()
+        try:
+            try:
+                await asyncio.wait_for(idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                raise RuntimeError(
+                    f"База занята: {self.active} сессий не закрылись за {timeout:g} с. Повторите позже."
+                ) from None
+            self._owner = asyncio.current_task()
+            yield
+        finally:
+            self._resume = self._idle = self._owner = None
+            resume.set()
+
+
+_gate = _DbGate()
+
+
+class GatedSession(AsyncSession):
+    """AsyncSession, которая на время `async with` держит пропуск к базе (см. exclusive_db)."""
+
+    async def __aenter__(self) -> "GatedSession":
+        await _gate.enter()
+        return self
+
+    async def __aexit__(self, type_: Any, value: Any, traceback: Any) -> None:
+        try:
+            await super().__aexit__(type_, value, traceback)
+        finally:
+            _gate.leave()
+
+
+@asynccontextmanager
+async def db_access() -> AsyncIterator[None]:
+    """Пропуск для работы с базой в обход SessionLocal (engine.begin, sqlite3 в потоке)."""
+    await _gate.enter()
+    try:
+        yield
+    finally:
+        _gate.leave()
+
+
 # Фабрика async-сессий
 SessionLocal = async_sessionmaker(
     bind=engine,
     expire_on_commit=False,
-    class_=AsyncSession,
+    class_=GatedSession,
 )
 
 
@@ -31,6 +127,8 @@ class Base(DeclarativeBase):
 
 class Item(Base):
     __tablename__ = "items"
+    # Истечения за период по дилерам (app/forecast.py)
+    __table_args__ = (Index("ix_items_due_dealer", "due_date", "dealer"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
 
@@ -47,6 +145,11 @@ class Item(Base):
     max_notifications: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     notified_count: Mapped[int] = mapped_column(Integer, default=0)
     last_notified_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True, index=True,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
 
 
 class RouterItem(Base):
@@ -59,6 +162,11 @@ class RouterItem(Base):
     note: Mapped[Optional[str]] = mapped_column(String(255), nullable=True, default="")
     notified_count: Mapped[int] = mapped_column(Integer, default=0)
     last_notified_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True, index=True,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
 
 
 class DealerOrder(Base):
@@ -84,8 +192,15 @@ class Dealer(Base):
     code: Mapped[str] = mapped_column(String(64), nullable=False, unique=True)
     title: Mapped[str] = mapped_column(String(128), nullable=False)
     chat_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    # Токен собственного бота дилера (обслуживается admin-процессом); NULL — без бота
+    bot_token: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
     # Баланс (долг) дилера в долларах
     balance: Mapped[float] = mapped_column(Float, nullable=False, default=0.0, server_default="0")
+    updated_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True, index=True,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
 
 
 class AppSetting(Base):
@@ -99,12 +214,17 @@ class AppSetting(Base):
 class BalanceTxn(Base):
     """Операция по балансу дилера (история начислений/списаний)."""
     __tablename__ = "balance_txns"
+    # История дилера и хвост после снимка (app/ledger.py); операции за месяц (app/statements.py)
+    __table_args__ = (
+        Index("ix_balance_txns_dealer_id", "dealer_code", "id"),
+        Index("ix_balance_txns_created_at", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     dealer_code: Mapped[str] = mapped_column(String(64), nullable=False)
     # Знак: + увеличивает долг, - уменьшает
     amount: Mapped[float] = mapped_column(Float, nullable=False)
-    # 'renewal' | 'admin_add' | 'admin_sub' | 'payment'
+    # 'renewal' | 'order' | 'admin_add' | 'admin_sub' | 'payment' | 'close' (дилер удалён)
     kind: Mapped[str] = mapped_column(String(32), nullable=False)
     comment: Mapped[str] = mapped_column(String(512), nullable=False, default="")
     created_at: Mapped[datetime] = mapped_column(
@@ -112,6 +232,24 @@ class BalanceTxn(Base):
     )
 
 
+class BalanceSnapshot(Base):
+    """
+    Баланс дилера по истории операций на момент операции txn_id (включительно).
+    Баланс на любой момент — последний снимок до него плюс короткий хвост
+    операций. См. app/ledger.py.
+    """
+    __tablename__ = "balance_snapshots"
+    __table_args__ = (Index("ix_balance_snapshots_dealer_txn", "dealer_code", "txn_id", unique=True),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    dealer_code: Mapped[str] = mapped_column(String(64), nullable=False)
+    txn_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    balance: Mapped[float] = mapped_column(Float, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+
+
 class PaymentMethod(Base):
     """Метод оплаты (ByBit, YooMoney, EnPara, Наличные и пр.) с реквизитами."""
     __tablename__ = "payment_methods"
@@ -147,6 +285,94 @@ class Payment(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
     )
+    updated_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True, index=True,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
+
+
+class Tombstone(Base):
+    """Удалённая строка отслеживаемой таблицы (для выгрузки изменений). Пишется триггером."""
+    __tablename__ = "tombstones"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    table_name: Mapped[str] = mapped_column(String(32), nullable=False)
+    row_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    deleted_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class ChangeJournal(Base):
+    """
+    Журнал изменений строк для инкрементальных бэкапов. Пишется триггерами:
+    op 'I'/'U' — row_json содержит строку целиком, 'D' — только row_id.
+    """
+    __tablename__ = "change_journal"
+    # AUTOINCREMENT: id не переиспользуются после очистки журнала
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    table_name: Mapped[str] = mapped_column(String(32), nullable=False)
+    row_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    op: Mapped[str] = mapped_column(String(1), nullable=False)
+    row_json: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    changed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
+class FsmState(Base):
+    """Состояние мастера диалога (FSM) — переживает перезапуск бота. См. app/fsm_storage.py."""
+    __tablename__ = "fsm_states"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    data: Mapped[str] = mapped_column(Text, nullable=False, default="{}")
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class Lease(Base):
+    """Аренда роли (например, ведущего планировщика) между репликами. См. app/leader.py."""
+    __tablename__ = "leases"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    holder: Mapped[str] = mapped_column(String(128), nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
+# Версия схемы (PRAGMA user_version), выставляется после миграций. Повышать,
+# когда старый код уже не сможет работать с базой; базу новее текущего кода
+# восстановить из бэкапа нельзя.
+SCHEMA_VERSION = 1
+
+# Таблицы, без которых база — не база бота
+REQUIRED_TABLES = ("items", "dealers", "app_settings")
+
+# Таблицы с колонкой updated_at и триггером tombstone
+UPDATED_AT_TABLES = ("items", "routers", "dealers", "payments")
+
+# Таблицы, изменения которых пишутся в change_journal
+JOURNAL_TABLES = ("items", "dealers", "balance_txns", "payments", "routers")
+JOURNAL_TRIGGER_SUFFIX = "_journal_"
+
+
+def journal_trigger_sql(table: str, columns: list[str]) -> list[tuple[str, str]]:
+    """(имя, CREATE TRIGGER) для записи INSERT/UPDATE/DELETE таблицы в change_journal."""
+    row_json = "json_object(" + ", ".join(f"'{c}', NEW.\"{c}\"" for c in columns) + ")"
+    out = []
+    for op, event, ref, payload in (
+        ("I", "INSERT", "NEW", row_json),
+        ("U", "UPDATE", "NEW", row_json),
+        ("D", "DELETE", "OLD", "NULL"),
+    ):
+        name = f"trg_{table}{JOURNAL_TRIGGER_SUFFIX}{event.lower()}"
+        out.append((name, (
+            f"CREATE TRIGGER {name} AFTER {event} ON {table} "
+            "BEGIN "
+            "INSERT INTO change_journal (table_name, row_id, op, row_json, changed_at) "
+            f"VALUES ('{table}', {ref}.id, '{op}', {payload}, "
+            "strftime('%Y-%m-%d %H:%M:%f000', 'now')); "
+            "END"
+        )))
+    return out
 
 
 def _migrate_schema(conn) -> None:
@@ -163,6 +389,9 @@ def _migrate_schema(conn) -> None:
             conn.exec_driver_sql(
                 "ALTER TABLE dealers ADD COLUMN balance REAL NOT NULL DEFAULT 0"
             )
+        # dealers.bot_token
+        if rows and "bot_token" not in cols:
+            conn.exec_driver_sql("ALTER TABLE dealers ADD COLUMN bot_token TEXT")
         # items.note
         rows = conn.exec_driver_sql("PRAGMA table_info(items)").fetchall()
         cols = {r[1] for r in rows}
@@ -175,6 +404,47 @@ def _migrate_schema(conn) -> None:
         cols = {r[1] for r in rows}
         if rows and "variant" not in cols:
             conn.exec_driver_sql("ALTER TABLE payments ADD COLUMN variant TEXT")
+        # updated_at (+ индекс) для таблиц, выгружаемых инкрементально
+        now_str = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+        for table in UPDATED_AT_TABLES:
+            rows = conn.exec_driver_sql(f"PRAGMA table_info({table})").fetchall()
+            if not rows:
+                continue
+            if "updated_at" not in {r[1] for r in rows}:
+                conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN updated_at DATETIME")
+                conn.exec_driver_sql(
+                    f"UPDATE {table} SET updated_at = ? WHERE updated_at IS NULL", (now_str,)
+                )
+            conn.exec_driver_sql(
+                f"CREATE INDEX IF NOT EXISTS ix_{table}_updated_at ON {table} (updated_at)"
+            )
+            # Удаления фиксируем триггером — ловит и ORM, и массовые delete()
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table}_tombstone AFTER DELETE ON {table} "
+                "BEGIN "
+                "INSERT INTO tombstones (table_name, row_id, deleted_at) "
+                f"VALUES ('{table}', OLD.id, strftime('%Y-%m-%d %H:%M:%f000', 'now')); "
+                "END"
+            )
+        # items: индекс по сроку и дилеру (создан в модели только для новых баз)
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_items_due_dealer ON items (due_date, dealer)")
+        # balance_txns: индексы по дилеру и по дате (созданы в модели только для новых баз)
+        if conn.exec_driver_sql("PRAGMA table_info(balance_txns)").fetchall():
+            conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_balance_txns_dealer_id ON balance_txns (dealer_code, id)"
+            )
+            conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_balance_txns_created_at ON balance_txns (created_at)"
+            )
+        # Журнал изменений: триггеры пересоздаём при каждом запуске, чтобы
+        # json_object включал все текущие колонки (в т.ч. добавленные выше)
+        for table in JOURNAL_TABLES:
+            rows = conn.exec_driver_sql(f"PRAGMA table_info({table})").fetchall()
+            if not rows:
+                continue
+            for name, sql in journal_trigger_sql(table, [r[1] for r in rows]):
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+                conn.exec_driver_sql(sql)
         # Перенос: метод с непустыми реквизитами и без видов → создать вид «Основной»
         try:
             pm_rows = conn.exec_driver_sql(
@@ -195,6 +465,7 @@ def _migrate_schema(conn) -> None:
                     )
         except Exception as e:
             print(f"_migrate_schema: data-migrate warning: {e}", flush=True)
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
     except Exception as e:
         print(f"_migrate_schema: warning: {e}", flush=True)
 
@@ -209,6 +480,71 @@ async def init_db() -> None:
         print(f"init_db: warning: {e}", flush=True)
 
 
+# ====== Кэши в памяти и горячая замена базы ======
+#
+# Модули, которые держат в памяти данные из БД, регистрируют функцию сброса.
+# После замены файла базы (восстановление из бэкапа) кэши сбрасываются,
+# соединения закрываются, и следующие сессии открывают уже новый файл.
+
+_cache_resets: list[Callable[[], None]] = []
+
+
+def register_cache_reset(fn: Callable[[], None]) -> Callable[[], None]:
+    """Зарегистрировать сброс кэша (можно как декоратор)."""
+    _cache_resets.append(fn)
+    return fn
+
+
+def invalidate_caches() -> None:
+    for fn in _cache_resets:
+        try:
+            fn()
+        except Exception:
+            log.exception("Cache reset %r failed", fn)
+
+
+# Фоновые писатели (планировщик, запись FSM): (пауза, продолжение)
+_db_pauses: list[tuple[Callable[[], Awaitable[None]], Callable[[], None]]] = []
+
+
+def register_db_pause(pause: Callable[[], Awaitable[None]], resume: Callable[[], None]) -> None:
+    """Зарегистрировать фонового писателя, которого exclusive_db ставит на паузу."""
+    _db_pauses.append((pause, resume))
+
+
+@asynccontextmanager
+async def exclusive_db(timeout: float = DB_PAUSE_TIMEOUT) -> AsyncIterator[None]:
+    """
+    Монопольный доступ к файлу базы (для его замены): фоновые писатели на
+    паузе, новые сессии ждут, открытые — закрыты. RuntimeError, если открытые
+    сессии не закрылись за timeout.
+    """
+    resumes: list[Callable[[], None]] = []
+    try:
+        for pause, resume in _db_pauses:
+            await pause()
+            resumes.append(resume)
+        async with _gate.exclusive(timeout):
+            yield
+    finally:
+        for resume in resumes:
+            try:
+                resume()
+            except Exception:
+                log.exception("Resume %r failed", resume)
+
+
+async def reload_db() -> None:
+    """
+    Переоткрыть базу после замены файла: закрыть все соединения пула
+    (SessionLocal привязан к тому же engine и откроет новый файл), сбросить
+    кэши и прогнать миграции — восстановленная база могла быть старой схемы.
+    """
+    await engine.dispose()
+    invalidate_caches()
+    await init_db()
+
+
 # Дилеры по умолчанию — переносим прежний «вшитый» список в БД при первом запуске.
 DEFAULT_DEALERS: list[tuple[str, str, Optional[int]]] = [
     ("serdar", "Сердар", 1832345568),
@@ -282,24 +618,75 @@ async def set_price(value: float) -> None:
         await session.commit()
 
 
+async def _change_balance(
+    session: AsyncSession, dealer_code: str, amount: float, kind: str, comment: str,
+) -> Optional[float]:
+    """Изменение баланса и запись в историю внутри транзакции session (без commit)."""
+    # Приращение в самом UPDATE: параллельные изменения не затирают друг друга
+    res = await session.execute(
+        update(Dealer)
+        .where(Dealer.code == dealer_code)
+        .values(balance=func.coalesce(Dealer.balance, 0.0) + amount)
+        .execution_options(synchronize_session=False)
+    )
+    if res.rowcount == 0:
+        return None
+    session.add(BalanceTxn(dealer_code=dealer_code, amount=amount, kind=kind, comment=comment or ""))
+    return (await session.execute(
+        select(Dealer.balance).where(Dealer.code == dealer_code)
+    )).scalar_one()
+
+
 async def apply_balance_change(dealer_code: str, amount: float, kind: str, comment: str = "") -> Optional[float]:
     """
     Изменить баланс дилера на amount (со знаком) и записать операцию в историю.
     Возвращает новый баланс или None, если дилер не найден.
     """
     async with SessionLocal() as session:
-        d = (await session.execute(
-            select(Dealer).where(Dealer.code == dealer_code)
-        )).scalars().first()
-        if not d:
+        new_balance = await _change_balance(session, dealer_code, amount, kind, comment)
+        if new_balance is None:
             return None
-        d.balance = (d.balance or 0.0) + amount
-        session.add(BalanceTxn(dealer_code=dealer_code, amount=amount, kind=kind, comment=comment or ""))
-        new_balance = d.balance
         await session.commit()
     return new_balance
 
 
+def payment_method_full(pay: Payment) -> str:
+    return f"{pay.method} → {pay.variant}" if pay.variant else pay.method
+
+
+async def resolve_payment(pay_id: int, status: str) -> tuple[Optional[Payment], Optional[Dealer], bool]:
+    """
+    Перевести заявку на оплату из 'pending' в status ('confirmed' | 'rejected').
+    Смена статуса — условный UPDATE ... WHERE status = 'pending', и при
+    подтверждении списание долга дилера идёт в той же транзакции: двойное
+    нажатие или два админа сразу не спишут сумму дважды, а сбой между шагами
+    не оставит подтверждённую оплату без записи в истории.
+    Возвращает (заявка, дилер, changed); changed=False — заявку уже обработали
+    (ничего не изменено), заявка None — не найдена.
+    """
+    async with SessionLocal() as session:
+        res = await session.execute(
+            update(Payment)
+            .where(Payment.id == pay_id, Payment.status == "pending")
+            .values(status=status)
+            .execution_options(synchronize_session=False)
+        )
+        changed = res.rowcount == 1
+        pay = await session.get(Payment, pay_id)
+        if pay is None:
+            return None, None, False
+        if changed and status == "confirmed":
+            await _change_balance(
+                session, pay.dealer_code, -pay.amount, "payment", f"Оплата: {payment_method_full(pay)}",
+            )
+        dealer = (await session.execute(
+            select(Dealer).where(Dealer.code == pay.dealer_code)
+        )).scalars().first()
+        if changed:
+            await session.commit()
+    return pay, dealer, changed
+
+
 MAIN_CODE = "main"
 
 
@@ -322,31 +709,32 @@ async def get_dealer(code: str) -> "Dealer | None":
         ).scalars().first()
 
 
-async def list_payment_methods(active_only: bool = False) -> list[PaymentMethod]:
-    """Все методы оплаты (опционально — только активные)."""
-    async with SessionLocal() as session:
-        q = select(PaymentMethod).order_by(PaymentMethod.id.asc())
-        if active_only:
-            q = q.where(PaymentMethod.active.is_(True))
-        return (await session.execute(q)).scalars().all()
-
-
-async def get_payment_method(pm_id: int) -> "PaymentMethod | None":
-    """Метод оплаты по id."""
-    async with SessionLocal() as session:
-        return await session.get(PaymentMethod, pm_id)
-
-
-async def list_payment_variants(method_id: int, active_only: bool = False) -> list[PaymentVariant]:
-    """Варианты оплаты по методу (опционально — только активные)."""
+async def delete_dealer(code: str) -> Optional[tuple[str, int]]:
+    """
+    Удалить дилера: его записи переходят в «Без дилера», история операций
+    остаётся и закрывается операцией 'close' на остаток по истории — дилер,
+    заново заведённый под тем же кодом, начинает с нуля и без расхождения
+    при сверке (app/ledger.py). Возвращает (название, перенесено записей)
+    или None, если дилера нет.
+    """
     async with SessionLocal() as session:
-        q = select(PaymentVariant).where(PaymentVariant.method_id == method_id).order_by(PaymentVariant.id.asc())
-        if active_only:
-            q = q.where(PaymentVariant.active.is_(True))
-        return (await session.execute(q)).scalars().all()
+        d = (await session.execute(select(Dealer).where(Dealer.code == code))).scalars().first()
+        if d is None:
+            return None
+        title = d.title
+        res = await session.execute(
+            update(Item).where(Item.dealer == code).values(dealer=MAIN_CODE)
+        )
+        moved = res.rowcount or 0
+        rest = (await session.execute(
+            select(func.coalesce(func.sum(BalanceTxn.amount), 0.0)).where(BalanceTxn.dealer_code == code)
+        )).scalar_one()
+        if rest:
+            session.add(BalanceTxn(
+                dealer_code=code, amount=-rest, kind="close", comment=f"Дилер «{title}» удалён",
+            ))
+        await session.delete(d)
+        await session.commit()
+    return title, moved
 
 
-async def get_payment_variant(var_id: int) -> "PaymentVariant | None":
-    """Вариант оплаты по id."""
-    async with SessionLocal() as session:
-        return await session.get(PaymentVariant, var_id)
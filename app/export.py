@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+import gzip
+import io
+import json
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import IO, Any, AsyncGenerator, Sequence
+
+from aiogram import Bot
+from aiogram.types.input_file import InputFile, DEFAULT_CHUNK_SIZE
+from sqlalchemy import Select, delete, or_, select
+
+from app.config import settings
+from app.db import SessionLocal, Item, RouterItem, Dealer, Payment, Tombstone
+from app.utils import fmt_dt_human, to_tz
+
+# ====== Потоковый экспорт в CSV ======
+#
+# Строки читаются из БД пачками, пишутся через csv.writer во временный файл
+# (в памяти до EXPORT_SPOOL_MAX, дальше — на диске), при необходимости сжимаются
+# gzip. Запись и сжатие идут в отдельном потоке, загрузка в Telegram — из файла.
+
+EXPORT_BATCH_SIZE = 500
+EXPORT_SPOOL_MAX = 1024 * 1024  # 1 MB в памяти, дальше — временный файл
+
+ITEMS_CSV_HEADER = ["user_id", "username", "note", "due_date"]
+
+
+class SpooledInputFile(InputFile):
+    """Документ для отправки из открытого файла: читается кусками, без копии в памяти."""
+
+    def __init__(self, fp: IO[bytes], filename: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.fp = fp
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        await asyncio.to_thread(self.fp.seek, 0)
+        while chunk := await asyncio.to_thread(self.fp.read, self.chunk_size):
+            yield chunk
+
+    def close(self) -> None:
+        self.fp.close()
+
+
+class _SpooledTextSink:
+    """Текст → (gzip) → SpooledTemporaryFile. Все методы вызываются из потока."""
+
+    def __init__(self, gzip_output: bool) -> None:
+        self.raw = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX, mode="w+b")
+        self._gz = gzip.GzipFile(fileobj=self.raw, mode="wb") if gzip_output else None
+        self.text = io.TextIOWrapper(self._gz or self.raw, encoding="utf-8", newline="")
+
+    def write_lines(self, lines: Sequence[str]) -> None:
+        self.text.writelines(lines)
+
+    def finish(self) -> IO[bytes]:
+        self.text.flush()
+        self.text.detach()  # не закрываем нижележащий файл
+        if self._gz is not None:
+            self._gz.close()  # дописывает хвост gzip, сам raw не закрывает
+        return self.raw
+
+    def close(self) -> None:
+        self.raw.close()
+
+
+class _CsvSink(_SpooledTextSink):
+    def __init__(self, gzip_output: bool) -> None:
+        super().__init__(gzip_output)
+        self._writer = csv.writer(self.text)
+
+    def write_rows(self, rows: Sequence[Sequence[Any]]) -> None:
+        self._writer.writerows(rows)
+
+
+def items_export_query(*criteria) -> Select:
+    """Только нужные колонки (без ORM-объектов), отсортировано по дате."""
+    return (
+        select(Item.user_id, Item.username, Item.note, Item.due_date)
+        .where(*criteria)
+        .order_by(Item.due_date.asc())
+    )
+
+
+def _write_item_rows(sink: _CsvSink, batch: Sequence[Any]) -> None:
+    sink.write_rows([
+        (user_id, username, note or "", fmt_dt_human(due))
+        for user_id, username, note, due in batch
+    ])
+
+
+async def export_items_csv(
+    query: Select, filename: str, gzip_output: bool | None = None,
+) -> tuple[SpooledInputFile, int]:
+    """
+    Экспорт записей из query (см. items_export_query) в CSV.
+    Возвращает (файл для answer_document, число строк). Файл нужно закрыть
+    после отправки: doc.close().
+    """
+    if gzip_output is None:
+        gzip_output = settings.EXPORT_GZIP
+    sink = await asyncio.to_thread(_CsvSink, gzip_output)
+    count = 0
+    try:
+        await asyncio.to_thread(sink.write_rows, [ITEMS_CSV_HEADER])
+        async with SessionLocal() as session:
+            result = await session.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for batch in result.partitions():
+                count += len(batch)
+                await asyncio.to_thread(_write_item_rows, sink, batch)
+        fp = await asyncio.to_thread(sink.finish)
+    except BaseException:
+        sink.close()
+        raise
+    if gzip_output:
+        filename += ".gz"
+    return SpooledInputFile(fp, filename=filename), count
+
+
+# ====== Выгрузка изменений (JSON Lines) ======
+#
+# Каждая строка — {"table", "op": "upsert", "row"} для изменённых записей
+# или {"table", "op": "delete", "id"} для удалённых (tombstones).
+# Курсор — граница выгрузки (UTC, ISO-формат): в неё попадает всё, что
+# изменено в (since, until]; следующую выгрузку запрашивают с until.
+# until фиксируется до первого запроса и отстаёт от текущего времени на
+# DELTA_SETTLE_SECONDS: updated_at выставляется до коммита, и запись, которая
+# ещё ждёт блокировку, закоммитится с меткой в прошлом — отставание не даёт
+# курсору её перескочить. Строка, изменённая повторно, может прийти дважды —
+# потребитель применяет строки как upsert, это безопасно.
+# Отметки об удалениях (tombstones) хранятся DELTA_KEEP_DAYS дней: курсор
+# старше этого — только полная выгрузка.
+
+DELTA_MODELS = (Item, RouterItem, Dealer, Payment)
+# Больше таймаута ожидания блокировки SQLite (5 с) с запасом
+DELTA_SETTLE_SECONDS = 10
+
+
+class DeltaCursorExpired(ValueError):
+    """Курсор старше срока хранения удалений: часть удалений уже не выгрузить."""
+
+# Колонки, которые не выгружаем наружу
+DELTA_EXCLUDED_COLUMNS: dict[str, set[str]] = {"dealers": {"bot_token"}}
+
+
+def parse_delta_cursor(text: str) -> datetime | None:
+    """Курсор из ISO-строки (как его выдаёт выгрузка). None — если формат неверный."""
+    try:
+        dt = datetime.fromisoformat((text or "").strip())
+    except ValueError:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def format_delta_cursor(dt: datetime) -> str:
+    return dt.replace(tzinfo=None).isoformat()
+
+
+def _json_value(name: str, value: Any) -> Any:
+    if isinstance(value, datetime):
+        if name == "due_date":
+            # Даты отключения хранятся в локальной TZ
+            return to_tz(value).isoformat()
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.isoformat()
+    return value
+
+
+def _write_delta_upserts(sink: _SpooledTextSink, table: str, batch: Sequence[Any]) -> None:
+    excluded = DELTA_EXCLUDED_COLUMNS.get(table, set())
+    lines = []
+    for row in batch:
+        data = {k: _json_value(k, v) for k, v in row._mapping.items() if k not in excluded}
+        lines.append(json.dumps({"table": table, "op": "upsert", "row": data}, ensure_ascii=False) + "\n")
+    sink.write_lines(lines)
+
+
+def _write_delta_deletes(sink: _SpooledTextSink, batch: Sequence[Any]) -> None:
+    sink.write_lines([
+        json.dumps({
+            "table": t.table_name, "op": "delete", "id": t.row_id,
+            "deleted_at": _json_value("deleted_at", t.deleted_at),
+        }) + "\n"
+        for t in batch
+    ])
+
+
+async def export_delta_jsonl(
+    since: datetime | None, gzip_output: bool | None = None,
+) -> tuple[SpooledInputFile, int, datetime]:
+    """
+    Изменения после курсора since (None — полная выгрузка без удалений).
+    Возвращает (файл, число строк, новый курсор). Файл нужно закрыть после отправки.
+    DeltaCursorExpired — если since старше срока хранения удалений.
+    """
+    if gzip_output is None:
+        gzip_output = settings.EXPORT_GZIP
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    if since is not None and settings.DELTA_KEEP_DAYS > 0 and since < now - timedelta(days=settings.DELTA_KEEP_DAYS):
+        raise DeltaCursorExpired(since)
+    until = now - timedelta(seconds=DELTA_SETTLE_SECONDS)
+    if since is not None and since >= until:
+        until = since
+    sink = await asyncio.to_thread(_SpooledTextSink, gzip_output)
+    count = 0
+    try:
+        async with SessionLocal() as session:
+            for model in DELTA_MODELS:
+                table = model.__table__
+                col = table.c.updated_at
+                q = select(table).order_by(col.asc())
+                if since is None:
+                    q = q.where(or_(col.is_(None), col <= until))
+                else:
+                    q = q.where(col > since, col <= until)
+                result = await session.stream(q.execution_options(yield_per=EXPORT_BATCH_SIZE))
+                async for batch in result.partitions():
+                    count += len(batch)
+                    await asyncio.to_thread(_write_delta_upserts, sink, table.name, batch)
+            if since is not None:
+                q = (
+                    select(Tombstone)
+                    .where(Tombstone.deleted_at > since, Tombstone.deleted_at <= until)
+                    .order_by(Tombstone.deleted_at.asc())
+                )
+                result = await session.stream_scalars(q.execution_options(yield_per=EXPORT_BATCH_SIZE))
+                async for batch in result.partitions():
+                    count += len(batch)
+                    await asyncio.to_thread(_write_delta_deletes, sink, batch)
+        fp = await asyncio.to_thread(sink.finish)
+    except BaseException:
+        sink.close()
+        raise
+    filename = "delta.jsonl.gz" if gzip_output else "delta.jsonl"
+    return SpooledInputFile(fp, filename=filename), count, until
+
+
+async def prune_tombstones(keep_days: int | None = None) -> int:
+    """Удалить отметки об удалениях старше keep_days (по умолчанию DELTA_KEEP_DAYS). Возвращает их число."""
+    if keep_days is None:
+        keep_days = settings.DELTA_KEEP_DAYS
+    if keep_days <= 0:
+        return 0
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=keep_days)
+    async with SessionLocal() as session:
+        result = await session.execute(delete(Tombstone).where(Tombstone.deleted_at < cutoff))
+        await session.commit()
+    return result.rowcount or 0
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import func, literal, select, union_all
+
+from app.db import SessionLocal, BalanceTxn, ChangeJournal, Item, MAIN_CODE, get_price, register_cache_reset
+from app.utils import get_active_timezone_name, now_tz
+
+# ====== Прогноз продлений и выручки ======
+#
+# Сколько клиентов дилеров истекает в ближайшие N дней (по дням) и сколько
+# из них, судя по истории, продлят. Доля продлений дилера за последние
+# HISTORY_DAYS дней = продления / (продления + клиенты, истёкшие за этот
+# период и так и не продлённые). Ожидаемая выручка = истекающие × доля × цена.
+# Цена одна на всех (get_price): отдельной цены дилера в базе нет.
+#
+# Истечения по дням и продления по дилерам — один запрос (UNION ALL двух
+# группировок, индексы по items.due_date и balance_txns.created_at). Результат
+# хранится в памяти, пока не изменится журнал изменений (change_journal пишут
+# триггеры на items, dealers, balance_txns), цена или текущий день.
+
+DEFAULT_DAYS = 14
+# Больше — гистограмма не влезает в одно сообщение
+MAX_DAYS = 31
+HISTORY_DAYS = 30
+BAR_WIDTH = 20
+# Сколько дилеров показывать в сводке (по убыванию ожидаемой выручки)
+TOP_DEALERS = 20
+
+
+@dataclass(frozen=True)
+class DealerForecast:
+    code: str
+    # Истекает по дням, начиная с Forecast.start
+    due: tuple[int, ...]
+    renewed: int
+    lapsed: int
+    rate: float
+
+    @property
+    def due_total(self) -> int:
+        return sum(self.due)
+
+    @property
+    def expected(self) -> float:
+        return self.due_total * self.rate
+
+
+@dataclass(frozen=True)
+class Forecast:
+    start: date
+    days: int
+    price: float
+    dealers: tuple[DealerForecast, ...]
+
+    @property
+    def due_total(self) -> int:
+        return sum(d.due_total for d in self.dealers)
+
+    @property
+    def expected(self) -> float:
+        return sum(d.expected for d in self.dealers)
+
+
+def build_forecast(
+    rows: Iterable[tuple[str, Optional[str], int]], start: date, days: int, price: float,
+) -> Forecast:
+    """
+    rows — строки запроса: (дилер, день «YYYY-MM-DD», истекает) для items и
+    (дилер, None, продлений) для balance_txns. Дни раньше start — истёкшие без продления.
+    """
+    due: dict[str, list[int]] = {}
+    lapsed: dict[str, int] = {}
+    renewed: dict[str, int] = {}
+    for code, day, n in rows:
+        if day is None:
+            renewed[code] = renewed.get(code, 0) + n
+            continue
+        offset = (date.fromisoformat(day) - start).days
+        if offset < 0:
+            lapsed[code] = lapsed.get(code, 0) + n
+        elif offset < days:
+            due.setdefault(code, [0] * days)[offset] += n
+
+    total_renewed, total_lapsed = sum(renewed.values()), sum(lapsed.values())
+    # Без своей истории — средняя доля по всем дилерам, без истории вообще — все продлят
+    default_rate = total_renewed / (total_renewed + total_lapsed) if total_renewed + total_lapsed else 1.0
+    dealers = []
+    for code in sorted(due):
+        r, l = renewed.get(code, 0), lapsed.get(code, 0)
+        dealers.append(DealerForecast(
+            code=code, due=tuple(due[code]), renewed=r, lapsed=l,
+            rate=r / (r + l) if r + l else default_rate,
+        ))
+    return Forecast(start=start, days=days, price=price, dealers=tuple(dealers))
+
+
+_cached: Optional[tuple[tuple, Forecast]] = None
+_generation = 0
+_lock = asyncio.Lock()
+
+
+@register_cache_reset
+def invalidate_forecast() -> None:
+    global _cached, _generation
+    _cached = None
+    _generation += 1
+
+
+async def _load(start: date, days: int, price: float) -> Forecast:
+    # due_date хранится в локальном времени без пояса, created_at — в UTC
+    since = datetime.combine(start - timedelta(days=HISTORY_DAYS), time.min)
+    until = datetime.combine(start + timedelta(days=days), time.min)
+    renew_since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=HISTORY_DAYS)
+    day = func.date(Item.due_date)
+    q = union_all(
+        select(Item.dealer, day, func.count())
+        .where(Item.due_date >= since, Item.due_date < until, Item.dealer != MAIN_CODE)
+        .group_by(Item.dealer, day),
+        select(BalanceTxn.dealer_code, literal(None), func.count())
+        .where(BalanceTxn.kind == "renewal", BalanceTxn.created_at >= renew_since)
+        .group_by(BalanceTxn.dealer_code),
+    )
+    async with SessionLocal() as session:
+        rows = (await session.execute(q)).all()
+    return build_forecast(rows, start, days, price)
+
+
+async def _journal_position() -> Optional[int]:
+    async with SessionLocal() as session:
+        return (await session.execute(select(func.max(ChangeJournal.id)))).scalar_one()
+
+
+async def get_forecast(days: int = DEFAULT_DAYS) -> Forecast:
+    """Прогноз на days дней начиная с сегодняшнего (в активном поясе)."""
+    global _cached
+    start = now_tz().date()
+    price = await get_price()
+    key = (await _journal_position(), price, days, start, get_active_timezone_name())
+    cached = _cached
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    async with _lock:
+        if _cached is not None and _cached[0] == key:
+            return _cached[1]
+        generation = _generation
+        fc = await _load(start, days, price)
+        if generation == _generation:
+            _cached = (key, fc)
+        return fc
+
+
+def _bar(value: float, top: float) -> str:
+    if top <= 0 or value <= 0:
+        return ""
+    return "█" * max(1, round(value / top * BAR_WIDTH))
+
+
+def forecast_text(fc: Forecast, titles: dict[str, str], dealer_code: Optional[str] = None) -> str:
+    """Гистограмма по дням (все дилеры или один) и, для всех, сводка по дилерам."""
+    dealers = [d for d in fc.dealers if dealer_code is None or d.code == dealer_code]
+    due_total = sum(d.due_total for d in dealers)
+    expected = sum(d.expected for d in dealers)
+    head = f"📈 Прогноз продлений на {fc.days} дн. (цена ${fc.price:g})"
+    if dealer_code is not None:
+        head += f"\nДилер: {titles.get(dealer_code, dealer_code)}"
+    if not due_total:
+        return head + "\n\nИстечений в этот период нет."
+    lines = [
+        head,
+        f"Истекает: {due_total}, ожидается продлений ~{expected:.0f} на ~${expected * fc.price:.0f}",
+        "",
+    ]
+    by_day = [sum(d.due[i] * d.rate for d in dealers) for i in range(fc.days)]
+    top = max(by_day)
+    for i, value in enumerate(by_day):
+        day = fc.start + timedelta(days=i)
+        lines.append(f"{day:%d.%m} {_bar(value, top):<{BAR_WIDTH}} {value:5.1f}  ${value * fc.price:.0f}")
+    if dealer_code is None:
+        lines.append("")
+        lines.append("По дилерам (истекает → продлят):")
+        ranked = sorted(dealers, key=lambda d: -d.expected)
+        for d in ranked[:TOP_DEALERS]:
+            lines.append(
+                f"- {titles.get(d.code, d.code)}: {d.due_total} → ~{d.expected:.0f} "
+                f"({d.rate:.0%}) ~${d.expected * fc.price:.0f}"
+            )
+        if len(ranked) > TOP_DEALERS:
+            lines.append(f"…и ещё {len(ranked) - TOP_DEALERS}")
+    else:
+        d = dealers[0]
+        lines.append("")
+        lines.append(f"Доля продлений за {HISTORY_DAYS} дн.: {d.rate:.0%} ({d.renewed} продлено, {d.lapsed} истекло)")
+    return "\n".join(lines)
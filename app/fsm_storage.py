@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert
+
+from app.config import settings
+from app.db import SessionLocal, FsmState, register_cache_reset, register_db_pause
+
+log = logging.getLogger(__name__)
+
+# ====== FSM-хранилище в SQLite ======
+#
+# Состояния мастеров (добавление, продление, заявки, восстановление бэкапа,
+# ввод оплаты...) хранятся в таблице fsm_states и переживают перезапуск.
+# - горячие ключи — в LRU-кэше в памяти (не больше FSM_CACHE_SIZE);
+# - изменения пишутся в БД пачкой раз в FSM_FLUSH_SECONDS (write-behind),
+#   изменённые, но ещё не записанные ключи из кэша не вытесняются;
+# - состояние, не трогавшееся дольше FSM_TTL_HOURS, считается брошенным
+#   и удаляется (и из кэша, и из БД).
+
+# Как часто чистить просроченные состояния в БД (секунды)
+PURGE_INTERVAL = 3600.0
+
+
+@dataclass
+class _Entry:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    touched: float = field(default_factory=time.time)
+
+    @property
+    def empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(
+        self,
+        cache_size: int = settings.FSM_CACHE_SIZE,
+        flush_seconds: float = settings.FSM_FLUSH_SECONDS,
+        ttl_hours: float = settings.FSM_TTL_HOURS,
+        key_builder: KeyBuilder | None = None,
+    ) -> None:
+        self.cache_size = cache_size
+        self.flush_seconds = flush_seconds
+        self.ttl = ttl_hours * 3600
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._cache: OrderedDict[str, _Entry] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._flusher: asyncio.Task | None = None
+        self._paused = False
+        self._last_purge = 0.0
+        register_cache_reset(self.reset_cache)
+        register_db_pause(self.pause_flush, self.resume_flush)
+
+    # ---- кэш ----
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl > 0 and now - entry.touched > self.ttl
+
+    def _evict(self) -> None:
+        """Вытеснить самые старые записи сверх лимита (кроме ещё не записанных)."""
+        if len(self._cache) <= self.cache_size:
+            return
+        for k in list(self._cache):
+            if len(self._cache) <= self.cache_size:
+                break
+            if k not in self._dirty:
+                del self._cache[k]
+
+    async def _load(self, key: str) -> _Entry:
+        entry = self._cache.get(key)
+        now = time.time()
+        if entry is None:
+            async with SessionLocal() as session:
+                row = await session.get(FsmState, key)
+            # Пока шёл запрос, ключ мог загрузить параллельный апдейт
+            entry = self._cache.get(key)
+            if entry is None:
+                if row is None:
+                    entry = _Entry(touched=now)
+                else:
+                    updated = row.updated_at.replace(tzinfo=timezone.utc).timestamp()
+                    entry = _Entry(state=row.state, data=json.loads(row.data or "{}"), touched=updated)
+                self._cache[key] = entry
+                self._evict()
+        else:
+            self._cache.move_to_end(key)
+        if self._expired(entry, now):
+            entry.state, entry.data = None, {}
+            self._mark_dirty(key, entry)
+        return entry
+
+    def _mark_dirty(self, key: str, entry: _Entry) -> None:
+        entry.touched = time.time()
+        self._dirty.add(key)
+        self._start_flusher()
+
+    def _start_flusher(self) -> None:
+        if self._paused:
+            return
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop(), name="fsm-flush")
+
+    async def _stop_flusher(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._flusher = None
+
+    async def pause_flush(self) -> None:
+        """Остановить фоновую запись (на время замены базы). Изменения копятся в памяти."""
+        self._paused = True
+        await self._stop_flusher()
+
+    def resume_flush(self) -> None:
+        """Продолжить фоновую запись: накопленное уйдёт в новую БД."""
+        self._paused = False
+        if self._dirty:
+            self._start_flusher()
+
+    def reset_cache(self) -> None:
+        """Сброс кэша (после замены базы). Незаписанные изменения остаются и уйдут в новую БД."""
+        for k in list(self._cache):
+            if k not in self._dirty:
+                del self._cache[k]
+
+    # ---- BaseStorage ----
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = self.key_builder.build(key)
+        entry = await self._load(k)
+        entry.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(k, entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(self.key_builder.build(key))).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise TypeError(f"Data must be a dict, not {type(data).__name__}")
+        k = self.key_builder.build(key)
+        entry = await self._load(k)
+        entry.data = data.copy()
+        self._mark_dirty(k, entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._load(self.key_builder.build(key))).data.copy()
+
+    async def close(self) -> None:
+        await self._stop_flusher()
+        await self.flush()
+
+    # ---- запись в БД ----
+
+    async def flush(self) -> int:
+        """Записать все изменённые ключи одной транзакцией. Возвращает их число."""
+        if not self._dirty:
+            return 0
+        keys, self._dirty = self._dirty, set()
+        upserts = []
+        removes = []
+        for k in keys:
+            entry = self._cache.get(k)
+            if entry is None or entry.empty:
+                removes.append(k)
+                continue
+            upserts.append({
+                "key": k,
+                "state": entry.state,
+                "data": json.dumps(entry.data, ensure_ascii=False, default=str),
+                "updated_at": datetime.fromtimestamp(entry.touched, timezone.utc).replace(tzinfo=None),
+            })
+        try:
+            async with SessionLocal() as session:
+                if upserts:
+                    stmt = insert(FsmState).values(upserts)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[FsmState.key],
+                        set_={"state": stmt.excluded.state, "data": stmt.excluded.data,
+                              "updated_at": stmt.excluded.updated_at},
+                    )
+                    await session.execute(stmt)
+                if removes:
+                    await session.execute(delete(FsmState).where(FsmState.key.in_(removes)))
+                await session.commit()
+        except BaseException:
+            # Не потеряли (в том числе при остановке записи): вернём ключи в очередь
+            self._dirty |= keys
+            raise
+        return len(keys)
+
+    async def purge_expired(self) -> None:
+        """Удалить брошенные состояния (старше TTL) из БД и кэша."""
+        if self.ttl <= 0:
+            return
+        now = time.time()
+        for k, entry in list(self._cache.items()):
+            if k not in self._dirty and self._expired(entry, now):
+                del self._cache[k]
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=self.ttl)
+        async with SessionLocal() as session:
+            await session.execute(delete(FsmState).where(FsmState.updated_at < cutoff))
+            await session.commit()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_purge >= PURGE_INTERVAL:
+                    self._last_purge = time.monotonic()
+                    await self.purge_expired()
+            except Exception:
+                log.exception("FSM storage flush failed")
+            if not self._dirty:
+                # Нечего писать — выходим; следующее изменение запустит цикл снова
+                return
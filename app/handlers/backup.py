@@ -1,31 +1,38 @@
 from __future__ import annotations
 
-import logging, os, zipfile, shutil
+import asyncio, logging, zipfile
 from pathlib import Path
 from datetime import datetime
 
 from aiogram import Router, Bot, F
 from aiogram.types import (
-    Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile,
+    Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile,
 )
 from aiogram.fsm.context import FSMContext
+from aiogram.exceptions import TelegramBadRequest
 
-from app.db import SessionLocal, engine
+from app.db import SessionLocal
 from app.config import settings
 from app.states import BackupStates
 from app.keyboards import main_menu_kb, confirm_kb
 from aiogram.filters import Command
 from app.utils import now_tz
+from app.tasks import runner, Job
+from app.backup import (
+    BACKUP_DIR, BACKUP_PREFIX, KIND_INCREMENTAL, create_backup, read_archive_meta, restore_backup,
+    load_manifest, remove_from_manifest, set_manifest_file_id,
+)
 
 log = logging.getLogger(__name__)
 
 router = Router()
 
-BACKUP_DIR = Path("./data/backups")
-
 # ====== Бэкап базы данных (только админ) ======
 
-BACKUP_DIR = Path("./data/backups")
+# Куда скачивается архив для восстановления
+RESTORE_TMP_ZIP = Path("./data/_restore_tmp.zip")
+# Таймаут скачивания архива (секунды): большие базы качаются дольше 30 с по умолчанию
+RESTORE_DOWNLOAD_TIMEOUT = 300
 
 
 def backup_menu_kb() -> InlineKeyboardMarkup:
@@ -50,88 +57,41 @@ async def backup_home_cb(cb: CallbackQuery, state: FSMContext) -> None:
     await cb.message.answer("💾 Бэкап базы данных\n\nВыберите действие:", reply_markup=backup_menu_kb())
 
 
-def _find_db_path() -> "Path | None":
-    """Найти файл БД: пробуем несколько вариантов пути."""
-    candidates = [
-        Path("/app/data/data.db"),       # абсолютный путь в Docker
-        Path("./data/data.db"),          # относительный (WORKDIR /app)
-        Path("data/data.db"),            # без ./
-    ]
-    # Также пробуем извлечь путь из DATABASE_URL
-    url = os.environ.get("DATABASE_URL", "")
-    if ":///" in url:
-        raw = url.split("///", 1)[1].split("?")[0]
-        candidates.insert(0, Path(raw))
-    for p in candidates:
-        if p.exists():
-            return p
-    return None
-
-
 @router.callback_query(F.data == "backup:create")
-async def backup_create(cb: CallbackQuery) -> None:
+async def backup_create(cb: CallbackQuery, bot: Bot) -> None:
     await cb.answer("Создаю бэкап…")
-    BACKUP_DIR.mkdir(parents=True, exist_ok=True)
-
     ts = now_tz().strftime("%Y%m%d_%H%M%S")
-    zip_name = f"xmplus_backup_{ts}.zip"
+    zip_name = f"{BACKUP_PREFIX}{ts}.zip"
     zip_path = BACKUP_DIR / zip_name
 
-    db_path = _find_db_path()
-    tz_path = Path("/app/.tz_override")
-
-    if not db_path:
-        await cb.message.answer(
-            "❌ Файл базы данных не найден!\n"
-            f"DATABASE_URL: {os.environ.get('DATABASE_URL', '(не задан)')}\n"
-            f"CWD: {Path.cwd()}",
-            reply_markup=backup_menu_kb(),
-        )
-        return
-
-    try:
-        # Сохраняем переменные окружения (.env)
-        env_keys = (
-            "BOT_TOKEN", "OWNER_CHAT_ID", "BOT_MODE", "DEALER_NAME",
-            "TIMEZONE", "CHECK_INTERVAL_MINUTES", "PRE_NOTIFY_HOURS",
-            "NOTIFY_EVERY_MINUTES", "MAX_NOTIFICATIONS", "DATABASE_URL",
-        )
-        env_lines = [f"{k}={os.environ[k]}" for k in env_keys if k in os.environ]
-        env_content = "\n".join(env_lines) + "\n"
-
-        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-            zf.write(db_path, "data/data.db")
-            zf.writestr(".env", env_content)
-            if tz_path.exists():
-                zf.write(tz_path, ".tz_override")
-
-        # Проверяем что data.db действительно попало в архив
-        with zipfile.ZipFile(zip_path, "r") as zf:
-            names = zf.namelist()
-        if "data/data.db" not in names:
-            await cb.message.answer(
-                f"❌ Ошибка: data/data.db не в архиве.\nСодержимое: {names}",
-                reply_markup=backup_menu_kb(),
-            )
-            return
+    async def job_body(job: Job) -> str:
+        await job.progress("Снимок базы…", force=True)
+        names = await create_backup(zip_path, progress=job.progress)
 
+        await job.progress("Отправляю архив…", force=True)
         size_kb = zip_path.stat().st_size / 1024
-        with open(zip_path, "rb") as f:
-            doc = BufferedInputFile(f.read(), filename=zip_name)
-        await cb.message.answer_document(
-            doc,
+        msg = await cb.message.answer_document(
+            FSInputFile(zip_path, filename=zip_name),
             caption=(
                 f"📦 Бэкап создан: {zip_name}\n"
                 f"Размер: {size_kb:.1f} KB\n"
                 f"Содержимое: {', '.join(names)}"
             ),
         )
+        if msg.document:
+            await job.run_in_thread(set_manifest_file_id, zip_name, msg.document.file_id)
         await cb.message.answer(
             "Бэкап сохранён на сервере и отправлен вам.",
             reply_markup=backup_menu_kb(),
         )
-    except Exception as e:
-        await cb.message.answer(f"❌ Ошибка создания бэкапа: {e}", reply_markup=backup_menu_kb())
+        return f"{zip_name}, {size_kb:.1f} KB"
+
+    await runner.start(bot, cb.message.chat.id, "Создание бэкапа", job_body, key="backup")
+
+
+def _zip_namelist(path: Path) -> list[str]:
+    with zipfile.ZipFile(path, "r") as zf:
+        return zf.namelist()
 
 
 @router.callback_query(F.data == "backup:restore")
@@ -159,25 +119,33 @@ async def backup_restore_got_file(message: Message, state: FSMContext, bot: Bot)
     await message.answer("⏳ Загружаю архив…")
 
     try:
-        file_obj = await bot.get_file(doc.file_id)
-        bio = await bot.download_file(file_obj.file_path)
-
-        tmp_zip = Path("./data/_restore_tmp.zip")
-        tmp_zip.write_bytes(bio.read())
-
-        with zipfile.ZipFile(tmp_zip, "r") as zf:
-            names = zf.namelist()
-
-        if "data/data.db" not in names:
+        # Скачиваем сразу в файл — без копии архива в памяти
+        tmp_zip = RESTORE_TMP_ZIP
+        await bot.download(doc, destination=tmp_zip, timeout=RESTORE_DOWNLOAD_TIMEOUT)
+
+        names = await asyncio.to_thread(_zip_namelist, tmp_zip)
+        try:
+            meta = await asyncio.to_thread(read_archive_meta, tmp_zip)
+        except ValueError as e:
             tmp_zip.unlink(missing_ok=True)
             await state.clear()
-            await message.answer(
-                "❌ Архив не содержит data/data.db — это не бэкап XMPLUS.",
-                reply_markup=backup_menu_kb(),
-            )
+            await message.answer(f"❌ {e}", reply_markup=backup_menu_kb())
             return
 
         contents = ", ".join(names)
+        if meta.get("kind") == KIND_INCREMENTAL:
+            if not (BACKUP_DIR / meta["base"]).exists():
+                tmp_zip.unlink(missing_ok=True)
+                await state.clear()
+                await message.answer(
+                    f"❌ Это инкрементальный бэкап, а его базовый полный бэкап {meta['base']} "
+                    "не найден на сервере. Восстановите сначала полный бэкап.",
+                    reply_markup=backup_menu_kb(),
+                )
+                return
+            contents = (
+                f"инкремент к {meta['base']}, изменений: {meta.get('rows', '?')}"
+            )
         await state.update_data(restore_zip=str(tmp_zip))
         await state.set_state(BackupStates.waiting_restore_confirm)
         await message.answer(
@@ -188,11 +156,11 @@ async def backup_restore_got_file(message: Message, state: FSMContext, bot: Bot)
             reply_markup=confirm_kb("cfb", show_edit=False),
         )
     except zipfile.BadZipFile:
-        Path("./data/_restore_tmp.zip").unlink(missing_ok=True)
+        RESTORE_TMP_ZIP.unlink(missing_ok=True)
         await state.clear()
         await message.answer("❌ Файл повреждён или не является ZIP.", reply_markup=backup_menu_kb())
     except Exception as e:
-        Path("./data/_restore_tmp.zip").unlink(missing_ok=True)
+        RESTORE_TMP_ZIP.unlink(missing_ok=True)
         await state.clear()
         await message.answer(f"❌ Ошибка: {e}", reply_markup=backup_menu_kb())
 
@@ -216,84 +184,67 @@ async def backup_restore_cancel(cb: CallbackQuery, state: FSMContext) -> None:
 
 
 @router.callback_query(F.data == "cfb:ok", BackupStates.waiting_restore_confirm)
-async def backup_restore_confirm(cb: CallbackQuery, state: FSMContext) -> None:
+async def backup_restore_confirm(cb: CallbackQuery, state: FSMContext, bot: Bot) -> None:
     await cb.answer()
     data = await state.get_data()
     tmp_zip_str = data.get("restore_zip", "")
     tmp_zip = Path(tmp_zip_str) if tmp_zip_str else None
+    await state.clear()
 
     if not tmp_zip or not tmp_zip.exists():
-        await state.clear()
         await cb.message.answer(
             "❌ Временный файл не найден. Начните заново.",
             reply_markup=backup_menu_kb(),
         )
         return
 
-    try:
-        db_path = Path("./data/data.db")
-
-        # Бэкап текущей базы перед заменой
-        if db_path.exists():
-            safe_ts = now_tz().strftime("%Y%m%d_%H%M%S")
-            shutil.copy2(db_path, Path(f"./data/data.db.pre_restore_{safe_ts}"))
-
-        # Закрываем соединения с БД
-        await engine.dispose()
-
-        # Распаковка
-        with zipfile.ZipFile(tmp_zip, "r") as zf:
-            if "data/data.db" in zf.namelist():
-                zf.extract("data/data.db", ".")
-            if ".tz_override" in zf.namelist():
-                tz_data = zf.read(".tz_override")
-                Path("/app/.tz_override").write_bytes(tz_data)
-
-        tmp_zip.unlink(missing_ok=True)
-        await state.clear()
+    async def job_body(job: Job) -> str:
+        try:
+            meta = await restore_backup(tmp_zip, progress=job.progress)
+        finally:
+            tmp_zip.unlink(missing_ok=True)
         await cb.message.answer(
-            "✅ База данных восстановлена!\n"
-            "Старая база сохранена как резерв.\n\n"
-            "⚠️ Перезапустите бота для полного применения:\n"
-            "<code>cd /opt/xmplus && docker compose restart</code>",
-            parse_mode="HTML",
+            "✅ База данных восстановлена — бот уже работает на восстановленных данных.\n"
+            "Старая база сохранена как резерв (data.db.pre_restore_…).",
+            reply_markup=backup_menu_kb(),
         )
-    except Exception as e:
-        if tmp_zip:
-            tmp_zip.unlink(missing_ok=True)
-        await state.clear()
-        await cb.message.answer(f"❌ Ошибка восстановления: {e}")
+        if meta.get("kind") == KIND_INCREMENTAL:
+            return f"{meta['base']} + изменений: {meta.get('replayed', 0)}"
+        return ""
+
+    await runner.start(bot, cb.message.chat.id, "Восстановление из бэкапа", job_body, key="backup")
 
 
 # --- Список бэкапов ---
 
+def _backup_list_kb(backups: dict[str, dict]) -> InlineKeyboardMarkup:
+    rows: list[list[InlineKeyboardButton]] = []
+    for name in sorted(backups, reverse=True):
+        size_kb = backups[name].get("size", 0) / 1024
+        ts = name[len(BACKUP_PREFIX):-len(".zip")]
+        label = f"{ts} ({size_kb:.0f} KB)"
+        icon = "🧩" if backups[name].get("kind") == KIND_INCREMENTAL else "📦"
+        rows.append([
+            InlineKeyboardButton(text=f"{icon} {label}", callback_data=f"backup:dl:{ts}"),
+            InlineKeyboardButton(text="🗑", callback_data=f"backup:rm:{ts}"),
+        ])
+    rows.append([InlineKeyboardButton(text="◀ Назад", callback_data="backup:home")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
 @router.callback_query(F.data == "backup:list")
 async def backup_list_show(cb: CallbackQuery) -> None:
     await cb.answer()
-    BACKUP_DIR.mkdir(parents=True, exist_ok=True)
-
-    files = sorted(BACKUP_DIR.glob("xmplus_backup_*.zip"), reverse=True)
-    if not files:
+    backups = await asyncio.to_thread(load_manifest)
+    if not backups:
         await cb.message.answer(
             "📋 Список бэкапов пуст.\nСоздайте первый бэкап.",
             reply_markup=backup_menu_kb(),
         )
         return
-
-    rows: list[list[InlineKeyboardButton]] = []
-    for f in files:
-        size_kb = f.stat().st_size / 1024
-        ts = f.stem.replace("xmplus_backup_", "")
-        label = f"{ts} ({size_kb:.0f} KB)"
-        rows.append([
-            InlineKeyboardButton(text=f"📦 {label}", callback_data=f"backup:dl:{ts}"),
-            InlineKeyboardButton(text="🗑", callback_data=f"backup:rm:{ts}"),
-        ])
-    rows.append([InlineKeyboardButton(text="◀ Назад", callback_data="backup:home")])
-
     await cb.message.answer(
-        f"📋 Бэкапов на сервере: {len(files)}",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=rows),
+        f"📋 Бэкапов на сервере: {len(backups)}",
+        reply_markup=_backup_list_kb(backups),
     )
 
 
@@ -301,27 +252,42 @@ async def backup_list_show(cb: CallbackQuery) -> None:
 async def backup_download(cb: CallbackQuery) -> None:
     await cb.answer()
     ts = cb.data.split(":", 2)[-1]
-    zip_name = f"xmplus_backup_{ts}.zip"
+    zip_name = f"{BACKUP_PREFIX}{ts}.zip"
     zip_path = BACKUP_DIR / zip_name
+    entry = (await asyncio.to_thread(load_manifest)).get(zip_name)
 
     if not zip_path.exists():
+        if entry is not None:
+            await asyncio.to_thread(remove_from_manifest, zip_name)
         await cb.message.answer("Файл не найден.", reply_markup=backup_menu_kb())
         return
 
+    size_kb = zip_path.stat().st_size / 1024
+    caption = f"📦 {zip_name} ({size_kb:.1f} KB)"
+    if entry and entry.get("sha256"):
+        caption += f"\nSHA-256: {entry['sha256'][:16]}…"
+    # Архив уже отправлялся — шлём по file_id, без повторной загрузки
+    file_id = entry.get("file_id") if entry else None
+    if file_id:
+        try:
+            await cb.message.answer_document(file_id, caption=caption)
+            return
+        except TelegramBadRequest as e:
+            log.info("Cached file_id for %s rejected (%s), uploading again", zip_name, e)
     try:
-        with open(zip_path, "rb") as f:
-            doc = BufferedInputFile(f.read(), filename=zip_name)
-        size_kb = zip_path.stat().st_size / 1024
-        await cb.message.answer_document(doc, caption=f"📦 {zip_name} ({size_kb:.1f} KB)")
+        msg = await cb.message.answer_document(FSInputFile(zip_path, filename=zip_name), caption=caption)
     except Exception as e:
         await cb.message.answer(f"❌ Ошибка: {e}", reply_markup=backup_menu_kb())
+        return
+    if msg.document:
+        await asyncio.to_thread(set_manifest_file_id, zip_name, msg.document.file_id)
 
 
 @router.callback_query(F.data.startswith("backup:rm:"))
 async def backup_delete_ask(cb: CallbackQuery) -> None:
     await cb.answer()
     ts = cb.data.split(":", 2)[-1]
-    zip_name = f"xmplus_backup_{ts}.zip"
+    zip_name = f"{BACKUP_PREFIX}{ts}.zip"
     kb = InlineKeyboardMarkup(inline_keyboard=[[
         InlineKeyboardButton(text="✅ Удалить", callback_data=f"backup:rmok:{ts}"),
         InlineKeyboardButton(text="❌ Отмена", callback_data="backup:list"),
@@ -333,7 +299,7 @@ async def backup_delete_ask(cb: CallbackQuery) -> None:
 async def backup_delete_exec(cb: CallbackQuery) -> None:
     await cb.answer()
     ts = cb.data.split(":", 2)[-1]
-    zip_name = f"xmplus_backup_{ts}.zip"
+    zip_name = f"{BACKUP_PREFIX}{ts}.zip"
     zip_path = BACKUP_DIR / zip_name
 
     if zip_path.exists():
@@ -341,26 +307,14 @@ async def backup_delete_exec(cb: CallbackQuery) -> None:
         await cb.message.answer(f"🗑 {zip_name} удалён.")
     else:
         await cb.message.answer("Файл уже удалён.")
+    await asyncio.to_thread(remove_from_manifest, zip_name)
 
     # Обновляем список
-    BACKUP_DIR.mkdir(parents=True, exist_ok=True)
-    files = sorted(BACKUP_DIR.glob("xmplus_backup_*.zip"), reverse=True)
-    if files:
-        rows: list[list[InlineKeyboardButton]] = []
-        for f in files:
-            size_kb = f.stat().st_size / 1024
-            ts2 = f.stem.replace("xmplus_backup_", "")
-            label = f"{ts2} ({size_kb:.0f} KB)"
-            rows.append([
-                InlineKeyboardButton(text=f"📦 {label}", callback_data=f"backup:dl:{ts2}"),
-                InlineKeyboardButton(text="🗑", callback_data=f"backup:rm:{ts2}"),
-            ])
-        rows.append([InlineKeyboardButton(text="◀ Назад", callback_data="backup:home")])
+    backups = await asyncio.to_thread(load_manifest)
+    if backups:
         await cb.message.answer(
-            f"📋 Бэкапов на сервере: {len(files)}",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=rows),
+            f"📋 Бэкапов на сервере: {len(backups)}",
+            reply_markup=_backup_list_kb(backups),
         )
     else:
         await cb.message.answer("📋 Список бэкапов пуст.", reply_markup=backup_menu_kb())
-
-
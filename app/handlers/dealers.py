@@ -9,15 +9,20 @@ from aiogram.types import (
     Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile,
 )
 from aiogram.fsm.context import FSMContext
-from sqlalchemy import select, delete, update
+from sqlalchemy import select, update, func
 
-from app.db import SessionLocal, Item, Dealer, MAIN_CODE, list_dealers, get_dealer
+from app.db import SessionLocal, Item, Dealer, MAIN_CODE, delete_dealer, list_dealers, get_dealer
 from app.config import settings
 from app.states import DealerAssignStates, AddDealerStates, MsgDealerStates, BroadcastStates
 from app.keyboards import main_menu_kb
 from app.utils import fmt_dt_human, now_tz, to_tz
 from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
-from app.bot import split_text_chunks, send_pre_chunk, make_table_lines_without_id, build_items_csv_bytes
+from app.bot import send_table, make_table_lines_without_id, reset_role_cache
+from app.export import export_items_csv, items_export_query
+from app.outbound import bulk_lane
+from app.tasks import runner, Job
+from app.multibot import registry, send_to_dealer
+from app.webhook import make_session
 
 log = logging.getLogger(__name__)
 
@@ -110,15 +115,12 @@ async def dealers_view(cb: CallbackQuery) -> None:
         return
     header, lines = make_table_lines_without_id(items)
     header = f"{title}:\n" + "-" * 40 + "\n" + header
-    chunks = split_text_chunks(header, lines)
-    for i, ch in enumerate(chunks, 1):
-        suffix = f"\n(стр. {i}/{len(chunks)})" if len(chunks) > 1 else ""
-        await send_pre_chunk(cb.message, ch + suffix)
+    await send_table(cb.message, header, lines, f"dealer_{code}.txt")
     await cb.message.answer(f"Всего записей ({title}): {len(items)}", reply_markup=await dealers_menu_kb())
 
 @router.callback_query(F.data.startswith("dealers:export:"))
-async def dealers_export(cb: CallbackQuery) -> None:
-    await cb.answer()
+async def dealers_export(cb: CallbackQuery, bot: Bot) -> None:
+    await cb.answer("Готовлю экспорт…")
     code = cb.data.split(":")[-1]
     if code == MAIN_CODE:
         title = MAIN_TITLE
@@ -128,18 +130,24 @@ async def dealers_export(cb: CallbackQuery) -> None:
             await cb.message.answer("Неизвестный дилер (возможно, удалён).")
             return
         title = d.title
-    async with SessionLocal() as session:
-        q = select(Item).where(Item.dealer == code).order_by(Item.due_date.asc())
-        items = (await session.execute(q)).scalars().all()
-    data = await build_items_csv_bytes(items)
-    fname = f"export_{code}.csv"
-    await cb.message.answer_document(
-        BufferedInputFile(data, filename=fname),
-        caption=f"Экспорт {title}: {len(items)} записей"
-    )
+
+    async def job_body(job: Job) -> str:
+        await job.progress("Выгружаю записи…", force=True)
+        doc, count = await export_items_csv(items_export_query(Item.dealer == code), f"export_{code}.csv")
+        try:
+            await job.progress(f"Отправляю файл ({count} записей)…", force=True)
+            await cb.message.answer_document(doc, caption=f"Экспорт {title}: {count} записей")
+        finally:
+            doc.close()
+        return f"Записей: {count}"
+
+    await runner.start(bot, cb.message.chat.id, f"Экспорт CSV: {title}", job_body, key=f"export:{code}")
 
 # ===== Массовое назначение по списку USERID → дилер (только админ) =====
 
+# Сколько USERID обновлять одним UPDATE (лимит параметров SQLite — 999)
+ASSIGN_BATCH_SIZE = 500
+
 @router.callback_query(F.data == "dealers:assign:start")
 async def dealers_assign_start(cb: CallbackQuery, state: FSMContext) -> None:
     await cb.answer()
@@ -186,7 +194,7 @@ async def dealers_assign_ids(message: Message, state: FSMContext) -> None:
     )
 
 @router.callback_query(F.data.startswith("dealers:assign:pick:"))
-async def dealers_assign_pick(cb: CallbackQuery, state: FSMContext) -> None:
+async def dealers_assign_pick(cb: CallbackQuery, state: FSMContext, bot: Bot) -> None:
     await cb.answer()
     code = cb.data.split(":")[-1]
     if code == MAIN_CODE:
@@ -202,26 +210,38 @@ async def dealers_assign_pick(cb: CallbackQuery, state: FSMContext) -> None:
     if not ids:
         await cb.message.answer("Список USERID не найден в состоянии. Начните заново: /dealers → Назначить по списку.")
         return
+    await state.clear()
 
-    async with SessionLocal() as session:
-        q = select(Item).where(Item.user_id.in_(ids))
-        items = (await session.execute(q)).scalars().all()
-        found = len(items)
+    async def job_body(job: Job) -> str:
+        found = 0
         changed = 0
-        for it in items:
-            if it.dealer != code:
-                it.dealer = code
-                changed += 1
-        await session.commit()
+        for start in range(0, len(ids), ASSIGN_BATCH_SIZE):
+            batch = ids[start:start + ASSIGN_BATCH_SIZE]
+            # Транзакция на пачку: блокировку записи не держим, пока редактируется
+            # сообщение о прогрессе (сеть, ожидание в шлюзе исходящих)
+            async with SessionLocal() as session:
+                found += (await session.execute(
+                    select(func.count(Item.id)).where(Item.user_id.in_(batch))
+                )).scalar_one()
+                res = await session.execute(
+                    update(Item)
+                    .where(Item.user_id.in_(batch), Item.dealer != code)
+                    .values(dealer=code)
+                )
+                changed += res.rowcount or 0
+                await session.commit()
+            await job.progress(f"Обработано USERID: {start + len(batch)} из {len(ids)}")
 
-    await state.clear()
-    await cb.message.answer(
-        f"Готово. Передано дилеру: {title}\n"
-        f"- USERID в запросе: {len(ids)}\n"
-        f"- Найдено записей: {found}\n"
-        f"- Обновлено (изменён dealer): {changed}\n",
-        reply_markup=await dealers_menu_kb(),
-    )
+        await cb.message.answer(
+            f"Готово. Передано дилеру: {title}\n"
+            f"- USERID в запросе: {len(ids)}\n"
+            f"- Найдено записей: {found}\n"
+            f"- Обновлено (изменён dealer): {changed}\n",
+            reply_markup=await dealers_menu_kb(),
+        )
+        return f"Найдено: {found}, обновлено: {changed}"
+
+    await runner.start(bot, cb.message.chat.id, f"Назначение → {title}", job_body, key="dealers:assign")
 
 
 # ===== Добавление / изменение дилера (только админ) =====
@@ -300,6 +320,7 @@ async def dealer_add_chat_id(message: Message, state: FSMContext) -> None:
             session.add(Dealer(code=code, title=title, chat_id=chat_id))
             action = "добавлен"
         await session.commit()
+    reset_role_cache()
     await state.clear()
     cid_txt = str(chat_id) if chat_id is not None else "не задан"
     await message.answer(
@@ -355,18 +376,12 @@ async def dealer_del_cancel(cb: CallbackQuery) -> None:
 async def dealer_del_confirm(cb: CallbackQuery) -> None:
     await cb.answer()
     code = cb.data.split(":")[-1]
-    async with SessionLocal() as session:
-        d = (await session.execute(select(Dealer).where(Dealer.code == code))).scalars().first()
-        if not d:
-            await cb.message.answer("Дилер не найден (возможно, уже удалён).", reply_markup=await dealers_menu_kb())
-            return
-        title = d.title
-        res = await session.execute(
-            update(Item).where(Item.dealer == code).values(dealer=MAIN_CODE)
-        )
-        moved = res.rowcount or 0
-        await session.execute(delete(Dealer).where(Dealer.code == code))
-        await session.commit()
+    deleted = await delete_dealer(code)
+    if deleted is None:
+        await cb.message.answer("Дилер не найден (возможно, уже удалён).", reply_markup=await dealers_menu_kb())
+        return
+    title, moved = deleted
+    reset_role_cache()
     await cb.message.answer(
         f"🗑️ Дилер «{title}» удалён.\nПеренесено в «Без дилера»: {moved} записей.",
         reply_markup=await dealers_menu_kb(),
@@ -427,7 +442,7 @@ async def dealer_msg_send(message: Message, state: FSMContext, bot: Bot) -> None
         return
     body = f"📨 Сообщение от администратора:\n\n{text}"
     try:
-        await bot.send_message(d.chat_id, body)
+        await send_to_dealer(d.code, bot, d.chat_id, body)
     except (TelegramForbiddenError, TelegramBadRequest):
         await message.answer(
             f"❌ Не удалось отправить дилеру «{d.title}».\n"
@@ -474,19 +489,86 @@ async def dealer_broadcast_send(message: Message, state: FSMContext, bot: Bot) -
         await message.answer("Нет дилеров с заданным Telegram ID.", reply_markup=await dealers_menu_kb())
         return
     body = f"📢 Сообщение от администратора:\n\n{text}"
-    ok = 0
-    failed: list[str] = []
-    for d in targets:
+
+    async def job_body(job: Job) -> str:
+        ok = 0
+        failed: list[str] = []
+        with bulk_lane():
+            for n, d in enumerate(targets, 1):
+                try:
+                    await send_to_dealer(d.code, bot, d.chat_id, body)
+                    ok += 1
+                except Exception:
+                    failed.append(d.title)
+                await job.progress(f"Отправлено: {n} из {len(targets)}")
+        report = f"📢 Рассылка завершена.\n✅ Доставлено: {ok} из {len(targets)}"
+        if failed:
+            report += (
+                f"\n❌ Не доставлено ({len(failed)}): {', '.join(failed)}\n"
+                "Эти дилеры, вероятно, не нажимали «Запустить» (Start) у бота-админа."
+            )
+        await message.answer(report, reply_markup=await dealers_menu_kb())
+        return f"Доставлено: {ok} из {len(targets)}"
+
+    await runner.start(bot, message.chat.id, "Рассылка дилерам", job_body, key="dealers:broadcast")
+
+
+# ===== Собственный бот дилера (только админ) =====
+
+@router.message(Command("bottoken"))
+async def dealer_bot_token(message: Message) -> None:
+    """
+    /bottoken — у кого из дилеров есть свой бот;
+    /bottoken <код> <токен> — подключить бота дилеру; /bottoken <код> - — отключить.
+    Боты дилеров обслуживает этот же процесс, изменения — после перезапуска.
+    """
+    parts = (message.text or "").split()
+    if len(parts) == 1:
+        lines = ["🤖 Боты дилеров:"]
+        for d in await list_dealers():
+            if d.bot_token:
+                status = "работает" if d.code in registry.codes() else "после перезапуска"
+                lines.append(f"• {d.title} ({d.code}): подключён, {status}")
+            else:
+                lines.append(f"• {d.title} ({d.code}): нет")
+        lines.append("\nПодключить: /bottoken <код> <токен>\nОтключить: /bottoken <код> -")
+        await message.answer("\n".join(lines))
+        return
+    if len(parts) != 3:
+        await message.answer("Формат: /bottoken <код> <токен> или /bottoken <код> -")
+        return
+    code, token = parts[1].lower(), parts[2]
+    d = await get_dealer(code)
+    if not d:
+        await message.answer(f"Дилер с кодом «{code}» не найден.")
+        return
+    # Токен — секрет: не оставляем его в истории чата
+    try:
+        await message.delete()
+    except TelegramBadRequest:
+        pass
+    if token in ("-", "—"):
+        token = None
+        name = None
+    else:
         try:
-            await bot.send_message(d.chat_id, body)
-            ok += 1
+            probe = Bot(token=token, session=make_session())
         except Exception:
-            failed.append(d.title)
-    report = f"📢 Рассылка завершена.\n✅ Доставлено: {ok} из {len(targets)}"
-    if failed:
-        report += (
-            f"\n❌ Не доставлено ({len(failed)}): {', '.join(failed)}\n"
-            "Эти дилеры, вероятно, не нажимали «Запустить» (Start) у бота-админа."
-        )
-    await message.answer(report, reply_markup=await dealers_menu_kb())
-
+            await message.answer("❌ Неверный формат токена.")
+            return
+        try:
+            me = await probe.get_me()
+        except Exception as e:
+            await message.answer(f"❌ Токен не подошёл: {e}")
+            return
+        finally:
+            await probe.session.close()
+        name = me.username
+    async with SessionLocal() as session:
+        await session.execute(update(Dealer).where(Dealer.code == code).values(bot_token=token))
+        await session.commit()
+    if name:
+        text = f"✅ Дилеру «{d.title}» подключён бот @{name}."
+    else:
+        text = f"✅ Бот дилера «{d.title}» отключён."
+    await message.answer(text + "\nИзменение вступит в силу после перезапуска бота.")
@@ -5,22 +5,29 @@ from datetime import datetime
 
 from aiogram import Router, Bot, F
 from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select, delete, update
 
 from app.db import (
     SessionLocal, Item, Dealer, BalanceTxn,
     PaymentMethod, PaymentVariant, Payment,
-    get_price, set_price, apply_balance_change,
+    get_price, set_price, apply_balance_change, resolve_payment, payment_method_full,
 )
 from app.config import settings
 from app.states import BalanceStates, PayAdminStates, AdminKeyToDealerStates
 from app.keyboards import main_menu_kb
 from app.utils import fmt_dt_human, now_tz, to_tz, parse_amount
 from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
-from app.bot import _notify_fail
-from app.db import list_dealers, get_dealer, list_payment_methods, get_payment_method, list_payment_variants, get_payment_variant
+from app.bot import _notify_fail, send_pre_chunk
+from app.multibot import send_to_dealer
+from app.db import list_dealers, get_dealer
+from app.catalog import (
+    CatalogMethod, CatalogVariant, invalidate_catalog,
+    list_payment_methods, get_payment_method, get_payment_variant,
+)
+from app.forecast import DEFAULT_DAYS, MAX_DAYS, get_forecast, forecast_text
+from app.statements import get_statements, parse_month, previous_month, statement_text, statements_csv
 from app.handlers.dealers import dealers_menu_kb
 
 log = logging.getLogger(__name__)
@@ -68,6 +75,78 @@ async def on_balance(message: Message, state: FSMContext) -> None:
     await message.answer(await balance_overview_text(), reply_markup=balance_menu_kb())
 
 
+@router.message(Command("statement"))
+async def on_statement(message: Message, state: FSMContext) -> None:
+    """
+    Выписки за месяц: /statement [ГГГГ-ММ] [код дилера]. Без месяца — за прошлый.
+    С кодом — текстом, без кода — CSV по всем дилерам.
+    """
+    await state.clear()
+    args = (message.text or "").split()[1:]
+    month = previous_month(now_tz().date())
+    if args and args[0][:4].isdigit():
+        month = parse_month(args.pop(0))
+    if month is None or len(args) > 1:
+        await message.answer("Формат: /statement [2025-01] [код дилера]")
+        return
+    if args:
+        d = await get_dealer(args[0])
+        if not d:
+            await message.answer("Дилер не найден.")
+            return
+        st = (await get_statements(month, d.code)).get(d.code)
+        await message.answer(statement_text(st, d.title) if st else "Выписка недоступна.")
+        return
+
+    titles = {d.code: d.title for d in await list_dealers()}
+    statements = sorted(
+        (st for st in (await get_statements(month)).values() if not st.is_empty),
+        key=lambda st: titles.get(st.dealer_code, st.dealer_code),
+    )
+    if not statements:
+        await message.answer(f"За {month} операций по дилерам нет.")
+        return
+    renewals = sum(st.renewals.count for st in statements)
+    charged = sum(st.renewals.amount for st in statements)
+    orders = sum(st.orders.count for st in statements)
+    ordered = sum(st.orders.amount for st in statements)
+    paid = -sum(st.payments_total for st in statements)
+    closing = sum(st.closing for st in statements)
+    await message.answer_document(
+        BufferedInputFile(statements_csv(statements, titles), filename=f"statements_{month}.csv"),
+        caption=(
+            f"🧾 Выписки за {month}: дилеров {len(statements)}\n"
+            f"Продлений: {renewals} на ${charged:g}\n"
+            f"Заказов ключей: {orders} на ${ordered:g}\n"
+            f"Оплачено: ${paid:g}\n"
+            f"Долг на конец месяца: ${closing:g}"
+        ),
+    )
+
+
+@router.message(Command("forecast"))
+async def on_forecast(message: Message, state: FSMContext) -> None:
+    """Прогноз продлений: /forecast [дней] [код дилера]."""
+    await state.clear()
+    args = (message.text or "").split()[1:]
+    days = DEFAULT_DAYS
+    if args and args[0].isdigit():
+        days = int(args.pop(0))
+    if not 1 <= days <= MAX_DAYS or len(args) > 1:
+        await message.answer(f"Формат: /forecast [дней, до {MAX_DAYS}] [код дилера]")
+        return
+    code = None
+    if args:
+        d = await get_dealer(args[0])
+        if not d:
+            await message.answer("Дилер не найден.")
+            return
+        code = d.code
+    fc = await get_forecast(days)
+    titles = {d.code: d.title for d in await list_dealers()}
+    await send_pre_chunk(message, forecast_text(fc, titles, code))
+
+
 @router.callback_query(F.data == "bal:add:start")
 async def bal_add_start(cb: CallbackQuery) -> None:
     await cb.answer()
@@ -152,7 +231,7 @@ async def bal_comment(message: Message, state: FSMContext, bot: Bot) -> None:
             dealer_text += f"Комментарий: {comment}\n"
         dealer_text += f"Ваш долг: ${new_balance:g}"
         try:
-            await bot.send_message(d.chat_id, dealer_text)
+            await send_to_dealer(d.code, bot, d.chat_id, dealer_text)
         except Exception as e:
             await _notify_fail(bot, f"дилер {d.title}", e)
     await message.answer(
@@ -196,9 +275,8 @@ async def pay_admin_text() -> str:
     if methods:
         for m in methods:
             st = "вкл" if m.active else "выкл"
-            variants = await list_payment_variants(m.id)
-            v_active = sum(1 for v in variants if v.active)
-            lines.append(f"- {m.name} ({st}, видов: {len(variants)}, активных: {v_active})")
+            v_active = sum(1 for v in m.variants if v.active)
+            lines.append(f"- {m.name} ({st}, видов: {len(m.variants)}, активных: {v_active})")
     else:
         lines.append("- методов нет")
     lines.append("")
@@ -259,6 +337,7 @@ async def pm_toggle(cb: CallbackQuery) -> None:
         new_state = m.active
         name = m.name
         await session.commit()
+    invalidate_catalog()
     await cb.message.answer(
         f"Метод «{name}»: {'включён' if new_state else 'выключен'}.",
         reply_markup=await pay_admin_kb(),
@@ -307,6 +386,7 @@ async def pm_req_save(message: Message, state: FSMContext) -> None:
         m.requisites = text[:1024]
         name = m.name
         await session.commit()
+    invalidate_catalog()
     await message.answer(f"✅ Реквизиты метода «{name}» обновлены.")
     await message.answer(await pay_admin_text(), reply_markup=await pay_admin_kb())
 
@@ -337,6 +417,7 @@ async def pm_add_save(message: Message, state: FSMContext) -> None:
             return
         session.add(PaymentMethod(name=name, requisites="", active=True))
         await session.commit()
+    invalidate_catalog()
     await message.answer(
         f"✅ Метод «{name}» добавлен. Не забудьте задать ему реквизиты.",
     )
@@ -350,30 +431,25 @@ async def pay_confirm(cb: CallbackQuery, bot: Bot) -> None:
         pay_id = int(cb.data.split(":")[-1])
     except Exception:
         return
-    async with SessionLocal() as session:
-        pay = await session.get(Payment, pay_id)
-        if not pay:
-            await cb.message.answer("Заявка на оплату не найдена.")
-            return
-        if pay.status != "pending":
-            await cb.message.answer(
-                f"Заявка уже обработана (статус: {pay.status}).",
-            )
-            return
-        pay.status = "confirmed"
-        dealer_code = pay.dealer_code
-        method = pay.method
-        variant = pay.variant
-        amount = pay.amount
-        await session.commit()
-    method_full = f"{method} → {variant}" if variant else method
-    new_balance = await apply_balance_change(dealer_code, -amount, "payment", f"Оплата: {method_full}")
-    d = await get_dealer(dealer_code)
+    # Статус и списание долга — одной транзакцией; повторное нажатие ничего не меняет
+    pay, d, changed = await resolve_payment(pay_id, "confirmed")
+    if not pay:
+        await cb.message.answer("Заявка на оплату не найдена.")
+        return
+    if not changed:
+        await cb.message.answer(
+            f"Заявка уже обработана (статус: {pay.status}).",
+        )
+        return
+    dealer_code = pay.dealer_code
+    amount = pay.amount
+    method_full = payment_method_full(pay)
+    new_balance = d.balance if d else None
     if d and d.chat_id is not None:
         bal_txt = f"\nВаш долг: ${new_balance:g}" if new_balance is not None else ""
         try:
-            await bot.send_message(
-                d.chat_id,
+            await send_to_dealer(
+                d.code, bot, d.chat_id,
                 f"✅ Оплата подтверждена.\nМетод: {method_full}\nСумма: ${amount:g}{bal_txt}",
             )
         except Exception as e:
@@ -394,28 +470,22 @@ async def pay_reject(cb: CallbackQuery, bot: Bot) -> None:
         pay_id = int(cb.data.split(":")[-1])
     except Exception:
         return
-    async with SessionLocal() as session:
-        pay = await session.get(Payment, pay_id)
-        if not pay:
-            await cb.message.answer("Заявка на оплату не найдена.")
-            return
-        if pay.status != "pending":
-            await cb.message.answer(
-                f"Заявка уже обработана (статус: {pay.status}).",
-            )
-            return
-        pay.status = "rejected"
-        dealer_code = pay.dealer_code
-        method = pay.method
-        variant = pay.variant
-        amount = pay.amount
-        await session.commit()
-    method_full = f"{method} → {variant}" if variant else method
-    d = await get_dealer(dealer_code)
+    pay, d, changed = await resolve_payment(pay_id, "rejected")
+    if not pay:
+        await cb.message.answer("Заявка на оплату не найдена.")
+        return
+    if not changed:
+        await cb.message.answer(
+            f"Заявка уже обработана (статус: {pay.status}).",
+        )
+        return
+    dealer_code = pay.dealer_code
+    amount = pay.amount
+    method_full = payment_method_full(pay)
     if d and d.chat_id is not None:
         try:
-            await bot.send_message(
-                d.chat_id,
+            await send_to_dealer(
+                d.code, bot, d.chat_id,
                 f"❌ Оплата не подтверждена.\nМетод: {method_full}, сумма: ${amount:g}.\n"
                 "Свяжитесь с администратором.",
             )
@@ -433,8 +503,8 @@ async def pay_reject(cb: CallbackQuery, bot: Bot) -> None:
 
 
 
-async def _method_card(m: PaymentMethod) -> tuple[str, InlineKeyboardMarkup]:
-    variants = await list_payment_variants(m.id)
+async def _method_card(m: CatalogMethod) -> tuple[str, InlineKeyboardMarkup]:
+    variants = m.variants
     lines = [
         f"💳 Метод: {m.name}",
         f"Статус: {'включён' if m.active else 'выключен'}",
@@ -464,7 +534,7 @@ async def _method_card(m: PaymentMethod) -> tuple[str, InlineKeyboardMarkup]:
     return "\n".join(lines), InlineKeyboardMarkup(inline_keyboard=rows)
 
 
-async def _variant_card(v: PaymentVariant, m: PaymentMethod) -> tuple[str, InlineKeyboardMarkup]:
+async def _variant_card(v: CatalogVariant, m: CatalogMethod) -> tuple[str, InlineKeyboardMarkup]:
     req = (v.requisites or "").strip() or "(не заданы)"
     text = (
         f"💳 {m.name} → {v.name}\n"
@@ -532,6 +602,7 @@ async def pm_rename_save(message: Message, state: FSMContext) -> None:
             return
         m.name = name
         await session.commit()
+    invalidate_catalog()
     await state.clear()
     await message.answer(f"✅ Метод переименован: {name}")
     m2 = await get_payment_method(int(pm_id))
@@ -595,6 +666,7 @@ async def pm_vadd_req_save(message: Message, state: FSMContext) -> None:
         v = PaymentVariant(method_id=int(pm_id), name=name, requisites=req, active=True)
         session.add(v)
         await session.commit()
+    invalidate_catalog()
     await message.answer(f"✅ Вид «{name}» добавлен.")
     m2 = await get_payment_method(int(pm_id))
     if m2:
@@ -638,6 +710,7 @@ async def pv_toggle(cb: CallbackQuery) -> None:
         v.active = not v.active
         method_id = v.method_id
         await session.commit()
+    invalidate_catalog()
     v2 = await get_payment_variant(v_id)
     m = await get_payment_method(method_id)
     if v2 and m:
@@ -688,6 +761,7 @@ async def pv_req_save(message: Message, state: FSMContext) -> None:
         v.requisites = text_in[:1024]
         method_id = v.method_id
         await session.commit()
+    invalidate_catalog()
     await message.answer("✅ Реквизиты обновлены.")
     v2 = await get_payment_variant(int(v_id))
     m = await get_payment_method(method_id)
@@ -735,6 +809,7 @@ async def pv_rename_save(message: Message, state: FSMContext) -> None:
         v.name = name
         method_id = v.method_id
         await session.commit()
+    invalidate_catalog()
     await message.answer(f"✅ Вид переименован: {name}")
     v2 = await get_payment_variant(int(v_id))
     m = await get_payment_method(method_id)
@@ -833,7 +908,7 @@ async def dealer_key_send(message: Message, state: FSMContext, bot: Bot) -> None
         f"<pre>{safe_code}</pre>"
     )
     try:
-        await bot.send_message(d.chat_id, body, parse_mode="HTML")
+        await send_to_dealer(d.code, bot, d.chat_id, body, parse_mode="HTML")
     except (TelegramForbiddenError, TelegramBadRequest):
         await message.answer(
             f"❌ Не удалось отправить дилеру «{d.title}». "
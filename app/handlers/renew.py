@@ -15,6 +15,7 @@ from app.states import RenewStates, DeleteStates
 from app.keyboards import confirm_kb, choose_by_due_kb, main_menu_kb
 from app.utils import parse_datetime_human, fmt_dt_human, now_tz, to_tz, tz_offset_str
 from app.bot import _notify_fail
+from app.multibot import send_to_dealer
 
 
 log = logging.getLogger(__name__)
@@ -216,8 +217,8 @@ async def renew_confirm(cb: CallbackQuery, state: FSMContext, bot: Bot) -> None:
             if new_balance is not None:
                 charge_line = f"\n\nНачислено: ${price:g}\nВаш долг: ${new_balance:g}"
             try:
-                await bot.send_message(
-                    d.chat_id,
+                await send_to_dealer(
+                    d.code, bot, d.chat_id,
                     "🔄 Клиент продлён\n\n"
                     f"USERID: {item_user_id}\n"
                     f"USERNAME: {item_username}\n"
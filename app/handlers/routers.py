@@ -14,7 +14,7 @@ from app.config import settings
 from app.states import RouterAddStates, RouterEditStates, RouterRenewStates, RouterDeleteStates
 from app.keyboards import main_menu_kb
 from app.utils import parse_datetime_human, fmt_dt_human, now_tz, to_tz, get_active_timezone_name
-from app.bot import _trunc, split_text_chunks, send_pre_chunk
+from app.bot import _trunc, send_table
 from app.handlers.renew import add_months
 
 log = logging.getLogger(__name__)
@@ -191,9 +191,10 @@ async def rt_list(cb: CallbackQuery) -> None:
         await cb.message.answer("📡 Список роутеров пуст.", reply_markup=router_menu_kb())
         return
     header, rows = _rt_table_lines(items)
-    chunks = split_text_chunks(f"📡 Роутеры ({len(items)}):\n{header}\n{'─' * len(header)}", rows)
-    for ch in chunks:
-        await send_pre_chunk(cb.message, ch)
+    await send_table(
+        cb.message, f"📡 Роутеры ({len(items)}):\n{header}\n{'─' * len(header)}", rows,
+        "routers.txt", numbered=False,
+    )
     await cb.message.answer(f"Всего: {len(items)}", reply_markup=router_menu_kb())
 
 
@@ -212,11 +213,10 @@ async def rt_disabled(cb: CallbackQuery) -> None:
         await cb.message.answer("📡 Отключённых роутеров нет.", reply_markup=router_menu_kb())
         return
     header, rows = _rt_table_lines(expired)
-    chunks = split_text_chunks(
-        f"⛔ Отключённые роутеры ({len(expired)}):\n{header}\n{'─' * len(header)}", rows
+    await send_table(
+        cb.message, f"⛔ Отключённые роутеры ({len(expired)}):\n{header}\n{'─' * len(header)}", rows,
+        "routers_disabled.txt", numbered=False,
     )
-    for ch in chunks:
-        await send_pre_chunk(cb.message, ch)
     await cb.message.answer(f"Отключённых: {len(expired)}", reply_markup=router_menu_kb())
 
 
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import html
+import logging
+import time
+
+from aiogram import Router
+from aiogram.filters import Command
+from aiogram.types import Message
+
+from app.tasks import runner, STATUS_DONE
+from app.perf import perf, HandlerStats
+from app.slowlog import slow_log
+from app.config import settings
+
+log = logging.getLogger(__name__)
+
+router = Router()
+
+# Запас к лимиту длины сообщения Telegram (4096)
+MESSAGE_LIMIT = 3900
+
+# ==== Служебные команды (только админ) ====
+
+
+@router.message(Command("jobs"))
+async def jobs_list(message: Message) -> None:
+    """Фоновые задачи: выполняющиеся и последние завершённые."""
+    running = runner.running()
+    finished = runner.finished()
+    if not running and not finished:
+        await message.answer("Фоновых задач не было.")
+        return
+    lines: list[str] = []
+    if running:
+        lines.append("⏳ Выполняются:")
+        for job in running:
+            tail = f" — {job.text}" if job.text else ""
+            lines.append(f"#{job.id} {job.title}: {job.duration:.1f} с{tail}")
+    if finished:
+        if lines:
+            lines.append("")
+        lines.append("Завершённые:")
+        for job in finished:
+            mark = "✅" if job.status == STATUS_DONE else "❌"
+            tail = f" — {job.error}" if job.error else ""
+            lines.append(f"{mark} #{job.id} {job.title}: {job.duration:.1f} с{tail}")
+    await message.answer("\n".join(lines))
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}" if seconds >= 0.01 else f"{seconds * 1000:.1f}"
+
+
+def _perf_line(name: str, st: HandlerStats) -> str:
+    h = st.hist
+    return (
+        f"{name}\n  ×{h.count}  p50 {_ms(h.quantile(0.5))} / p95 {_ms(h.quantile(0.95))} / "
+        f"p99 {_ms(h.quantile(0.99))} / max {_ms(h.max)} мс; "
+        f"запросов {st.queries / h.count:.1f}, БД {_ms(st.db_seconds / h.count)} мс на апдейт"
+    )
+
+
+@router.message(Command("perf"))
+async def perf_report(message: Message) -> None:
+    """Время обработки апдейтов и запросы к БД с момента запуска; /perf reset — обнулить."""
+    if (message.text or "").split()[1:2] == ["reset"]:
+        perf.reset()
+        await message.answer("Счётчики /perf обнулены.")
+        return
+    if not perf.total.hist.count:
+        await message.answer("Апдейтов ещё не было.")
+        return
+    hours = (time.time() - perf.started) / 3600
+    lines = [
+        f"⏱ Обработка апдейтов за {hours:.1f} ч (время в мс):",
+        _perf_line("Все апдейты", perf.total),
+        "",
+        "Больше всего суммарного времени:",
+    ]
+    for name, st in perf.top(10):
+        lines.append(_perf_line(f"{name} — всего {st.hist.total:.1f} с", st))
+    await message.answer("\n".join(lines))
+
+
+@router.message(Command("slow"))
+async def slow_report(message: Message) -> None:
+    """Самые медленные запросы к БД (по суммарному времени); /slow N — сколько показать, /slow reset — обнулить."""
+    if settings.SLOW_QUERY_MS <= 0:
+        await message.answer("Журнал медленных запросов выключен (SLOW_QUERY_MS=0).")
+        return
+    arg = ((message.text or "").split()[1:2] or [""])[0]
+    if arg == "reset":
+        slow_log.reset()
+        await message.answer("Сводка /slow обнулена.")
+        return
+    n = int(arg) if arg.isdigit() else 5
+    top = slow_log.top(n)
+    if not top:
+        await message.answer(f"Запросов дольше {settings.SLOW_QUERY_MS:g} мс не было.")
+        return
+    text = f"🐢 Запросы дольше {settings.SLOW_QUERY_MS:g} мс (журнал: {settings.SLOW_QUERY_LOG}):"
+    for i, st in enumerate(top, 1):
+        sql = st.sql if len(st.sql) <= 600 else st.sql[:600] + "…"
+        plan = f"\n{st.plan}" if st.plan else ""
+        part = (
+            f"\n\n{i}. ×{st.count}, всего {st.total:.2f} с, среднее {_ms(st.total / st.count)} мс, "
+            f"макс {_ms(st.max)} мс\n<pre>{html.escape(sql)}{html.escape(plan)}</pre>"
+        )
+        if len(text) + len(part) > MESSAGE_LIMIT:
+            break
+        text += part
+    await message.answer(text, parse_mode="HTML")
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import GetUpdates, Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from sqlalchemy import text
+
+from app.config import settings
+from app.db import SessionLocal
+from app.leader import lease
+from app.multibot import registry
+from app.outbound import gateway
+from app.perf import perf
+
+log = logging.getLogger(__name__)
+
+# ====== Проверка живости: /health и /metrics ======
+#
+# Маленький HTTP-сервер на HEALTH_PORT:
+# - GET /health — JSON со статусом и проверками; 200 — всё в порядке,
+#   503 — что-то застряло (для healthcheck в docker compose);
+# - GET /metrics — те же показатели в текстовом формате Prometheus.
+# Проверки: задержка event loop (замер раз в LOOP_LAG_INTERVAL), давность
+# последнего успешного getUpdates (в режиме polling), давность последнего
+# прохода уведомлений (на ведущей реплике), время запроса к БД, очередь
+# исходящих сообщений.
+
+LOOP_LAG_INTERVAL = 1.0
+# Сколько ждать после запуска, прежде чем считать отсутствие poll/уведомлений ошибкой
+STARTUP_GRACE_SECONDS = 120
+POLL_STALE_SECONDS = 120
+DB_TIMEOUT_SECONDS = 5.0
+
+
+class HealthState:
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.loop_lag = 0.0
+        self.loop_lag_max = 0.0
+        self.last_poll: float | None = None
+        self.notifier_finished: float | None = None
+        self.notifier_duration = 0.0
+        self.notifier_ok = True
+        self.notifier_runs = 0
+
+    def uptime(self) -> float:
+        return time.monotonic() - self.started
+
+    def notifier_done(self, duration: float, ok: bool) -> None:
+        self.notifier_finished = time.monotonic()
+        self.notifier_duration = duration
+        self.notifier_ok = ok
+        self.notifier_runs += 1
+
+
+health = HealthState()
+_lag_task: asyncio.Task | None = None
+
+
+class PollWatch(BaseRequestMiddleware):
+    """Middleware сессии: отмечает каждый успешный getUpdates."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        response = await make_request(bot, method)
+        if isinstance(method, GetUpdates):
+            health.last_poll = time.monotonic()
+        return response
+
+
+async def _loop_lag_monitor() -> None:
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, time.monotonic() - started - LOOP_LAG_INTERVAL)
+        health.loop_lag = lag
+        health.loop_lag_max = max(health.loop_lag_max, lag)
+
+
+async def _db_roundtrip() -> float | None:
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(DB_TIMEOUT_SECONDS):
+            async with SessionLocal() as session:
+                await session.execute(text("SELECT 1"))
+    except Exception as e:
+        log.warning("Health DB check failed: %s", e)
+        return None
+    return time.perf_counter() - started
+
+
+def _age(ts: float | None) -> float | None:
+    return None if ts is None else time.monotonic() - ts
+
+
+def _queue_depth() -> int:
+    return gateway.queue_depth() + sum(g.queue_depth() for g in registry.gateways.values())
+
+
+async def collect() -> dict[str, Any]:
+    """Все показатели и итоговый статус."""
+    db_rt = await _db_roundtrip()
+    in_grace = health.uptime() < STARTUP_GRACE_SECONDS
+    poll_age = _age(health.last_poll)
+    notifier_age = _age(health.notifier_finished)
+    notifier_limit = max(300.0, 3 * settings.CHECK_INTERVAL_MINUTES * 60)
+    # Уведомления шлёт только ведущий: отсчёт — с момента, когда эта реплика
+    # им стала (или с запуска, если аренда выключена), а проход до этого не в счёт
+    leader_since = lease.leader_since if lease.leader_since is not None else health.started
+
+    checks: dict[str, bool] = {
+        "event_loop": health.loop_lag < settings.HEALTH_MAX_LOOP_LAG,
+        "db": db_rt is not None,
+    }
+    if not settings.WEBHOOK_URL:
+        checks["polling"] = in_grace if poll_age is None else poll_age < POLL_STALE_SECONDS
+    if settings.BOT_MODE != "dealer" and lease.is_leader():
+        finished = health.notifier_finished
+        if finished is None or finished < leader_since:
+            # Ведущие недавно — первый проход ещё может быть впереди
+            checks["notifier"] = _age(leader_since) < notifier_limit
+        else:
+            checks["notifier"] = health.notifier_ok and notifier_age < notifier_limit
+    return {
+        "status": "ok" if all(checks.values()) else "fail",
+        "checks": checks,
+        "uptime_seconds": round(health.uptime(), 1),
+        "event_loop_lag_seconds": round(health.loop_lag, 4),
+        "event_loop_lag_max_seconds": round(health.loop_lag_max, 4),
+        "last_poll_age_seconds": None if poll_age is None else round(poll_age, 1),
+        "notifier_last_run_age_seconds": None if notifier_age is None else round(notifier_age, 1),
+        "notifier_last_duration_seconds": round(health.notifier_duration, 3),
+        "notifier_runs": health.notifier_runs,
+        "db_roundtrip_seconds": None if db_rt is None else round(db_rt, 4),
+        "outbound_queue_depth": _queue_depth(),
+        "scheduler_leader": lease.is_leader(),
+    }
+
+
+def prometheus_text(data: dict[str, Any]) -> str:
+    """Показатели в текстовом формате Prometheus (exposition format 0.0.4)."""
+    out: list[str] = []
+
+    def declare(name: str, kind: str, help_text: str) -> None:
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+
+    def sample(name: str, value: Any, labels: str = "") -> None:
+        if value is not None:
+            out.append(f"{name}{labels} {float(value):g}")
+
+    def gauge(name: str, help_text: str, value: Any, kind: str = "gauge") -> None:
+        if value is not None:
+            declare(name, kind, help_text)
+            sample(name, value)
+
+    gauge("xmplus_healthy", "1 if all health checks pass", data["status"] == "ok")
+    declare("xmplus_health_check", "gauge", "Result of each health check")
+    for check, ok in data["checks"].items():
+        sample("xmplus_health_check", ok, f'{{check="{check}"}}')
+    gauge("xmplus_uptime_seconds", "Process uptime", data["uptime_seconds"])
+    gauge("xmplus_event_loop_lag_seconds", "Last sampled event loop lag", data["event_loop_lag_seconds"])
+    gauge("xmplus_event_loop_lag_max_seconds", "Max event loop lag since start", data["event_loop_lag_max_seconds"])
+    gauge("xmplus_last_poll_age_seconds", "Seconds since last successful getUpdates", data["last_poll_age_seconds"])
+    gauge("xmplus_notifier_last_run_age_seconds", "Seconds since last finished expiry check",
+          data["notifier_last_run_age_seconds"])
+    gauge("xmplus_notifier_last_duration_seconds", "Duration of last expiry check",
+          data["notifier_last_duration_seconds"])
+    gauge("xmplus_notifier_runs_total", "Finished expiry checks", data["notifier_runs"], "counter")
+    gauge("xmplus_db_roundtrip_seconds", "SELECT 1 round trip", data["db_roundtrip_seconds"])
+    gauge("xmplus_outbound_queue_depth", "Messages waiting for a send slot", data["outbound_queue_depth"])
+    gauge("xmplus_scheduler_leader", "1 if this replica runs scheduled jobs", data["scheduler_leader"])
+    m = gateway.metrics()
+    gauge("xmplus_outbound_sent_total", "Requests sent through the outbound gateway", m["sent"], "counter")
+    gauge("xmplus_outbound_retry_after_total", "429 responses from Telegram", m["retry_after"], "counter")
+    gauge("xmplus_outbound_failed_total", "Failed outbound requests", m["failed"], "counter")
+    h = perf.total.hist
+    declare("xmplus_update_duration_seconds", "summary", "Update processing time")
+    for q in (0.5, 0.95, 0.99):
+        sample("xmplus_update_duration_seconds", h.quantile(q), f'{{quantile="{q}"}}')
+    sample("xmplus_update_duration_seconds_sum", h.total)
+    sample("xmplus_update_duration_seconds_count", h.count)
+    gauge("xmplus_db_queries_total", "DB queries made while processing updates", perf.total.queries, "counter")
+    return "\n".join(out) + "\n"
+
+
+async def _health_view(request: web.Request) -> web.Response:
+    data = await collect()
+    return web.json_response(data, status=200 if data["status"] == "ok" else 503)
+
+
+async def _metrics_view(request: web.Request) -> web.Response:
+    data = await collect()
+    return web.Response(text=prometheus_text(data), content_type="text/plain", charset="utf-8")
+
+
+def build_health_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/health", _health_view)
+    app.router.add_get("/metrics", _metrics_view)
+    return app
+
+
+async def start_health_server() -> web.AppRunner | None:
+    """Запустить замер задержки loop и HTTP-сервер (HEALTH_PORT=0 — выключено)."""
+    if settings.HEALTH_PORT <= 0:
+        return None
+    global _lag_task
+    _lag_task = asyncio.create_task(_loop_lag_monitor(), name="loop-lag")
+    runner = web.AppRunner(build_health_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, settings.HEALTH_HOST, settings.HEALTH_PORT).start()
+    log.info("Health endpoint on %s:%s", settings.HEALTH_HOST, settings.HEALTH_PORT)
+    return runner
@@ -1,13 +1,25 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import time
 from datetime import timedelta
 
 from aiogram import Bot
+from aiogram.types import FSInputFile
 from sqlalchemy import select
 
 from app.config import settings
 from app.db import SessionLocal, Item, RouterItem, Dealer
+from app.outbound import bulk_lane
+from app.multibot import send_to_dealer
+from app.health import health
+from app.ledger import take_snapshots, find_drift
+from app.export import prune_tombstones
+from app.backup import (
+    BACKUP_DIR, KIND_INCREMENTAL, create_backup, create_incremental_backup, prune_journal, clear_journal,
+    auto_backup_name, incremental_backup_name, apply_retention, record_backup_run, set_manifest_file_id,
+)
 from app.utils import now_tz, fmt_dt_human, tz_offset_str, to_tz
 
 log = logging.getLogger(__name__)
@@ -29,6 +41,19 @@ async def check_expiries(bot: Bot) -> None:
     if settings.BOT_MODE == "dealer":
         return
 
+    started = time.monotonic()
+    ok = False
+    try:
+        # Уведомления — низкоприоритетная полоса шлюза: ответы на команды идут первыми
+        with bulk_lane():
+            await _check_expiries(bot)
+        ok = True
+    finally:
+        # Для /health: уведомления не должны молча остановиться
+        health.notifier_done(time.monotonic() - started, ok)
+
+
+async def _check_expiries(bot: Bot) -> None:
     now = now_tz()
     pre_hours = settings.PRE_NOTIFY_HOURS
     tz_str = f"UTC{tz_offset_str()}"
@@ -43,8 +68,11 @@ async def check_expiries(bot: Bot) -> None:
 
         for it in items:
             # Кому отправлять уведомление по этой записи
+            # и через какого бота: у дилера может быть свой (dealers.bot_token)
+            sender_code = None
             if it.dealer and it.dealer in dealer_chat:
                 target_chat = dealer_chat[it.dealer]
+                sender_code = it.dealer
             else:
                 # 'main' или дилер без записи в таблице → администратору
                 target_chat = it.chat_id or owner_chat
@@ -68,7 +96,7 @@ async def check_expiries(bot: Bot) -> None:
                     f"Дата/время отключения: {fmt_dt_human(due)}"
                 )
                 try:
-                    await bot.send_message(target_chat, text)
+                    await send_to_dealer(sender_code, bot, target_chat, text)
                 except Exception as e:
                     dealer_name = it.dealer if it.dealer != "main" else "admin"
                     log.warning("Notify failed (pre) for USERID=%s to %s: %s", it.user_id, dealer_name, e)
@@ -93,7 +121,7 @@ async def check_expiries(bot: Bot) -> None:
                     "Уточните у администратора."
                 )
                 try:
-                    await bot.send_message(target_chat, text)
+                    await send_to_dealer(sender_code, bot, target_chat, text)
                 except Exception as e:
                     dealer_name = it.dealer if it.dealer != "main" else "admin"
                     log.warning("Notify failed (overdue) for USERID=%s to %s: %s", it.user_id, dealer_name, e)
@@ -156,3 +184,151 @@ async def check_expiries(bot: Bot) -> None:
                     rt.last_notified_at = now
 
         await session.commit()
+
+
+async def _report_backup_failure(bot: Bot, label: str, err: Exception) -> None:
+    owner_chat = int(settings.OWNER_CHAT_ID) if settings.OWNER_CHAT_ID else None
+    if owner_chat:
+        try:
+            await bot.send_message(owner_chat, f"❌ {label} не удался: {err}")
+        except Exception:
+            pass
+
+
+async def _send_backup_to_owner(bot: Bot, zip_path, caption: str) -> None:
+    if not (settings.BACKUP_SEND_TO_OWNER and settings.OWNER_CHAT_ID):
+        return
+    with bulk_lane():
+        try:
+            msg = await bot.send_document(
+                int(settings.OWNER_CHAT_ID), FSInputFile(zip_path, filename=zip_path.name), caption=caption,
+            )
+        except Exception as e:
+            log.warning("Failed to send scheduled backup to owner: %s", e)
+            return
+    if msg.document:
+        await asyncio.to_thread(set_manifest_file_id, zip_path.name, msg.document.file_id)
+
+
+async def scheduled_backup(bot: Bot) -> None:
+    """
+    Автоматический бэкап (каждые BACKUP_INTERVAL_HOURS): снимок базы в
+    BACKUP_DIR, ротация старых автоматических архивов, запись размера и
+    длительности в журнал. По желанию — отправка архива владельцу.
+    """
+    if settings.BOT_MODE == "dealer":
+        return
+    zip_name = auto_backup_name(now_tz())
+    zip_path = BACKUP_DIR / zip_name
+    started = time.monotonic()
+    try:
+        await create_backup(zip_path)
+    except Exception as e:
+        log.exception("Scheduled backup failed")
+        record_backup_run(zip_name, 0, time.monotonic() - started, ok=False, error=str(e))
+        await _report_backup_failure(bot, "Автоматический бэкап", e)
+        return
+    duration = time.monotonic() - started
+    size = zip_path.stat().st_size
+    record_backup_run(zip_name, size, duration, ok=True)
+    removed = await asyncio.to_thread(
+        apply_retention,
+        settings.BACKUP_KEEP_HOURLY, settings.BACKUP_KEEP_DAILY, settings.BACKUP_KEEP_WEEKLY,
+    )
+    log.info("Scheduled backup %s: %d bytes in %.2fs, removed %d old", zip_name, size, duration, len(removed))
+    await _send_backup_to_owner(
+        bot, zip_path, f"📦 Автоматический бэкап: {zip_name}\nРазмер: {size / 1024:.1f} KB, {duration:.1f} с",
+    )
+
+
+async def scheduled_incremental_backup(bot: Bot) -> None:
+    """
+    Инкрементальный бэкап (каждые BACKUP_INCREMENTAL_MINUTES): только журнал
+    изменений с последнего полного бэкапа. Если изменений не было — ничего не
+    создаётся; если базового полного бэкапа нет — делается полный.
+    """
+    if settings.BOT_MODE == "dealer":
+        return
+    zip_name = incremental_backup_name(now_tz())
+    zip_path = BACKUP_DIR / zip_name
+    started = time.monotonic()
+    try:
+        rows = await create_incremental_backup(zip_path)
+    except Exception as e:
+        log.exception("Incremental backup failed")
+        record_backup_run(zip_name, 0, time.monotonic() - started, ok=False, error=str(e), kind=KIND_INCREMENTAL)
+        await _report_backup_failure(bot, "Инкрементальный бэкап", e)
+        return
+    if rows is None:
+        log.info("Incremental backup: no base full backup, making a full one")
+        await scheduled_backup(bot)
+        return
+    if rows == 0:
+        return
+    duration = time.monotonic() - started
+    size = zip_path.stat().st_size
+    record_backup_run(zip_name, size, duration, ok=True, kind=KIND_INCREMENTAL)
+    log.info("Incremental backup %s: %d changes, %d bytes in %.2fs", zip_name, rows, size, duration)
+    await _send_backup_to_owner(
+        bot, zip_path, f"🧩 Инкрементальный бэкап: {zip_name}\nИзменений: {rows}, {size / 1024:.1f} KB",
+    )
+
+
+# Последние замеченные расхождения: код дилера → разница. Владельцу сообщаем
+# только о новых или изменившихся, а не каждый прогон
+_reported_drift: dict[str, float] = {}
+
+# Сколько дилеров перечислять в одном сообщении о расхождениях
+DRIFT_REPORT_LIMIT = 30
+
+
+async def reconcile_balances(bot: Bot) -> None:
+    """
+    Сверка балансов (каждые BALANCE_RECONCILE_HOURS): снимки баланса по
+    истории, затем сравнение Dealer.balance с суммой операций. О новых
+    расхождениях — сообщение администратору.
+    """
+    global _reported_drift
+    if settings.BOT_MODE == "dealer":
+        return
+    started = time.monotonic()
+    snapshots = await take_snapshots()
+    drift = await find_drift()
+    current = {d.code: round(d.diff, 2) for d in drift}
+    fresh = [d for d in drift if _reported_drift.get(d.code) != current[d.code]]
+    _reported_drift = current
+    log.info(
+        "Balance reconcile: %d snapshots, %d dealers drifted (%d new) in %.2fs",
+        snapshots, len(drift), len(fresh), time.monotonic() - started,
+    )
+    owner_chat = int(settings.OWNER_CHAT_ID) if settings.OWNER_CHAT_ID else None
+    if not fresh or not owner_chat:
+        return
+    lines = ["⚠️ Баланс дилера не сходится с историей операций:"]
+    for d in fresh[:DRIFT_REPORT_LIMIT]:
+        lines.append(
+            f"- {d.title} ({d.code}): в базе ${d.stored:g}, по истории ${d.ledger:g} (разница ${d.diff:+.2f})"
+        )
+    if len(fresh) > DRIFT_REPORT_LIMIT:
+        lines.append(f"…и ещё {len(fresh) - DRIFT_REPORT_LIMIT}")
+    try:
+        await bot.send_message(owner_chat, "\n".join(lines))
+    except Exception as e:
+        log.warning("Drift report failed: %s", e)
+
+
+async def prune_history(bot: Bot) -> None:
+    """
+    Чистка служебных таблиц: отметки об удалениях старше DELTA_KEEP_DAYS и
+    журнал изменений сверх JOURNAL_KEEP_DAYS / JOURNAL_MAX_ROWS (при
+    выключенных инкрементальных бэкапах — весь).
+    """
+    if settings.BOT_MODE == "dealer":
+        return
+    tombstones = await prune_tombstones()
+    if settings.BACKUP_INCREMENTAL_MINUTES > 0:
+        journal = await prune_journal(settings.JOURNAL_KEEP_DAYS, settings.JOURNAL_MAX_ROWS)
+    else:
+        journal = await clear_journal()
+    if tombstones or journal:
+        log.info("Pruned %d tombstones, %d change journal rows", tombstones, journal)
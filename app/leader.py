@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import functools
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from app.config import settings
+from app.db import SessionLocal, Lease
+
+log = logging.getLogger(__name__)
+
+# ====== Выбор ведущего планировщика ======
+#
+# Если запущено несколько реплик admin-бота с общей базой, периодические
+# задачи (уведомления, бэкапы) должна выполнять только одна — иначе клиенты
+# получат уведомления дважды. Ведущий — держатель строки в таблице leases:
+# - аренда берётся атомарным upsert'ом: строки нет, срок истёк или она уже наша;
+# - ведущий продлевает аренду каждую треть срока (heartbeat);
+# - резервная реплика пробует взять аренду с той же частотой и становится
+#   ведущей не позже чем через срок аренды после последнего продления;
+# - ведущий, не сумевший продлить аренду до истечения, сам перестаёт им быть.
+# Polling работает на всех репликах — ограничиваются только задачи планировщика.
+# Время сравнивается по часам реплик: они должны быть синхронизированы (NTP).
+
+SCHEDULER_LEASE = "scheduler"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class LeaderLease:
+    def __init__(self, name: str = SCHEDULER_LEASE, ttl: float | None = None, holder: str | None = None) -> None:
+        self.name = name
+        self.ttl = settings.LEADER_LEASE_SECONDS if ttl is None else ttl
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        # До какого момента (monotonic) мы точно ведущий
+        self._valid_until = 0.0
+        # С какого момента (monotonic) мы ведущий без перерыва; None — не ведущий
+        self.leader_since: float | None = None
+
+    @property
+    def enabled(self) -> bool:
+        # Дилерский контейнер работает с базой только на чтение и задач не выполняет
+        return self.ttl > 0 and settings.BOT_MODE != "dealer"
+
+    @property
+    def heartbeat_seconds(self) -> float:
+        return max(1.0, self.ttl / 3)
+
+    def is_leader(self) -> bool:
+        return not self.enabled or time.monotonic() < self._valid_until
+
+    async def try_acquire(self) -> bool:
+        """Взять или продлить аренду. True — мы ведущий до следующего продления."""
+        if not self.enabled:
+            return True
+        started = time.monotonic()
+        now = _utcnow()
+        stmt = insert(Lease).values(name=self.name, holder=self.holder, expires_at=now + timedelta(seconds=self.ttl))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Lease.name],
+            set_={"holder": stmt.excluded.holder, "expires_at": stmt.excluded.expires_at},
+            where=(Lease.holder == self.holder) | (Lease.expires_at < now),
+        )
+        async with SessionLocal() as session:
+            await session.execute(stmt)
+            await session.commit()
+            holder = (await session.execute(select(Lease.holder).where(Lease.name == self.name))).scalar_one_or_none()
+        was_leader = self.is_leader()
+        if holder == self.holder:
+            # Отсчёт от момента запроса: аренда в БД не могла истечь раньше
+            self._valid_until = started + self.ttl
+        else:
+            self._valid_until = 0.0
+        if self.is_leader() != was_leader:
+            self.leader_since = started if self.is_leader() else None
+            log.info("Lease %s: %s is now %s", self.name, self.holder, "leader" if self.is_leader() else "standby")
+        return self.is_leader()
+
+    async def heartbeat(self) -> None:
+        try:
+            await self.try_acquire()
+        except Exception:
+            # Не достучались до БД — аренда истечёт сама, is_leader() это учтёт
+            log.exception("Lease %s heartbeat failed", self.name)
+
+    async def release(self) -> None:
+        """Отдать аренду при остановке, чтобы резерв не ждал истечения срока."""
+        if not self.enabled or not self.is_leader():
+            return
+        self._valid_until = 0.0
+        self.leader_since = None
+        async with SessionLocal() as session:
+            await session.execute(
+                update(Lease)
+                .where(Lease.name == self.name, Lease.holder == self.holder)
+                .values(expires_at=_utcnow())
+            )
+            await session.commit()
+
+
+lease = LeaderLease()
+
+
+def leader_only(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Задача планировщика, которая выполняется только на ведущей реплике."""
+
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if not lease.is_leader():
+            return None
+        return await func(*args, **kwargs)
+
+    return wrapper
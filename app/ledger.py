@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from typing import Optional
+
+from sqlalchemy import DateTime, bindparam, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import SessionLocal, BalanceSnapshot, BalanceTxn
+
+log = logging.getLogger(__name__)
+
+# ====== Снимки баланса и сверка с историей операций ======
+#
+# Dealer.balance — накопленная сумма: её меняют apply_balance_change и
+# resolve_payment вместе с записью в balance_txns. Здесь:
+# - снимки: баланс дилера по истории на операцию txn_id. Баланс на любой
+#   момент = последний снимок до него + хвост операций после снимка, без
+#   прохода по всей истории;
+# - сверка: один сгруппированный запрос (снимок + хвост по каждому дилеру)
+#   сравнивает историю с Dealer.balance.
+
+# Новый снимок — когда после последнего накопилось столько операций
+SNAPSHOT_MIN_TAIL = 50
+# Расхождение меньше полцента — округление, не ошибка
+DRIFT_EPSILON = 0.005
+
+# Последний снимок каждого дилера
+_LATEST_SNAPSHOTS = (
+    "SELECT s.dealer_code, s.txn_id, s.balance FROM balance_snapshots s "
+    "JOIN (SELECT dealer_code, MAX(txn_id) AS txn_id FROM balance_snapshots GROUP BY dealer_code) m "
+    "ON m.dealer_code = s.dealer_code AND m.txn_id = s.txn_id"
+)
+
+
+@dataclass
+class Drift:
+    code: str
+    title: str
+    stored: float
+    ledger: float
+
+    @property
+    def diff(self) -> float:
+        return self.stored - self.ledger
+
+
+async def take_snapshots(min_tail: int = SNAPSHOT_MIN_TAIL) -> int:
+    """Снимки для дилеров, у которых после последнего снимка не меньше min_tail операций. Возвращает их число."""
+    async with SessionLocal() as session:
+        rows = (await session.execute(text(
+            "SELECT t.dealer_code, MAX(t.id), COALESCE(ls.balance, 0) + SUM(t.amount) "
+            f"FROM balance_txns t LEFT JOIN ({_LATEST_SNAPSHOTS}) ls ON ls.dealer_code = t.dealer_code "
+            "WHERE t.id > COALESCE(ls.txn_id, 0) "
+            "GROUP BY t.dealer_code, ls.balance "
+            "HAVING COUNT(*) >= :min_tail"
+        ), {"min_tail": min_tail})).all()
+        for code, txn_id, balance in rows:
+            session.add(BalanceSnapshot(dealer_code=code, txn_id=txn_id, balance=balance))
+        await session.commit()
+    return len(rows)
+
+
+async def balance_at(dealer_code: str, txn_id: int) -> float:
+    """Баланс дилера по истории сразу после операции txn_id."""
+    async with SessionLocal() as session:
+        snap = (await session.execute(
+            select(BalanceSnapshot.txn_id, BalanceSnapshot.balance)
+            .where(BalanceSnapshot.dealer_code == dealer_code, BalanceSnapshot.txn_id <= txn_id)
+            .order_by(BalanceSnapshot.txn_id.desc())
+            .limit(1)
+        )).first()
+        base_id, base = snap if snap else (0, 0.0)
+        tail = (await session.execute(
+            select(func.coalesce(func.sum(BalanceTxn.amount), 0.0))
+            .where(
+                BalanceTxn.dealer_code == dealer_code,
+                BalanceTxn.id > base_id,
+                BalanceTxn.id <= txn_id,
+            )
+        )).scalar_one()
+    return base + tail
+
+
+async def balance_before(dealer_code: str, at: datetime) -> float:
+    """Баланс дилера по истории на момент at (операции строго раньше at)."""
+    if at.tzinfo is not None:
+        # created_at хранится в UTC без пояса
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    async with SessionLocal() as session:
+        last_id = (await session.execute(
+            select(func.max(BalanceTxn.id))
+            .where(BalanceTxn.dealer_code == dealer_code, BalanceTxn.created_at < at)
+        )).scalar_one()
+    if last_id is None:
+        return 0.0
+    return await balance_at(dealer_code, last_id)
+
+
+# Баланс всех дилеров на момент :at: последний снимок на операции раньше :at
+# плюс хвост операций после него и раньше :at — один сгруппированный запрос
+_BALANCES_BEFORE = (
+    "SELECT d.code, COALESCE(s.balance, 0) + COALESCE(SUM(t.amount), 0) "
+    "FROM dealers d "
+    "LEFT JOIN (SELECT s.dealer_code, MAX(s.txn_id) AS txn_id FROM balance_snapshots s "
+    "JOIN balance_txns st ON st.id = s.txn_id WHERE st.created_at < :at GROUP BY s.dealer_code) ls "
+    "ON ls.dealer_code = d.code "
+    "LEFT JOIN balance_snapshots s ON s.dealer_code = d.code AND s.txn_id = ls.txn_id "
+    "LEFT JOIN balance_txns t ON t.dealer_code = d.code AND t.id > COALESCE(ls.txn_id, 0) AND t.created_at < :at "
+    "WHERE :code IS NULL OR d.code = :code "
+    "GROUP BY d.code, s.balance"
+)
+
+
+async def balances_before(
+    session: AsyncSession, at: datetime, dealer_code: Optional[str] = None,
+) -> list[tuple[str, float]]:
+    """
+    (код, баланс по истории на момент at) для всех дилеров (или одного) —
+    одним запросом в транзакции session.
+    """
+    if at.tzinfo is not None:
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    stmt = text(_BALANCES_BEFORE).bindparams(bindparam("at", type_=DateTime()))
+    return [tuple(r) for r in (await session.execute(stmt, {"at": at, "code": dealer_code})).all()]
+
+
+async def find_drift() -> list[Drift]:
+    """Дилеры, у которых Dealer.balance не совпадает с суммой операций."""
+    async with SessionLocal() as session:
+        rows = (await session.execute(text(
+            "SELECT d.code, d.title, COALESCE(d.balance, 0), "
+            "COALESCE(ls.balance, 0) + COALESCE(SUM(t.amount), 0) "
+            f"FROM dealers d LEFT JOIN ({_LATEST_SNAPSHOTS}) ls ON ls.dealer_code = d.code "
+            "LEFT JOIN balance_txns t ON t.dealer_code = d.code AND t.id > COALESCE(ls.txn_id, 0) "
+            "GROUP BY d.code, d.title, d.balance, ls.balance"
+        ))).all()
+    return [
+        Drift(code, title, stored, ledger)
+        for code, title, stored, ledger in rows
+        if abs(stored - ledger) >= DRIFT_EPSILON
+    ]
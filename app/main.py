@@ -3,12 +3,24 @@ import logging
 import traceback
 
 from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import ErrorEvent
 
 from app.config import settings
-from app.bot import router, dealer_router, guest_router, set_bot_commands, is_dealer_mode
-from app.db import init_db, seed_default_dealers, seed_payment_methods
+from app.bot import (
+    router, dealer_router, guest_router, set_bot_commands, set_dealer_bot_commands, is_dealer_mode,
+)
+from app.db import engine, init_db, seed_default_dealers, seed_payment_methods
 from app.scheduler import start_scheduler
+from app.outbound import install_gateway
+from app.fsm_storage import SQLiteStorage
+from app.webhook import make_session, run_webhook
+from app.multibot import DealerScopeMiddleware, admin_bot, load_dealer_bots, registry
+from app.leader import lease
+from app.perf import UpdateTimingMiddleware, HandlerNameMiddleware, instrument_engine
+from app.slowlog import slow_log
+from app.health import PollWatch, start_health_server
 
 from app.handlers.add import router as add_router
 from app.handlers.renew import router as renew_router
@@ -16,21 +28,35 @@ from app.handlers.dealers import router as dealers_router
 from app.handlers.payments import router as payments_router
 from app.handlers.backup import router as backup_router
 from app.handlers.routers import router as routers_router
+from app.handlers.service import router as service_router
 
 log = logging.getLogger(__name__)
 
 
+def make_fsm_storage() -> BaseStorage:
+    """Хранилище состояний мастеров. Дилерский бот работает с чужой БД — ему в память."""
+    if settings.FSM_STORAGE == "sqlite" and settings.BOT_MODE != "dealer":
+        return SQLiteStorage()
+    return MemoryStorage()
+
+
 async def main() -> None:
     if not settings.BOT_TOKEN:
         print("ERROR: BOT_TOKEN is not set in .env", flush=True)
         return
 
     logging.basicConfig(level=logging.INFO)
-    bot = Bot(token=settings.BOT_TOKEN)
-    dp = Dispatcher()
+    bot = Bot(token=settings.BOT_TOKEN, session=make_session())
+    # Все исходящие запросы — через шлюз с лимитами и повтором после 429
+    install_gateway(bot)
+    # Для /health: когда последний раз успешно прошёл getUpdates
+    bot.session.middleware(PollWatch())
+    registry.set_main(bot)
+    # Незаконченные мастера переживают перезапуск (FSM_STORAGE=sqlite)
+    dp = Dispatcher(storage=make_fsm_storage())
 
     @dp.errors()
-    async def global_error_handler(event: ErrorEvent) -> bool:
+    async def global_error_handler(event: ErrorEvent, bot: Bot) -> bool:
         log.error("Unhandled exception:\n%s", traceback.format_exc())
         # Try to notify the user
         try:
@@ -50,7 +76,7 @@ async def main() -> None:
             try:
                 tb = traceback.format_exc()
                 short = tb[-3500:] if len(tb) > 3500 else tb
-                await bot.send_message(owner, f"⚠️ Bot error:\n<pre>{short}</pre>", parse_mode="HTML")
+                await admin_bot(bot).send_message(owner, f"⚠️ Bot error:\n<pre>{short}</pre>", parse_mode="HTML")
             except Exception:
                 pass
         return True
@@ -66,6 +92,25 @@ async def main() -> None:
     # Регистрируем команды бота (кнопка «меню» в Telegram)
     await set_bot_commands(bot)
 
+    # Боты дилеров (dealers.bot_token) — в этом же процессе, с общим диспетчером
+    dealer_bots: list[Bot] = []
+    if not is_dealer_mode():
+        dealer_bots = await load_dealer_bots()
+        for b in dealer_bots:
+            try:
+                await set_dealer_bot_commands(b)
+            except Exception as e:
+                log.warning("set_my_commands failed for dealer bot %s: %s", b.id, e)
+    # Замеры для /perf: время апдейта, сработавший обработчик, запросы к БД
+    dp.update.outer_middleware(UpdateTimingMiddleware())
+    dp.message.middleware(HandlerNameMiddleware())
+    dp.callback_query.middleware(HandlerNameMiddleware())
+    instrument_engine(engine.sync_engine)
+    if settings.SLOW_QUERY_MS > 0:
+        slow_log.install(engine.sync_engine)
+    # Апдейт от бота дилера обрабатывается в области этого дилера (dealer_filter, роли)
+    dp.update.outer_middleware(DealerScopeMiddleware())
+
     # Подключаем роутеры (порядок: владелец, дилеры, гости-в-конце)
     dp.include_router(router)
     dp.include_router(dealer_router)
@@ -79,12 +124,24 @@ async def main() -> None:
         router.include_router(payments_router)
         router.include_router(backup_router)
         router.include_router(routers_router)
+        router.include_router(service_router)
 
-    # Запускаем планировщик задач (проверка истечений)
+    # Запускаем планировщик задач (проверка истечений); при остановке отдаём
+    # аренду ведущего, чтобы другая реплика подхватила задачи сразу
     start_scheduler(bot)
+    dp.shutdown.register(lease.release)
+    await start_health_server()
+
+    if settings.WEBHOOK_URL:
+        print("XMPLUS: starting webhook...", flush=True)
+        await run_webhook(dp, bot, *dealer_bots)
+        return
 
-    print("XMPLUS: starting polling...", flush=True)
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    # Polling не работает, пока в Telegram зарегистрирован вебхук (например, после смены режима)
+    for b in (bot, *dealer_bots):
+        await b.delete_webhook(drop_pending_updates=False)
+    print(f"XMPLUS: starting polling ({1 + len(dealer_bots)} bots)...", flush=True)
+    await dp.start_polling(bot, *dealer_bots, allowed_updates=dp.resolve_used_update_types())
 
 
 if __name__ == "__main__":
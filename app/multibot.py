@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import contextvars
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.types import Chat, Message, TelegramObject
+from sqlalchemy import select
+
+from app.config import settings
+from app.db import SessionLocal, Dealer
+from app.outbound import OutboundGateway, install_gateway
+from app.webhook import make_session
+
+log = logging.getLogger(__name__)
+
+# ====== Боты дилеров в одном процессе ======
+#
+# Вместо отдельного контейнера на каждого дилера (BOT_MODE=dealer) admin-процесс
+# сам обслуживает ботов из dealers.bot_token: один диспетчер, один engine,
+# один планировщик и общий кэш ролей.
+# - апдейт от бота дилера обрабатывается в «области» этого дилера
+#   (current_dealer()) — dealer_filter и роли считаются по ней;
+# - у каждого бота свой шлюз исходящих (лимиты Telegram — на бота);
+# - сообщения дилеру уходят через его бота (send_to_dealer), сообщения
+#   администратору — через основной (admin_bot). Пока дилер не запустил
+#   своего бота, Telegram не даёт боту писать первым (Forbidden) — такие
+#   сообщения идут через основного, а чат запоминается, и следующие сразу
+#   идут через основного, пока из этого чата не придёт апдейт в бот дилера.
+
+_scope: contextvars.ContextVar[str | None] = contextvars.ContextVar("dealer_scope", default=None)
+
+
+def current_dealer() -> str | None:
+    """Код дилера, в чьём боте обрабатывается апдейт (в legacy dealer-контейнере — DEALER_NAME)."""
+    code = _scope.get()
+    if code is None and settings.BOT_MODE == "dealer":
+        return settings.DEALER_NAME
+    return code
+
+
+class BotRegistry:
+    """Основной бот и боты дилеров: кто есть кто по bot.id и по коду дилера."""
+
+    def __init__(self) -> None:
+        self.main: Bot | None = None
+        self._code_by_bot: Dict[int, str] = {}
+        self._bot_by_code: Dict[str, Bot] = {}
+        self.gateways: Dict[str, OutboundGateway] = {}
+        # (код дилера, chat_id), куда бот дилера писать не может (не запущен или заблокирован)
+        self._unreachable: set[tuple[str, int]] = set()
+
+    def set_main(self, bot: Bot) -> None:
+        self.main = bot
+
+    def add(self, code: str, bot: Bot, gateway: OutboundGateway) -> None:
+        self._code_by_bot[bot.id] = code
+        self._bot_by_code[code] = bot
+        self.gateways[code] = gateway
+
+    def dealer_of(self, bot_id: int) -> str | None:
+        return self._code_by_bot.get(bot_id)
+
+    def bot_for(self, code: str | None) -> Bot | None:
+        return self._bot_by_code.get(code) if code else None
+
+    def dealer_bots(self) -> list[Bot]:
+        return list(self._bot_by_code.values())
+
+    def codes(self) -> list[str]:
+        return list(self._bot_by_code)
+
+    def can_reach(self, code: str, chat_id: int) -> bool:
+        return (code, chat_id) not in self._unreachable
+
+    def mark_unreachable(self, code: str, chat_id: int) -> None:
+        self._unreachable.add((code, chat_id))
+
+    def mark_started(self, code: str, chat_id: int) -> None:
+        self._unreachable.discard((code, chat_id))
+
+
+registry = BotRegistry()
+
+
+def admin_bot(bot: Bot) -> Bot:
+    """Бот, через который писать администратору (апдейт мог прийти в бот дилера)."""
+    return registry.main or bot
+
+
+async def send_to_dealer(code: str | None, bot: Bot, chat_id: int, text: str, **kwargs: Any) -> Message:
+    """
+    Написать дилеру через его бота. Если бот дилера в этот чат писать не
+    может (дилер его не запустил или заблокировал) — через основного бота
+    (или bot, если основного нет).
+    """
+    own = registry.bot_for(code)
+    fallback = registry.main or bot
+    if own is None or own is fallback or not registry.can_reach(code, chat_id):
+        return await fallback.send_message(chat_id, text, **kwargs)
+    try:
+        return await own.send_message(chat_id, text, **kwargs)
+    except TelegramForbiddenError as e:
+        log.warning("Dealer bot %s can't write to chat %s (%s), using main bot", code, chat_id, e.message)
+        registry.mark_unreachable(code, chat_id)
+        return await fallback.send_message(chat_id, text, **kwargs)
+
+
+async def load_dealer_bots() -> list[Bot]:
+    """
+    Поднять ботов дилеров с заданным bot_token. Бот с неверным токеном
+    пропускается (иначе polling упадёт целиком) — с записью в лог.
+    """
+    async with SessionLocal() as session:
+        rows = (await session.execute(
+            select(Dealer.code, Dealer.bot_token).where(Dealer.bot_token.is_not(None))
+        )).all()
+    bots: list[Bot] = []
+    for code, token in rows:
+        token = (token or "").strip()
+        if not token:
+            continue
+        bot = Bot(token=token, session=make_session())
+        try:
+            me = await bot.get_me()
+        except Exception as e:
+            log.warning("Dealer bot %s skipped: %s", code, e)
+            await bot.session.close()
+            continue
+        gateway = OutboundGateway()
+        install_gateway(bot, gateway)
+        registry.add(code, bot, gateway)
+        bots.append(bot)
+        log.info("Dealer bot @%s serves dealer %s", me.username, code)
+    return bots
+
+
+class DealerScopeMiddleware(BaseMiddleware):
+    """Outer-middleware апдейтов: выставляет область дилера по боту, получившему апдейт."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        bot: Bot | None = data.get("bot")
+        code = registry.dealer_of(bot.id) if bot is not None else None
+        chat: Chat | None = data.get("event_chat")
+        if code is not None and chat is not None:
+            # Апдейт из чата в бот дилера — теперь бот может писать в этот чат
+            registry.mark_started(code, chat.id)
+        token = _scope.set(code)
+        try:
+            return await handler(event, data)
+        finally:
+            _scope.reset(token)
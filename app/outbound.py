@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from app.config import settings
+
+log = logging.getLogger(__name__)
+
+# ====== Исходящие сообщения: единый шлюз с учётом лимитов Telegram ======
+#
+# Шлюз — middleware сессии Bot, через него проходит КАЖДЫЙ запрос к API,
+# адресованный чату (send_message, message.answer, answer_document, edit_*...).
+# - общий token bucket (лимит бота) и по bucket'у на чат;
+# - две полосы: интерактивные ответы и массовые рассылки (bulk_lane());
+#   рассылкам недоступен резерв общего bucket'а, поэтому ответы на команды
+#   не стоят в очереди за уведомлениями;
+# - 429 (TelegramRetryAfter): чат блокируется на retry_after, запрос повторяется;
+# - счётчики для /status и мониторинга.
+
+LANE_INTERACTIVE = 0
+LANE_BULK = 1
+
+# Доля общего bucket'а, которую рассылки не трогают
+BULK_RESERVE_SHARE = 0.2
+# Сколько чатов держим в памяти (LRU)
+MAX_CHAT_BUCKETS = 10000
+
+_lane: contextvars.ContextVar[int] = contextvars.ContextVar("outbound_lane", default=LANE_INTERACTIVE)
+
+
+@contextmanager
+def bulk_lane() -> Iterator[None]:
+    """Все отправки внутри блока идут низкоприоритетной полосой (рассылки, уведомления)."""
+    token = _lane.set(LANE_BULK)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше capacity."""
+
+    def __init__(self, rate: float, capacity: float, now: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float, reserve: float = 0.0) -> float:
+        """Сколько ждать, чтобы взять токен, не опускаясь ниже reserve (0 — можно сейчас)."""
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        need = 1.0 + reserve
+        if self.tokens < need:
+            wait = max(wait, (need - self.tokens) / self.rate)
+        return wait
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1.0
+
+    def block(self, now: float, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class OutboundGateway(BaseRequestMiddleware):
+    def __init__(
+        self,
+        global_rate: float = settings.OUTBOUND_GLOBAL_RATE,
+        chat_rate: float = settings.OUTBOUND_CHAT_RATE,
+        chat_burst: float = settings.OUTBOUND_CHAT_BURST,
+        max_retries: int = settings.OUTBOUND_MAX_RETRIES,
+    ) -> None:
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._bulk_reserve = global_rate * BULK_RESERVE_SHARE
+        self._chats: OrderedDict[int | str, TokenBucket] = OrderedDict()
+        self._waiting = [0, 0]
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.wait_seconds = 0.0
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+            if len(self._chats) > MAX_CHAT_BUCKETS:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def acquire(self, chat_id: int | str, lane: int = LANE_INTERACTIVE) -> None:
+        """Дождаться права отправить одно сообщение в chat_id."""
+        reserve = self._bulk_reserve if lane == LANE_BULK else 0.0
+        self._waiting[lane] += 1
+        started = time.monotonic()
+        try:
+            while True:
+                now = time.monotonic()
+                chat = self._chat_bucket(chat_id)
+                wait = max(self.global_bucket.delay(now, reserve), chat.delay(now))
+                if wait <= 0:
+                    self.global_bucket.take(now)
+                    chat.take(now)
+                    return
+                await asyncio.sleep(wait)
+        finally:
+            self._waiting[lane] -= 1
+            self.wait_seconds += time.monotonic() - started
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+        lane = _lane.get()
+        attempt = 0
+        while True:
+            await self.acquire(chat_id, lane)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retried += 1
+                self._chat_bucket(chat_id).block(time.monotonic(), e.retry_after)
+                if attempt >= self.max_retries:
+                    self.failed += 1
+                    raise
+                attempt += 1
+                log.info("Flood control for chat %s: retry in %ss (attempt %s)", chat_id, e.retry_after, attempt)
+                continue
+            except Exception:
+                self.failed += 1
+                raise
+            self.sent += 1
+            return response
+
+    def queue_depth(self) -> int:
+        return self._waiting[LANE_INTERACTIVE] + self._waiting[LANE_BULK]
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "queued_interactive": self._waiting[LANE_INTERACTIVE],
+            "queued_bulk": self._waiting[LANE_BULK],
+            "sent": self.sent,
+            "retry_after": self.retried,
+            "failed": self.failed,
+            "wait_seconds": round(self.wait_seconds, 3),
+        }
+
+
+gateway = OutboundGateway()
+
+
+def install_gateway(bot: Bot, gw: OutboundGateway | None = None) -> None:
+    """Пропускать все запросы бота через шлюз (по умолчанию — общий шлюз основного бота)."""
+    bot.session.middleware(gw or gateway)
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import bisect
+import contextvars
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# ====== Замеры: время обработчиков и запросов к БД ======
+#
+# - outer-middleware апдейта засекает полное время обработки (фильтры, FSM,
+#   обработчик) и заводит счётчики запросов к БД для этого апдейта;
+# - inner-middleware сообщений/колбэков запоминает, какой обработчик сработал
+#   («модуль:функция» — модуль и есть роутер: app.bot, handlers.dealers...);
+# - события SQLAlchemy before/after_cursor_execute считают запросы и время БД
+#   в счётчики текущего апдейта (contextvar);
+# - время копится в гистограммах с фиксированными логарифмическими корзинами:
+#   память не растёт с числом апдейтов, p50/p95/p99 — с точностью до корзины.
+
+# Корзины гистограммы: от 0.1 мс до ~2 мин, каждая следующая на 20% шире
+HIST_MIN = 0.0001
+HIST_FACTOR = 1.2
+HIST_BUCKETS = 78
+_BOUNDS = [HIST_MIN * HIST_FACTOR ** i for i in range(HIST_BUCKETS)]
+
+UNHANDLED = "(без обработчика)"
+
+
+class Histogram:
+    """Гистограмма длительностей (секунды) с фиксированными корзинами."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        # Последняя корзина — всё, что длиннее верхней границы
+        self.counts = [0] * (HIST_BUCKETS + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попал q-й квантиль (не больше максимума)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                bound = _BOUNDS[i] if i < HIST_BUCKETS else self.max
+                return min(bound, self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class HandlerStats:
+    __slots__ = ("hist", "queries", "db_seconds")
+
+    def __init__(self) -> None:
+        self.hist = Histogram()
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+class _UpdateStats:
+    """Счётчики одного апдейта; их меняют события SQLAlchemy."""
+
+    __slots__ = ("handler", "queries", "db_seconds")
+
+    def __init__(self) -> None:
+        self.handler = UNHANDLED
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_current: contextvars.ContextVar[_UpdateStats | None] = contextvars.ContextVar("perf_update", default=None)
+
+
+class PerfRegistry:
+    def __init__(self) -> None:
+        self.started = time.time()
+        self.total = HandlerStats()
+        self.handlers: Dict[str, HandlerStats] = {}
+
+    def record(self, stats: _UpdateStats, seconds: float) -> None:
+        h = self.handlers.get(stats.handler)
+        if h is None:
+            h = self.handlers[stats.handler] = HandlerStats()
+        for target in (h, self.total):
+            target.hist.add(seconds)
+            target.queries += stats.queries
+            target.db_seconds += stats.db_seconds
+
+    def top(self, n: int = 10) -> list[tuple[str, HandlerStats]]:
+        """Обработчики с наибольшим суммарным временем."""
+        return sorted(self.handlers.items(), key=lambda kv: kv[1].hist.total, reverse=True)[:n]
+
+    def reset(self) -> None:
+        self.started = time.time()
+        self.total = HandlerStats()
+        self.handlers.clear()
+
+
+perf = PerfRegistry()
+
+
+def handler_name(callback: Callable[..., Any]) -> str:
+    module = getattr(callback, "__module__", "") or ""
+    return f"{module.removeprefix('app.')}:{getattr(callback, '__name__', repr(callback))}"
+
+
+class UpdateTimingMiddleware(BaseMiddleware):
+    """Outer-middleware апдейта: полное время обработки и запросы к БД."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        stats = _UpdateStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            perf.record(stats, time.perf_counter() - started)
+            _current.reset(token)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Inner-middleware сообщений и колбэков: какой обработчик обработал апдейт."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        stats = _current.get()
+        handler_obj = data.get("handler")
+        if stats is not None and handler_obj is not None:
+            stats.handler = handler_name(handler_obj.callback)
+        return await handler(event, data)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info["perf_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info.pop("perf_started", None)
+    stats = _current.get()
+    if stats is not None and started is not None:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Подписаться на выполнение запросов (для AsyncEngine — передать engine.sync_engine)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
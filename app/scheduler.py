@@ -1,24 +1,98 @@
 from __future__ import annotations
 
+from datetime import datetime
+
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from aiogram import Bot
 
 from app.config import settings
-from app.jobs import check_expiries
+from app.db import register_db_pause
+from app.jobs import (
+    check_expiries, prune_history, reconcile_balances, scheduled_backup, scheduled_incremental_backup,
+)
+from app.leader import lease, leader_only
+
+# Как часто чистить служебные таблицы (отметки об удалениях, журнал изменений)
+PRUNE_INTERVAL_HOURS = 6
 
 
 def start_scheduler(bot: Bot) -> AsyncIOScheduler:
     """
-    Запускает планировщик и регистрирует периодическую задачу проверки истечений.
+    Запускает планировщик и регистрирует периодические задачи: проверку
+    истечений, автоматический полный бэкап (если BACKUP_INTERVAL_HOURS > 0),
+    инкрементальный (если BACKUP_INCREMENTAL_MINUTES > 0), сверку балансов
+    (если BALANCE_RECONCILE_HOURS > 0) и чистку служебных таблиц.
+    Задачи выполняет только ведущая реплика (аренда в БД, см. app/leader.py).
+    На время замены файла базы (восстановление) планировщик стоит на паузе.
     """
     scheduler = AsyncIOScheduler(timezone=settings.TIMEZONE)
+    if lease.enabled:
+        scheduler.add_job(
+            lease.heartbeat,
+            "interval",
+            seconds=lease.heartbeat_seconds,
+            id="leader_heartbeat",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+            next_run_time=datetime.now(scheduler.timezone),
+        )
     scheduler.add_job(
-        check_expiries,
+        leader_only(check_expiries),
         "interval",
         minutes=settings.CHECK_INTERVAL_MINUTES,
         args=[bot],
         id="check_expiries",
         replace_existing=True,
     )
+    if settings.BACKUP_INTERVAL_HOURS > 0 and settings.BOT_MODE != "dealer":
+        scheduler.add_job(
+            leader_only(scheduled_backup),
+            "interval",
+            hours=settings.BACKUP_INTERVAL_HOURS,
+            args=[bot],
+            id="scheduled_backup",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
+    if settings.BACKUP_INCREMENTAL_MINUTES > 0 and settings.BOT_MODE != "dealer":
+        scheduler.add_job(
+            leader_only(scheduled_incremental_backup),
+            "interval",
+            minutes=settings.BACKUP_INCREMENTAL_MINUTES,
+            args=[bot],
+            id="scheduled_incremental_backup",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
+    if settings.BALANCE_RECONCILE_HOURS > 0 and settings.BOT_MODE != "dealer":
+        scheduler.add_job(
+            leader_only(reconcile_balances),
+            "interval",
+            hours=settings.BALANCE_RECONCILE_HOURS,
+            args=[bot],
+            id="reconcile_balances",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
+    if settings.BOT_MODE != "dealer":
+        scheduler.add_job(
+            leader_only(prune_history),
+            "interval",
+            hours=PRUNE_INTERVAL_HOURS,
+            args=[bot],
+            id="prune_history",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
     scheduler.start()
-    return scheduler
\ No newline at end of file
+
+    async def pause() -> None:
+        scheduler.pause()
+
+    register_db_pause(pause, scheduler.resume)
+    return scheduler
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import json
+import logging
+import logging.handlers
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+
+log = logging.getLogger(__name__)
+
+# ====== Журнал медленных запросов ======
+#
+# Включается SLOW_QUERY_MS > 0. Запрос к БД дольше порога:
+# - пишется строкой JSON в SLOW_QUERY_LOG (с ротацией): SQL, «форма»
+#   параметров (типы, без значений — там могут быть личные данные),
+#   длительность и EXPLAIN QUERY PLAN;
+# - копится в сводке по нормализованному SQL (литералы и списки IN
+#   схлопнуты) — её показывает /slow.
+# План снимается один раз на нормализованный запрос за PLAN_REFRESH_SECONDS:
+# медленный запрос, повторяющийся в цикле, не удваивает нагрузку.
+
+PLAN_REFRESH_SECONDS = 600
+# Сколько разных нормализованных запросов держим в сводке
+MAX_STATEMENTS = 200
+
+_SKIP_EXPLAIN = ("EXPLAIN", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "CREATE", "DROP", "ALTER")
+
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_RE_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_SPACES = re.compile(r"\s+")
+
+
+def normalize_sql(statement: str) -> str:
+    """SQL без литералов и с одним «?» вместо списков: одинаковые запросы сводятся в один."""
+    s = _RE_STRING.sub("?", statement)
+    s = _RE_NUMBER.sub("?", s)
+    s = _RE_SPACES.sub(" ", s).strip()
+    return _RE_IN_LIST.sub("(?...)", s)
+
+
+def params_shape(parameters: Any, executemany: bool) -> str:
+    """Типы параметров без значений: (int, str, NoneType); для executemany — N×(...)."""
+    if executemany and isinstance(parameters, (list, tuple)):
+        first = params_shape(parameters[0], False) if parameters else "()"
+        return f"{len(parameters)}×{first}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(v).__name__ for v in parameters) + ")"
+    return type(parameters).__name__
+
+
+@dataclass
+class SlowStatement:
+    sql: str
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    plan: str = ""
+    plan_at: float = 0.0
+    last_seen: float = 0.0
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float, path: Path, max_bytes: int, backups: int) -> None:
+        self.threshold = threshold_ms / 1000
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.statements: dict[str, SlowStatement] = {}
+        self._file_log: logging.Logger | None = None
+
+    def _writer(self) -> logging.Logger:
+        if self._file_log is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            writer = logging.getLogger("xmplus.slow_queries")
+            writer.propagate = False
+            writer.setLevel(logging.INFO)
+            writer.addHandler(handler)
+            self._file_log = writer
+        return self._file_log
+
+    def _explain(self, conn, statement: str, parameters: Any, executemany: bool) -> str:
+        if statement.lstrip().upper().startswith(_SKIP_EXPLAIN):
+            return ""
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            # (id, parent, notused, detail)
+            return "\n".join(str(row[-1]) for row in cursor.fetchall())
+        finally:
+            cursor.close()
+
+    def record(self, conn, statement: str, parameters: Any, executemany: bool, seconds: float) -> None:
+        key = normalize_sql(statement)
+        now = time.time()
+        st = self.statements.get(key)
+        if st is None:
+            if len(self.statements) >= MAX_STATEMENTS:
+                # Вытесняем запрос с наименьшим суммарным временем
+                victim = min(self.statements.values(), key=lambda s: s.total)
+                del self.statements[victim.sql]
+            st = self.statements[key] = SlowStatement(sql=key)
+        st.count += 1
+        st.total += seconds
+        st.max = max(st.max, seconds)
+        st.last_seen = now
+        if now - st.plan_at >= PLAN_REFRESH_SECONDS:
+            st.plan_at = now
+            try:
+                st.plan = self._explain(conn, statement, parameters, executemany)
+            except Exception as e:
+                st.plan = f"(EXPLAIN не удался: {e})"
+        self._writer().info(json.dumps({
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "ms": round(seconds * 1000, 1),
+            "sql": key,
+            "params": params_shape(parameters, executemany),
+            "plan": st.plan,
+        }, ensure_ascii=False))
+
+    def top(self, n: int = 10) -> list[SlowStatement]:
+        return sorted(self.statements.values(), key=lambda s: s.total, reverse=True)[:n]
+
+    def reset(self) -> None:
+        self.statements.clear()
+
+    # ---- события engine ----
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info["slow_started"] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        started = conn.info.pop("slow_started", None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        if seconds < self.threshold:
+            return
+        try:
+            self.record(conn, statement, parameters, executemany, seconds)
+        except Exception:
+            log.exception("Slow query log failed")
+
+    def install(self, engine: Engine) -> None:
+        """Подписаться на запросы engine (для AsyncEngine — engine.sync_engine)."""
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+
+slow_log = SlowQueryLog(
+    settings.SLOW_QUERY_MS,
+    Path(settings.SLOW_QUERY_LOG),
+    settings.SLOW_QUERY_LOG_MAX_BYTES,
+    settings.SLOW_QUERY_LOG_BACKUPS,
+)
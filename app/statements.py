@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import case, func, select
+
+from app.db import SessionLocal, BalanceTxn, register_cache_reset
+from app.ledger import balances_before
+from app.utils import get_active_timezone, get_active_timezone_name
+
+# ====== Выписки дилеров за месяц ======
+#
+# Выписка: долг на начало месяца, продления и заказы ключей (число и сумма),
+# оплаты по методам, ручные корректировки и долг на конец.
+# - Долг на начало — по истории операций на начало месяца (app.ledger:
+#   последний снимок + хвост, один запрос на всех дилеров), а не от
+#   текущего Dealer.balance: расхождение баланса с историей (его ловит
+#   сверка) не переносится в прошлые месяцы.
+# - Операции месяца — один сгруппированный запрос по balance_txns только за
+#   этот месяц (индекс по created_at): по (дилер, вид операции, метод оплаты).
+# - Долг на конец = долг на начало + операции месяца.
+# Закрытый месяц уже не меняется: выписки за него считаются один раз и дальше
+# отдаются из памяти (сброс — после восстановления базы).
+
+MONTH_RE = re.compile(r"^(\d{4})-(\d{1,2})$")
+# Комментарий оплаты из resolve_payment: «Оплата: метод → вид»
+PAYMENT_PREFIX = "Оплата: "
+
+ADJUSTMENT_LABELS = {
+    "admin_add": "начисление (админ)",
+    "admin_sub": "списание (админ)",
+    "close": "закрытие счёта (дилер удалён)",
+}
+
+# Начисления отдельной строкой (вид операции → подпись)
+CHARGE_KINDS = {"renewal": "продления", "order": "заказы ключей"}
+
+STATEMENTS_CSV_HEADER = [
+    "month", "dealer_code", "dealer", "opening",
+    "renewals", "renewals_sum", "orders", "orders_sum", "payments", "payments_sum", "payments_by_method",
+    "adjustments_sum", "closing",
+]
+
+
+@dataclass(frozen=True)
+class StatementLine:
+    label: str
+    count: int
+    amount: float
+
+
+@dataclass(frozen=True)
+class Statement:
+    dealer_code: str
+    month: str
+    opening: float
+    renewals: StatementLine
+    orders: StatementLine
+    payments: tuple[StatementLine, ...]
+    adjustments: tuple[StatementLine, ...]
+    closing: float
+
+    @property
+    def payments_total(self) -> float:
+        return sum(p.amount for p in self.payments)
+
+    @property
+    def adjustments_total(self) -> float:
+        return sum(a.amount for a in self.adjustments)
+
+    @property
+    def is_empty(self) -> bool:
+        """Ни долга, ни операций за месяц."""
+        return not (
+            self.opening or self.closing or self.renewals.count or self.orders.count
+            or self.payments or self.adjustments
+        )
+
+
+def parse_month(text: str) -> Optional[str]:
+    """«2026-9» / «2026-09» → «2026-09»; None, если формат неверный."""
+    m = MONTH_RE.match((text or "").strip())
+    if not m or not 1 <= int(m.group(2)) <= 12:
+        return None
+    return f"{int(m.group(1)):04d}-{int(m.group(2)):02d}"
+
+
+def previous_month(today: date) -> str:
+    year, month = (today.year, today.month - 1) if today.month > 1 else (today.year - 1, 12)
+    return f"{year:04d}-{month:02d}"
+
+
+def month_bounds(month: str, tz) -> tuple[datetime, datetime]:
+    """Начало месяца и начало следующего в поясе tz — как naive UTC (так хранится created_at)."""
+    year, mon = (int(x) for x in month.split("-"))
+    nxt = (year + 1, 1) if mon == 12 else (year, mon + 1)
+
+    def _utc(y: int, m: int) -> datetime:
+        return datetime(y, m, 1, tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None)
+
+    return _utc(year, mon), _utc(*nxt)
+
+
+def _payment_label(comment: str) -> str:
+    comment = (comment or "").strip()
+    if comment.startswith(PAYMENT_PREFIX):
+        comment = comment[len(PAYMENT_PREFIX):].strip()
+    return comment or "без метода"
+
+
+def build_statements(
+    month: str,
+    openings: Iterable[tuple[str, float]],
+    rows: Iterable[tuple[str, str, str, int, float]],
+) -> dict[str, Statement]:
+    """
+    openings — (код дилера, долг на начало месяца); rows — строки
+    сгруппированного запроса: (код, вид, метод, операций за месяц, сумма за месяц).
+    """
+    by_code: dict[str, list[tuple[str, str, int, float]]] = {}
+    for code, kind, method, count, amount in rows:
+        if count:
+            by_code.setdefault(code, []).append((kind, method, int(count), amount or 0.0))
+
+    result: dict[str, Statement] = {}
+    for code, opening in openings:
+        opening = opening or 0.0
+        charges = {kind: [0, 0.0] for kind in CHARGE_KINDS}
+        payments: dict[str, list] = {}
+        adjustments: dict[str, list] = {}
+        for kind, method, count, amount in by_code.get(code, ()):
+            if kind in charges:
+                bucket = charges[kind]
+            elif kind == "payment":
+                bucket = payments.setdefault(_payment_label(method), [0, 0.0])
+            else:
+                bucket = adjustments.setdefault(ADJUSTMENT_LABELS.get(kind, kind), [0, 0.0])
+            bucket[0] += count
+            bucket[1] += amount
+        renewals, orders = (StatementLine(CHARGE_KINDS[k], *charges[k]) for k in ("renewal", "order"))
+        st_payments = tuple(StatementLine(k, c, a) for k, (c, a) in sorted(payments.items()))
+        st_adjustments = tuple(StatementLine(k, c, a) for k, (c, a) in sorted(adjustments.items()))
+        closing = (
+            opening + renewals.amount + orders.amount
+            + sum(p.amount for p in st_payments) + sum(a.amount for a in st_adjustments)
+        )
+        result[code] = Statement(
+            dealer_code=code,
+            month=month,
+            opening=opening,
+            renewals=renewals,
+            orders=orders,
+            payments=st_payments,
+            adjustments=st_adjustments,
+            closing=closing,
+        )
+    return result
+
+
+# (месяц, пояс) → выписки всех дилеров; только закрытые месяцы
+_closed: dict[tuple[str, str], dict[str, Statement]] = {}
+_generation = 0
+_lock = asyncio.Lock()
+
+
+@register_cache_reset
+def invalidate_statements() -> None:
+    global _generation
+    _closed.clear()
+    _generation += 1
+
+
+async def _load(month: str, start: datetime, end: datetime, dealer_code: Optional[str]) -> dict[str, Statement]:
+    method = case((BalanceTxn.kind == "payment", BalanceTxn.comment), else_="")
+    q = (
+        select(BalanceTxn.dealer_code, BalanceTxn.kind, method, func.count(), func.sum(BalanceTxn.amount))
+        .where(BalanceTxn.created_at >= start, BalanceTxn.created_at < end)
+        .group_by(BalanceTxn.dealer_code, BalanceTxn.kind, method)
+    )
+    if dealer_code is not None:
+        q = q.where(BalanceTxn.dealer_code == dealer_code)
+    async with SessionLocal() as session:
+        # Одна транзакция чтения: долг на начало и операции — из одного состояния базы
+        openings = await balances_before(session, start, dealer_code)
+        rows = (await session.execute(q)).all()
+    return build_statements(month, openings, rows)
+
+
+async def get_statements(month: str, dealer_code: Optional[str] = None) -> dict[str, Statement]:
+    """
+    Выписки за month («YYYY-MM», месяц в активном поясе): код дилера → выписка.
+    С dealer_code — только этот дилер (пустой словарь, если дилера нет).
+    """
+    tz_name = get_active_timezone_name()
+    start, end = month_bounds(month, get_active_timezone())
+    closed = end <= datetime.now(timezone.utc).replace(tzinfo=None)
+    if not closed:
+        return await _load(month, start, end, dealer_code)
+
+    key = (month, tz_name)
+    cached = _closed.get(key)
+    if cached is None:
+        async with _lock:
+            cached = _closed.get(key)
+            if cached is None:
+                generation = _generation
+                # Закрытый месяц считаем сразу для всех дилеров: следующие запросы — из памяти
+                cached = await _load(month, start, end, None)
+                if generation == _generation:
+                    _closed[key] = cached
+    if dealer_code is None:
+        return cached
+    st = cached.get(dealer_code)
+    return {dealer_code: st} if st is not None else {}
+
+
+def _money(x: float) -> str:
+    return f"−${abs(x):g}" if x < 0 else f"${x:g}"
+
+
+def statement_text(st: Statement, title: str) -> str:
+    lines = [
+        f"🧾 Выписка за {st.month}: {title}",
+        "",
+        f"Долг на начало месяца: {_money(st.opening)}",
+        f"Продления: {st.renewals.count} на {_money(st.renewals.amount)}",
+    ]
+    if st.orders.count:
+        lines.append(f"Заказы ключей: {st.orders.count} на {_money(st.orders.amount)}")
+    if st.payments:
+        lines.append(f"Оплаты: {_money(st.payments_total)}")
+        lines.extend(f"  - {p.label}: {p.count} на {_money(p.amount)}" for p in st.payments)
+    else:
+        lines.append("Оплаты: нет")
+    if st.adjustments:
+        lines.append(f"Корректировки: {_money(st.adjustments_total)}")
+        lines.extend(f"  - {a.label}: {a.count} на {_money(a.amount)}" for a in st.adjustments)
+    lines.append(f"Долг на конец месяца: {_money(st.closing)}")
+    return "\n".join(lines)
+
+
+def statements_csv(statements: Iterable[Statement], titles: dict[str, str]) -> bytes:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(STATEMENTS_CSV_HEADER)
+    for st in statements:
+        writer.writerow([
+            st.month, st.dealer_code, titles.get(st.dealer_code, st.dealer_code),
+            f"{st.opening:g}",
+            st.renewals.count, f"{st.renewals.amount:g}",
+            st.orders.count, f"{st.orders.amount:g}",
+            sum(p.count for p in st.payments), f"{st.payments_total:g}",
+            "; ".join(f"{p.label}: {p.amount:g}" for p in st.payments),
+            f"{st.adjustments_total:g}",
+            f"{st.closing:g}",
+        ])
+    return buf.getvalue().encode("utf-8")
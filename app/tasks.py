@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+
+log = logging.getLogger(__name__)
+
+# ====== Фоновые задачи для тяжёлых действий админа ======
+#
+# Хендлер сразу отвечает на callback, а сама работа (ZIP, CSV, рассылка,
+# массовое обновление) идёт отдельной asyncio-задачей. Прогресс показывается
+# в одном сообщении, которое редактируется по ходу работы. Список текущих
+# и завершённых задач — /jobs.
+
+# Не чаще одного редактирования сообщения о прогрессе за столько секунд
+PROGRESS_MIN_INTERVAL = 2.0
+# Сколько завершённых задач помнить для /jobs
+JOBS_HISTORY = 30
+
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+@dataclass
+class Job:
+    id: int
+    title: str
+    chat_id: int
+    key: str | None = None
+    status: str = STATUS_RUNNING
+    started: float = field(default_factory=time.monotonic)
+    finished: float | None = None
+    text: str = ""
+    error: str | None = None
+    message_id: int | None = None
+    _bot: Bot | None = field(default=None, repr=False)
+    _edited: float = field(default=0.0, repr=False)
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    async def _render(self, text: str) -> None:
+        if self._bot is None or self.message_id is None:
+            return
+        try:
+            await self._bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+        except TelegramBadRequest as e:
+            # «message is not modified» и т.п. — не повод ронять задачу
+            log.debug("Job %s: edit failed: %s", self.id, e)
+        except (TelegramAPIError, asyncio.TimeoutError) as e:
+            # Сеть, 429 после всех повторов шлюза и т.п.: сообщение о прогрессе
+            # не решает исход задачи — работа продолжается
+            log.warning("Job %s: progress edit failed: %s", self.id, e)
+        self._edited = time.monotonic()
+
+    async def progress(self, text: str, force: bool = False) -> None:
+        """Обновить сообщение о прогрессе (не чаще PROGRESS_MIN_INTERVAL)."""
+        self.text = text
+        if force or time.monotonic() - self._edited >= PROGRESS_MIN_INTERVAL:
+            await self._render(f"⏳ {self.title}\n{text}")
+
+    async def run_in_thread(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Блокирующая работа (файлы, сжатие) — в отдельном потоке."""
+        return await asyncio.to_thread(func, *args)
+
+
+JobFunc = Callable[[Job], Awaitable["str | None"]]
+
+
+class TaskRunner:
+    def __init__(self, history: int = JOBS_HISTORY) -> None:
+        self._ids = itertools.count(1)
+        self._running: dict[int, Job] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._history: deque[Job] = deque(maxlen=history)
+
+    def find_running(self, key: str) -> Job | None:
+        for job in self._running.values():
+            if job.key == key:
+                return job
+        return None
+
+    async def start(
+        self, bot: Bot, chat_id: int, title: str, func: JobFunc, key: str | None = None,
+    ) -> Job | None:
+        """
+        Запустить func(job) в фоне. Сразу отправляет сообщение «⏳ title…»,
+        которое потом редактируется. Если задача с тем же key уже идёт —
+        сообщает об этом и возвращает None.
+        """
+        if key is not None and (busy := self.find_running(key)) is not None:
+            await bot.send_message(chat_id, f"⏳ «{busy.title}» уже выполняется (задача #{busy.id}).")
+            return None
+        job = Job(id=next(self._ids), title=title, chat_id=chat_id, key=key, _bot=bot)
+        # Занять key до первого await: отправка может ждать в шлюзе исходящих,
+        # и повторное нажатие за это время не должно пройти проверку
+        self._running[job.id] = job
+        try:
+            msg = await bot.send_message(chat_id, f"⏳ {title}…")
+        except BaseException:
+            self._running.pop(job.id, None)
+            raise
+        job.message_id = msg.message_id
+        job._edited = time.monotonic()
+        task = asyncio.create_task(self._run(job, func), name=f"job-{job.id}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: Job, func: JobFunc) -> None:
+        try:
+            result = await func(job)
+            job.status = STATUS_DONE
+            job.text = result or job.text
+        except Exception as e:
+            log.exception("Job #%s (%s) failed", job.id, job.title)
+            job.status = STATUS_FAILED
+            job.error = str(e) or e.__class__.__name__
+        finally:
+            job.finished = time.monotonic()
+            self._running.pop(job.id, None)
+            self._history.append(job)
+        if job.status == STATUS_DONE:
+            text = f"✅ {job.title} — {job.duration:.1f} с"
+            if job.text:
+                text += f"\n{job.text}"
+        else:
+            text = f"❌ {job.title} — ошибка: {job.error}"
+        try:
+            await job._render(text)
+        except Exception as e:
+            log.warning("Job #%s: final edit failed: %s", job.id, e)
+
+    def running(self) -> list[Job]:
+        return list(self._running.values())
+
+    def finished(self) -> list[Job]:
+        return list(reversed(self._history))
+
+
+runner = TaskRunner()
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from app.config import settings
+
+log = logging.getLogger(__name__)
+
+# ====== Режим вебхука ======
+#
+# Telegram сам присылает апдейты POST-запросами на WEBHOOK_URL + WEBHOOK_PATH.
+# - запрос без правильного X-Telegram-Bot-Api-Secret-Token отклоняется (401);
+# - на запрос отвечаем сразу, апдейт обрабатывается в фоне;
+# - одновременно обрабатывается не больше WEBHOOK_MAX_INFLIGHT апдейтов,
+#   следующие запросы ждут свободного места — Telegram при этом притормаживает
+#   доставку, а не теряет апдейты.
+
+# Больше Telegram не даёт (max_connections для setWebhook)
+TELEGRAM_MAX_CONNECTIONS = 100
+
+
+def make_session() -> AiohttpSession | None:
+    """Сессия на свой адрес Bot API (TELEGRAM_API_URL), если он задан."""
+    if not settings.TELEGRAM_API_URL:
+        return None
+    return AiohttpSession(api=TelegramAPIServer.from_base(settings.TELEGRAM_API_URL))
+
+
+def webhook_secret(token: str) -> str:
+    """Секрет вебхука: из WEBHOOK_SECRET или стабильно выведенный из токена."""
+    if settings.WEBHOOK_SECRET:
+        return settings.WEBHOOK_SECRET
+    return hashlib.sha256(f"xmplus-webhook:{token}".encode()).hexdigest()
+
+
+class LimitedRequestHandler(SimpleRequestHandler):
+    """SimpleRequestHandler с ограничением числа апдейтов в обработке."""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, inflight: asyncio.Semaphore, **kwargs: Any) -> None:
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        # Один семафор на процесс — общий для всех ботов
+        self._inflight = inflight
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        # Место освобождает сама фоновая задача, когда апдейт обработан
+        await self._inflight.acquire()
+        try:
+            return await super()._handle_request_background(bot=bot, request=request)
+        except BaseException:
+            self._inflight.release()
+            raise
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        try:
+            await super()._background_feed_update(bot=bot, update=update)
+        finally:
+            self._inflight.release()
+
+
+def webhook_path(bot: Bot, main: bool) -> str:
+    """Путь вебхука: основной бот — WEBHOOK_PATH, боты дилеров — WEBHOOK_PATH/<bot id>."""
+    return settings.WEBHOOK_PATH if main else f"{settings.WEBHOOK_PATH.rstrip('/')}/{bot.id}"
+
+
+def build_app(dp: Dispatcher, bot: Bot, *dealer_bots: Bot) -> web.Application:
+    app = web.Application()
+    inflight = asyncio.Semaphore(max(1, settings.WEBHOOK_MAX_INFLIGHT))
+    for b in (bot, *dealer_bots):
+        LimitedRequestHandler(
+            dispatcher=dp,
+            bot=b,
+            inflight=inflight,
+            secret_token=webhook_secret(b.token),
+        ).register(app, path=webhook_path(b, b is bot))
+    # startup/shutdown диспетчера (в т.ч. закрытие FSM-хранилища) — вместе с сервером
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, *dealer_bots: Bot) -> None:
+    """Регистрирует вебхуки в Telegram и обслуживает их до остановки процесса."""
+    app = build_app(dp, bot, *dealer_bots)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+    await site.start()
+    for b in (bot, *dealer_bots):
+        url = settings.WEBHOOK_URL + webhook_path(b, b is bot)
+        await b.set_webhook(
+            url=url,
+            secret_token=webhook_secret(b.token),
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(settings.WEBHOOK_MAX_INFLIGHT, TELEGRAM_MAX_CONNECTIONS),
+        )
+        log.info("Webhook set to %s", url)
+    log.info("Listening on %s:%s", settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        # Вебхуки в Telegram не снимаем: апдейты подождут следующего запуска
+        await runner.cleanup()
+        for b in (bot, *dealer_bots):
+            await b.session.close()
@@ -0,0 +1,67 @@
+"""
+Сравнение двух прогонов benchmarks/run.py.
+
+    python -m benchmarks.compare benchmarks/results/100k-old.json benchmarks/results/100k-new.json
+    python -m benchmarks.compare old.json new.json --fail-above 1.2
+
+По каждому сценарию — медианы, их отношение (новое / старое) и число запросов
+к БД. С --fail-above код возврата 1, если хоть один сценарий медленнее порога.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any
+
+
+def _load(path: Path) -> dict[str, Any]:
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def compare(old: dict[str, Any], new: dict[str, Any]) -> list[tuple[str, float | None, float | None, float | None, str]]:
+    """(сценарий, старая медиана, новая медиана, отношение, запросы «было→стало»)."""
+    rows = []
+    for name in list(old["results"]) + [n for n in new["results"] if n not in old["results"]]:
+        a = old["results"].get(name)
+        b = new["results"].get(name)
+        ma = a["median"] if a else None
+        mb = b["median"] if b else None
+        ratio = mb / ma if ma and mb is not None else None
+        queries = f"{a['queries'] if a else '-'}→{b['queries'] if b else '-'}"
+        rows.append((name, ma, mb, ratio, queries))
+    return rows
+
+
+def _ms(value: float | None) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Сравнение двух прогонов бенчмарков")
+    parser.add_argument("old", type=Path)
+    parser.add_argument("new", type=Path)
+    parser.add_argument("--fail-above", type=float, help="порог отношения медиан (например, 1.2)")
+    args = parser.parse_args(argv)
+
+    old, new = _load(args.old), _load(args.new)
+    if old["meta"].get("rows") != new["meta"].get("rows"):
+        print("Внимание: прогоны на разных данных", old["meta"].get("rows"), new["meta"].get("rows"))
+    print(f"{'сценарий':<24} {'было, мс':>10} {'стало, мс':>10} {'×':>6}  запросы")
+    failed = []
+    for name, ma, mb, ratio, queries in compare(old, new):
+        mark = ""
+        if args.fail_above and ratio is not None and ratio > args.fail_above:
+            failed.append(name)
+            mark = "  ← медленнее"
+        ratio_s = "-" if ratio is None else f"{ratio:.2f}"
+        print(f"{name:<24} {_ms(ma):>10} {_ms(mb):>10} {ratio_s:>6}  {queries}{mark}")
+    if failed:
+        print(f"Медленнее порога {args.fail_above}: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,220 @@
+"""
+Сквозной нагрузочный прогон: настоящий app.main (диспетчер, шлюз исходящих,
+FSM, БД) против локальной замены Bot API (benchmarks/fake_api.py).
+
+    python -m benchmarks.e2e --dealers 200 --rounds 3
+    python -m benchmarks.e2e --dealers 50 --retry-after-rate 0.05 --forbidden-rate 0.01
+
+Каждый дилер — отдельный клиент: шлёт боту команды из --script по очереди и
+ждёт ответа на каждую (замкнутый цикл, как живой человек). Задержка — от
+постановки апдейта в очередь getUpdates до первого ответа в этот чат; пропускная
+способность — апдейтов в секунду за весь прогон. Итог — JSON с квантилями по
+каждой команде и счётчиками отправок (в т.ч. 429/403 от фейка). Ответ,
+пришедший после --timeout, засчитается следующей команде этого чата — если
+таймауты есть, цифры по командам неточны, таймаут стоит увеличить.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import signal
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from benchmarks.fake_api import FakeTelegram
+from benchmarks.generate import DATA_DIR
+from benchmarks.run import RESULTS_DIR, ROOT, _git_commit
+
+BOT_TOKEN = "100:e2e"
+OWNER_CHAT_ID = 1
+DEFAULT_SCRIPT = "/list,/balance,/renew,{userid},/cancel"
+STARTUP_TIMEOUT = 60.0
+
+
+def _ensure_db(items: int, dealers: int) -> Path:
+    path = DATA_DIR / f"e2e_{items}x{dealers}.db"
+    if not path.exists():
+        print(f"Генерирую {path}…", file=sys.stderr)
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.generate", "--items", str(items),
+             "--dealers", str(dealers), "--out", str(path)],
+            cwd=ROOT, check=True,
+        )
+    return path
+
+
+def _dealer_chats(db: Path, limit: int) -> list[tuple[int, int]]:
+    """(chat_id дилера, USERID одного из его клиентов) для первых limit дилеров."""
+    con = sqlite3.connect(db)
+    try:
+        rows = con.execute(
+            "SELECT d.chat_id, (SELECT i.user_id FROM items i WHERE i.dealer = d.code LIMIT 1) "
+            "FROM dealers d WHERE d.chat_id IS NOT NULL ORDER BY d.id LIMIT ?", (limit,),
+        ).fetchall()
+    finally:
+        con.close()
+    return [(chat, uid or 0) for chat, uid in rows]
+
+
+def _quantiles(values: list[float]) -> dict[str, float | int | None]:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    q = statistics.quantiles(values, n=100, method="inclusive") if len(values) > 1 else values * 99
+    return {
+        "count": len(values),
+        "p50": round(q[49], 4),
+        "p95": round(q[94], 4),
+        "p99": round(q[98], 4),
+        "max": round(values[-1], 4),
+    }
+
+
+async def _client(
+    api: FakeTelegram, chat_id: int, userid: int, script: list[str], rounds: int, timeout: float,
+    latencies: dict[str, list[float]], timeouts: dict[str, int],
+) -> None:
+    for _ in range(rounds):
+        for step in script:
+            text = step.format(userid=userid)
+            latency = await api.request(BOT_TOKEN, chat_id, text, timeout)
+            if latency is None:
+                timeouts[step] += 1
+            else:
+                latencies[step].append(latency)
+
+
+async def run(args: argparse.Namespace, chats: list[tuple[int, int]]) -> dict[str, Any]:
+    api = FakeTelegram(
+        port=args.port, retry_after_rate=args.retry_after_rate, retry_after=args.retry_after,
+        forbidden_rate=args.forbidden_rate,
+    )
+    await api.start()
+    # Импорт после настройки окружения: settings читаются один раз
+    from app.main import main as bot_main
+
+    bot_task = asyncio.create_task(bot_main(), name="bot")
+    started = time.monotonic()
+    while api.calls.get("getUpdates", 0) == 0:
+        if bot_task.done() or time.monotonic() - started > STARTUP_TIMEOUT:
+            await api.stop()
+            bot_task.result()
+            raise SystemExit("Бот не начал опрос getUpdates")
+        await asyncio.sleep(0.05)
+
+    script = [s.strip() for s in args.script.split(",") if s.strip()]
+    latencies: dict[str, list[float]] = defaultdict(list)
+    timeouts: dict[str, int] = defaultdict(int)
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _client(api, chat, uid, script, args.rounds, args.timeout, latencies, timeouts)
+        for chat, uid in chats
+    ))
+    elapsed = time.perf_counter() - started
+
+    # Остановка как при docker stop: aiogram ловит SIGTERM, гасит опрос и
+    # вызывает shutdown (отдаёт аренду ведущего, закрывает сессии и FSM)
+    signal.raise_signal(signal.SIGTERM)
+    await asyncio.wait_for(bot_task, STARTUP_TIMEOUT)
+    await api.stop()
+
+    answered = sum(len(v) for v in latencies.values())
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "updates": answered + sum(timeouts.values()),
+        "updates_per_second": round(answered / elapsed, 2) if elapsed else None,
+        "latency": _quantiles([x for v in latencies.values() for x in v]),
+        "by_command": {
+            step: {**_quantiles(latencies[step]), "timeouts": timeouts[step]} for step in script
+        },
+        "api": api.summary(),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Сквозной нагрузочный прогон бота на фейковом Bot API")
+    parser.add_argument("--dealers", type=int, default=200, help="сколько дилеров шлют команды одновременно")
+    parser.add_argument("--items", type=int, default=20_000, help="записей в сгенерированной базе")
+    parser.add_argument("--db", type=Path, help="готовая база (вместо генерации)")
+    parser.add_argument("--rounds", type=int, default=3, help="сколько раз каждый дилер проходит сценарий")
+    parser.add_argument("--script", default=DEFAULT_SCRIPT, help="команды через запятую; {userid} — клиент дилера")
+    parser.add_argument("--timeout", type=float, default=60.0, help="сколько ждать ответа на одну команду, с")
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="доля отправок, получающих 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответе 429, с")
+    parser.add_argument("--forbidden-rate", type=float, default=0.0, help="доля отправок, получающих 403")
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--out", type=Path, help=f"JSON с результатом (по умолчанию в {RESULTS_DIR})")
+    args = parser.parse_args(argv)
+
+    db = (args.db or _ensure_db(args.items, args.dealers)).resolve()
+    chats = _dealer_chats(db, args.dealers)
+    if len(chats) < args.dealers:
+        print(f"В базе только {len(chats)} дилеров с chat_id", file=sys.stderr)
+
+    workdir = Path(tempfile.mkdtemp(prefix="xmplus-e2e-"))
+    (workdir / "data").mkdir()
+    shutil.copyfile(db, workdir / "data" / "data.db")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite+aiosqlite:///{workdir / 'data' / 'data.db'}",
+        "BOT_TOKEN": BOT_TOKEN,
+        "OWNER_CHAT_ID": str(OWNER_CHAT_ID),
+        "BOT_MODE": "admin",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{args.port}",
+        "WEBHOOK_URL": "",
+        "HEALTH_PORT": "0",
+        # Фоновые задачи не должны вмешиваться в замер
+        "CHECK_INTERVAL_MINUTES": "1440",
+        "BACKUP_INTERVAL_HOURS": "0",
+        "BACKUP_INCREMENTAL_MINUTES": "0",
+    })
+    # Лог каждого апдейта от aiogram на такой нагрузке только мешает
+    logging.basicConfig(level=logging.WARNING)
+    cwd = Path.cwd()
+    os.chdir(workdir)
+    try:
+        results = asyncio.run(run(args, chats))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "db": db.name,
+            "dealers": len(chats),
+            "rounds": args.rounds,
+            "script": args.script,
+            "retry_after_rate": args.retry_after_rate,
+            "forbidden_rate": args.forbidden_rate,
+        },
+        "results": results,
+    }
+    out = args.out or RESULTS_DIR / f"e2e-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    lat = results["latency"]
+    print(
+        f"{results['updates']} апдейтов за {results['elapsed_seconds']} с "
+        f"({results['updates_per_second']}/с); задержка p50 {lat.get('p50')} / p95 {lat.get('p95')} / "
+        f"p99 {lat.get('p99')} с",
+        file=sys.stderr,
+    )
+    print(f"Результат: {out}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
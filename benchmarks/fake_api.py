@@ -0,0 +1,235 @@
+"""
+Локальная замена Telegram Bot API для нагрузочных прогонов (aiohttp).
+
+Бот подключается к ней как к своему серверу Bot API: TELEGRAM_API_URL=<url>
+(см. app/webhook.make_session). Сервер:
+- отдаёт getUpdates из сценария: апдейты кладёт push_message / request;
+- записывает каждое исходящее сообщение (sendMessage, sendDocument…) с
+  моментом отправки — по ним считаются задержка и пропускная способность;
+- по желанию отвечает 429 (retry_after) и 403 на доли запросов, чтобы
+  проверить повторы шлюза исходящих и обработку заблокированных чатов.
+
+Пример (см. benchmarks/e2e.py):
+
+    api = FakeTelegram(retry_after_rate=0.02)
+    await api.start()
+    latency = await api.request(token, chat_id, "/list")   # секунды или None
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Any
+
+from aiohttp import web
+
+# Долгий опрос на фейке — не дольше этого (aiogram просит 10 с)
+LONG_POLL_CAP = 1.0
+
+# Методы, которые возвращают Message (остальные — True)
+MESSAGE_METHODS = {
+    "sendMessage", "sendDocument", "sendPhoto",
+    "editMessageText", "editMessageReplyMarkup", "editMessageCaption",
+}
+# Исходящие сообщения пользователю — их пишем в журнал отправок
+SEND_METHODS = {"sendMessage", "sendDocument", "sendPhoto"}
+
+
+@dataclass
+class SentMessage:
+    at: float
+    token: str
+    method: str
+    chat_id: int
+    text: str
+    status: int
+
+
+class FakeTelegram:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8899,
+        retry_after_rate: float = 0.0,
+        retry_after: int = 1,
+        forbidden_rate: float = 0.0,
+        seed: int = 1,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.forbidden_rate = forbidden_rate
+        # Чаты, «заблокировавшие» бота: любая отправка в них — 403
+        self.blocked: set[int] = set()
+        self.sent: list[SentMessage] = []
+        self.calls: dict[str, int] = defaultdict(int)
+        self.injected: dict[int, int] = defaultdict(int)
+        self._rng = random.Random(seed)
+        self._updates: dict[str, deque[dict[str, Any]]] = defaultdict(deque)
+        self._wakeup: dict[str, asyncio.Event] = defaultdict(asyncio.Event)
+        self._next_update_id = 1
+        self._next_message_id = 1
+        # (token, chat_id) → ожидающие ответа запросы request(), по порядку
+        self._waiters: dict[tuple[str, int], deque[asyncio.Future]] = defaultdict(deque)
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    # ---- сценарий ----
+
+    def push_update(self, token: str, update: dict[str, Any]) -> int:
+        update_id = self._next_update_id
+        self._next_update_id += 1
+        self._updates[token].append({"update_id": update_id, **update})
+        self._wakeup[token].set()
+        return update_id
+
+    def push_message(self, token: str, chat_id: int, text: str) -> int:
+        return self.push_update(token, {"message": {
+            "message_id": self._message_id(),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+            "text": text,
+        }})
+
+    async def request(self, token: str, chat_id: int, text: str, timeout: float = 30.0) -> float | None:
+        """
+        Отправить боту сообщение и дождаться первого ответа в этот чат.
+        Задержка в секундах; None — ответа не было за timeout.
+        """
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        waiters = self._waiters[(token, chat_id)]
+        waiters.append(fut)
+        started = time.perf_counter()
+        self.push_message(token, chat_id, text)
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if fut in waiters:
+                waiters.remove(fut)
+        return fut.result() - started
+
+    # ---- HTTP ----
+
+    def _message_id(self) -> int:
+        mid = self._next_message_id
+        self._next_message_id += 1
+        return mid
+
+    def _error(self, status: int, description: str, **parameters: Any) -> web.Response:
+        self.injected[status] += 1
+        body: dict[str, Any] = {"ok": False, "error_code": status, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return web.json_response(body, status=status)
+
+    async def _get_updates(self, token: str, data: dict[str, Any]) -> list[dict[str, Any]]:
+        queue = self._updates[token]
+        offset = int(data.get("offset") or 0)
+        while queue and queue[0]["update_id"] < offset:
+            queue.popleft()
+        if not queue:
+            event = self._wakeup[token]
+            event.clear()
+            timeout = min(float(data.get("timeout") or 0), LONG_POLL_CAP)
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        limit = int(data.get("limit") or 100)
+        return list(queue)[:limit]
+
+    def _deliver(self, token: str, method: str, chat_id: int, text: str, status: int) -> None:
+        now = time.perf_counter()
+        self.sent.append(SentMessage(now, token, method, chat_id, text, status))
+        if status != 200:
+            return
+        waiters = self._waiters.get((token, chat_id))
+        while waiters:
+            fut = waiters.popleft()
+            if not fut.done():
+                fut.set_result(now)
+                break
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        token = request.match_info["token"]
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        data: dict[str, Any] = {}
+        if request.can_read_body:
+            if request.content_type == "application/json":
+                data = await request.json()
+            else:
+                data = {k: v for k, v in (await request.post()).items() if isinstance(v, str)}
+
+        if method == "getUpdates":
+            result: Any = await self._get_updates(token, data)
+        elif method == "getMe":
+            bot_id = int(token.split(":")[0])
+            result = {"id": bot_id, "is_bot": True, "first_name": f"bot{bot_id}", "username": f"bot{bot_id}"}
+        elif method == "getWebhookInfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        elif method in MESSAGE_METHODS:
+            chat_id = int(data.get("chat_id") or 0)
+            text = data.get("text") or data.get("caption") or ""
+            if method in SEND_METHODS:
+                if chat_id in self.blocked or (self.forbidden_rate and self._rng.random() < self.forbidden_rate):
+                    self._deliver(token, method, chat_id, text, 403)
+                    return self._error(403, "Forbidden: bot was blocked by the user")
+                if self.retry_after_rate and self._rng.random() < self.retry_after_rate:
+                    self._deliver(token, method, chat_id, text, 429)
+                    return self._error(
+                        429, f"Too Many Requests: retry after {self.retry_after}", retry_after=self.retry_after,
+                    )
+                self._deliver(token, method, chat_id, text, 200)
+            result = {
+                "message_id": int(data.get("message_id") or self._message_id()),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": text,
+            }
+            if isinstance(data.get("reply_markup"), str):
+                result["reply_markup"] = json.loads(data["reply_markup"])
+                if "inline_keyboard" not in result["reply_markup"]:
+                    # В Message бывает только inline-клавиатура
+                    del result["reply_markup"]
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self) -> None:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self) -> None:
+        for event in self._wakeup.values():
+            event.set()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    # ---- итоги ----
+
+    def summary(self) -> dict[str, Any]:
+        ok = [m for m in self.sent if m.status == 200]
+        span = (ok[-1].at - ok[0].at) if len(ok) > 1 else 0.0
+        return {
+            "sent_ok": len(ok),
+            "sent_429": sum(1 for m in self.sent if m.status == 429),
+            "sent_403": sum(1 for m in self.sent if m.status == 403),
+            "send_rate_per_second": round(len(ok) / span, 2) if span else None,
+            "calls": dict(self.calls),
+        }
@@ -0,0 +1,226 @@
+"""
+Синтетическая база для бенчмарков.
+
+    python -m benchmarks.generate --preset 100k
+    python -m benchmarks.generate --items 50000 --dealers 20 --out /tmp/bench.db
+
+Схема создаётся обычным init_db (со всеми миграциями и триггерами), данные
+пишутся пачками напрямую через sqlite3. Распределение похоже на боевое:
+несколько крупных дилеров и длинный хвост мелких, сроки ±90 дней от «сейчас»,
+большинство просроченных уже уведомлены, история баланса за год.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+# записи, дилеры
+PRESETS: dict[str, tuple[int, int]] = {
+    "10k": (10_000, 5),
+    "100k": (100_000, 50),
+    "500k": (500_000, 500),
+}
+
+# Доля записей без дилера («main»)
+MAIN_SHARE = 0.3
+# Роутеров — на каждые N записей
+ROUTERS_EVERY = 50
+# Операций по балансу на одного дилера — пропорционально его записям
+TXNS_PER_ITEM = 1.5
+PAYMENTS_PER_DEALER = 12
+BATCH = 10_000
+
+_NAMES = (
+    "anna", "bahar", "dmitry", "elena", "farid", "gulnara", "ivan", "jamal", "kerim", "lale",
+    "maral", "nazar", "oleg", "parahat", "ruslan", "selbi", "timur", "ulyana", "vepa", "yazgul",
+)
+_NOTES = ("", "", "", "офис", "дом", "роутер в зале", "продлевает сам", "оплата наличными", "VIP")
+_METHODS = ("ByBit", "YooMoney", "EnPara", "Наличные")
+
+
+def preset_path(preset: str) -> Path:
+    return DATA_DIR / f"bench_{preset}.db"
+
+
+def _ts(dt: datetime) -> str:
+    # Формат, в котором SQLAlchemy хранит DateTime в SQLite
+    return dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _dealer_weights(n: int) -> list[float]:
+    # Закон Ципфа: первый дилер в разы крупнее последнего
+    return [1.0 / (rank + 1) for rank in range(n)]
+
+
+def _drop_journal_triggers(con: sqlite3.Connection) -> None:
+    from app.db import JOURNAL_TRIGGER_SUFFIX
+
+    names = [r[0] for r in con.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE ?",
+        (f"%{JOURNAL_TRIGGER_SUFFIX}%",),
+    )]
+    for name in names:
+        con.execute(f"DROP TRIGGER {name}")
+
+
+def _fill(con: sqlite3.Connection, items: int, dealers: int, rng: random.Random) -> dict[str, int]:
+    from app.db import PRICE_KEY
+
+    now = datetime.now().replace(microsecond=0)
+    now_s = _ts(now)
+    codes = [f"d{i:03d}" for i in range(1, dealers + 1)]
+
+    # Записи
+    weights = _dealer_weights(dealers)
+    per_dealer: dict[str, int] = dict.fromkeys(codes, 0)
+    rows = []
+    for i in range(items):
+        dealer = "main" if rng.random() < MAIN_SHARE else rng.choices(codes, weights)[0]
+        if dealer != "main":
+            per_dealer[dealer] += 1
+        due = now + timedelta(minutes=rng.randint(-90 * 24 * 60, 90 * 24 * 60))
+        if due <= now:
+            # Почти все просроченные уже получили оба уведомления
+            notified = 2 if rng.random() < 0.98 else rng.choice((0, 1))
+        elif due - now <= timedelta(hours=3):
+            notified = rng.choice((0, 1))
+        else:
+            notified = 0
+        rows.append((
+            100_000 + i, f"{rng.choice(_NAMES)}_{rng.randint(1, 99_999)}", _ts(due), dealer,
+            rng.choice(_NOTES), notified, now_s,
+        ))
+        if len(rows) >= BATCH:
+            con.executemany(
+                "INSERT INTO items (user_id, username, due_date, dealer, note, notified_count, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows,
+            )
+            rows.clear()
+    if rows:
+        con.executemany(
+            "INSERT INTO items (user_id, username, due_date, dealer, note, notified_count, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", rows,
+        )
+
+    # Роутеры
+    routers = [
+        (f"router_{i}", _ts(now + timedelta(hours=rng.randint(-60 * 24, 60 * 24))), rng.choice(_NOTES),
+         2 if rng.random() < 0.5 else 0, now_s)
+        for i in range(max(1, items // ROUTERS_EVERY))
+    ]
+    con.executemany(
+        "INSERT INTO routers (client_name, due_date, note, notified_count, updated_at) VALUES (?, ?, ?, ?, ?)",
+        routers,
+    )
+
+    # История баланса: продления (+) и оплаты (−); баланс дилера = сумма операций
+    price = 5.0
+    txns = 0
+    payments = []
+    dealer_rows = []
+    for n, code in enumerate(codes, 1):
+        balance = 0.0
+        batch = []
+        for _ in range(int(per_dealer[code] * TXNS_PER_ITEM) + 1):
+            at = _ts(now - timedelta(minutes=rng.randint(0, 365 * 24 * 60)))
+            if rng.random() < 0.85:
+                amount, kind, comment = price, "renewal", f"Продление USERID={rng.randint(100_000, 100_000 + items)}"
+            else:
+                amount, kind, comment = -round(rng.uniform(10, 200), 2), "payment", "Оплата подтверждена"
+            balance += amount
+            batch.append((code, amount, kind, comment, at))
+        con.executemany(
+            "INSERT INTO balance_txns (dealer_code, amount, kind, comment, created_at) VALUES (?, ?, ?, ?, ?)",
+            batch,
+        )
+        txns += len(batch)
+        dealer_rows.append((code, f"Дилер {n}", 10_000_000 + n, round(balance, 2), now_s))
+        for _ in range(PAYMENTS_PER_DEALER):
+            at = _ts(now - timedelta(minutes=rng.randint(0, 365 * 24 * 60)))
+            status = rng.choices(("confirmed", "rejected", "pending"), (0.85, 0.1, 0.05))[0]
+            payments.append((code, rng.choice(_METHODS), None, round(rng.uniform(10, 200), 2), status, at, at))
+    con.executemany(
+        "INSERT INTO dealers (code, title, chat_id, balance, updated_at) VALUES (?, ?, ?, ?, ?)", dealer_rows,
+    )
+    con.executemany(
+        "INSERT INTO payments (dealer_code, method, variant, amount, status, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)", payments,
+    )
+    con.executemany(
+        "INSERT INTO payment_methods (name, requisites, active) VALUES (?, ?, 1)",
+        [(m, f"Реквизиты {m}") for m in _METHODS],
+    )
+    con.execute("INSERT OR REPLACE INTO app_settings (key, value) VALUES (?, ?)", (PRICE_KEY, f"{price:g}"))
+    return {
+        "items": items, "dealers": dealers, "routers": len(routers),
+        "balance_txns": txns, "payments": len(payments),
+    }
+
+
+def generate(path: Path, items: int, dealers: int, seed: int = 1) -> dict[str, int]:
+    """
+    Создать базу в path (существующий файл перезаписывается). Вызывать в
+    отдельном процессе: app.db привязывает engine к DATABASE_URL при импорте.
+    """
+    path = path.resolve()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{path}"
+
+    from app.db import init_db, engine
+
+    async def _schema() -> None:
+        await init_db()
+        await engine.dispose()
+
+    asyncio.run(_schema())
+    con = sqlite3.connect(path)
+    try:
+        # Журнал изменений при заливке не нужен: триггеры вернёт повторный init_db
+        _drop_journal_triggers(con)
+        with con:
+            counts = _fill(con, items, dealers, random.Random(seed))
+    finally:
+        con.close()
+    asyncio.run(_schema())
+    con = sqlite3.connect(path)
+    try:
+        con.execute("DELETE FROM change_journal")
+        con.commit()
+        con.execute("VACUUM")
+    finally:
+        con.close()
+    return counts
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Синтетическая база для бенчмарков")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="10k")
+    parser.add_argument("--items", type=int, help="число записей (вместо пресета)")
+    parser.add_argument("--dealers", type=int, help="число дилеров (вместо пресета)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", type=Path, help=f"файл базы (по умолчанию {DATA_DIR}/bench_<preset>.db)")
+    args = parser.parse_args(argv)
+
+    items, dealers = PRESETS[args.preset]
+    items = args.items or items
+    dealers = args.dealers or dealers
+    out = args.out or preset_path(args.preset)
+    started = time.monotonic()
+    counts = generate(out, items, dealers, args.seed)
+    print(f"{out}: {counts} за {time.monotonic() - started:.1f} с", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
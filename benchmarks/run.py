@@ -0,0 +1,316 @@
+"""
+Бенчмарки горячих путей бота на синтетической базе (см. benchmarks/generate.py).
+
+    python -m benchmarks.run --preset 100k
+    python -m benchmarks.run --preset 500k --only list,search_text --repeat 3
+    python -m benchmarks.run --db /tmp/bench.db --out result.json
+
+Каждый сценарий вызывает настоящий код бота (обработчики, задачи, экспорт)
+с поддельными Bot/Message: сеть не нужна, ответы только считаются. Работа
+идёт на копии базы во временном каталоге; сценарии, которые меняют данные
+(check_expiries), перед каждым повтором получают свежую копию. Результат —
+JSON со временем (min/медиана/max), числом запросов к БД и метаданными
+(коммит, версии, объём данных); два таких файла сравнивает benchmarks/compare.py.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable
+
+from benchmarks.generate import PRESETS, preset_path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+OWNER_CHAT_ID = 1
+
+
+# ====== Подделки aiogram ======
+
+class FakeBot:
+    """Bot без сети: send_message только считается."""
+
+    id = 1
+
+    def __init__(self) -> None:
+        self.sent = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs: Any) -> SimpleNamespace:
+        self.sent += 1
+        return SimpleNamespace(chat=SimpleNamespace(id=chat_id), text=text)
+
+
+class FakeMessage:
+    """Message с answer/answer_document: считает сообщения и байты документов."""
+
+    def __init__(self, text: str = "", user_id: int = OWNER_CHAT_ID) -> None:
+        self.text = text
+        self.from_user = SimpleNamespace(id=user_id)
+        self.chat = SimpleNamespace(id=user_id)
+        self.answers = 0
+        self.documents = 0
+
+    async def answer(self, text: str, **kwargs: Any) -> SimpleNamespace:
+        self.answers += 1
+        return SimpleNamespace(text=text)
+
+    async def answer_document(self, document: Any, **kwargs: Any) -> SimpleNamespace:
+        self.documents += 1
+        return SimpleNamespace(document=document)
+
+
+class FakeState:
+    async def clear(self) -> None:
+        pass
+
+
+# ====== Сценарии ======
+
+@dataclass
+class Bench:
+    name: str
+    run: Callable[[], Awaitable[dict[str, Any]]]
+    # Меняет данные — перед каждым повтором нужна свежая копия базы
+    mutates: bool = False
+
+
+@dataclass
+class BenchResult:
+    runs: list[float] = field(default_factory=list)
+    queries: int = 0
+    extra: dict[str, Any] = field(default_factory=dict)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "min": min(self.runs),
+            "median": statistics.median(self.runs),
+            "max": max(self.runs),
+            "runs": self.runs,
+            "queries": self.queries,
+            **self.extra,
+        }
+
+
+def _benches(workdir: Path) -> list[Bench]:
+    from app.backup import create_backup
+    from app.bot import edit_search, on_list
+    from app.export import export_items_csv, items_export_query
+    from app.forecast import forecast_text, get_forecast, invalidate_forecast
+    from app.handlers.dealers import dealers_counts_text
+    from app.handlers.payments import balance_overview_text
+    from app.jobs import check_expiries
+
+    async def b_check_expiries() -> dict[str, Any]:
+        bot = FakeBot()
+        await check_expiries(bot)
+        return {"sent": bot.sent}
+
+    async def b_list() -> dict[str, Any]:
+        msg = FakeMessage("/list")
+        await on_list(msg)
+        return {"messages": msg.answers, "documents": msg.documents}
+
+    async def b_export_csv() -> dict[str, Any]:
+        doc, count = await export_items_csv(items_export_query(), "clients_export.csv")
+        doc.close()
+        return {"rows": count}
+
+    def search(text: str) -> Callable[[], Awaitable[dict[str, Any]]]:
+        async def b_search() -> dict[str, Any]:
+            msg = FakeMessage(text)
+            await edit_search(msg, FakeState())
+            return {"messages": msg.answers}
+        return b_search
+
+    async def b_dealers_counts() -> dict[str, Any]:
+        return {"chars": len(await dealers_counts_text())}
+
+    async def b_balance_overview() -> dict[str, Any]:
+        return {"chars": len(await balance_overview_text())}
+
+    async def b_forecast() -> dict[str, Any]:
+        # Без кэша: замеряем сам агрегирующий запрос
+        invalidate_forecast()
+        fc = await get_forecast()
+        return {"chars": len(forecast_text(fc, {})), "due": fc.due_total}
+
+    async def b_backup() -> dict[str, Any]:
+        zip_path = workdir / "bench_backup.zip"
+        await create_backup(zip_path)
+        size = zip_path.stat().st_size
+        zip_path.unlink()
+        return {"zip_bytes": size}
+
+    return [
+        Bench("check_expiries", b_check_expiries, mutates=True),
+        Bench("list", b_list),
+        Bench("export_csv", b_export_csv),
+        Bench("search_text", search("anna")),
+        Bench("search_userid", search("100500")),
+        Bench("dealers_counts_text", b_dealers_counts),
+        Bench("balance_overview_text", b_balance_overview),
+        Bench("forecast_text", b_forecast),
+        # Бэкап пишет отметку в app_settings и чистит журнал — тоже на свежей копии
+        Bench("backup_create", b_backup, mutates=True),
+    ]
+
+
+# ====== Запуск ======
+
+async def _restore(pristine: Path, work_db: Path) -> None:
+    from app.db import engine
+
+    await engine.dispose()
+    for suffix in ("-wal", "-shm", "-journal"):
+        Path(f"{work_db}{suffix}").unlink(missing_ok=True)
+    shutil.copyfile(pristine, work_db)
+
+
+async def _measure(bench: Bench, repeat: int, warmup: int, pristine: Path, work_db: Path) -> BenchResult:
+    from app.perf import _current, _UpdateStats
+
+    result = BenchResult()
+    for i in range(warmup + repeat):
+        if bench.mutates:
+            await _restore(pristine, work_db)
+        stats = _UpdateStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            extra = await bench.run()
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+        if i >= warmup:
+            result.runs.append(round(elapsed, 6))
+            result.queries = stats.queries
+            result.extra = extra
+    return result
+
+
+def _row_counts(db: Path) -> dict[str, int]:
+    con = sqlite3.connect(db)
+    try:
+        return {
+            table: con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("items", "dealers", "routers", "balance_txns", "payments")
+        }
+    finally:
+        con.close()
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _ensure_db(preset: str) -> Path:
+    path = preset_path(preset)
+    if not path.exists():
+        print(f"Генерирую {path}…", file=sys.stderr)
+        # Отдельный процесс: генератору нужен свой DATABASE_URL до импорта app.db
+        subprocess.run([sys.executable, "-m", "benchmarks.generate", "--preset", preset], cwd=ROOT, check=True)
+    return path
+
+
+async def run(db: Path, names: list[str] | None, repeat: int, warmup: int, workdir: Path) -> dict[str, Any]:
+    from app.db import engine
+    from app.perf import instrument_engine
+
+    work_db = workdir / "data" / "data.db"
+    instrument_engine(engine.sync_engine)
+    benches = _benches(workdir)
+    if names:
+        unknown = set(names) - {b.name for b in benches}
+        if unknown:
+            raise SystemExit(f"Неизвестные сценарии: {', '.join(sorted(unknown))}")
+        benches = [b for b in benches if b.name in names]
+
+    results: dict[str, Any] = {}
+    for bench in benches:
+        await _restore(db, work_db)
+        res = await _measure(bench, repeat, warmup, db, work_db)
+        results[bench.name] = res.as_dict()
+        print(
+            f"{bench.name:<24} median {res.as_dict()['median'] * 1000:9.1f} мс  "
+            f"min {min(res.runs) * 1000:9.1f} мс  запросов {res.queries}",
+            file=sys.stderr,
+        )
+    await engine.dispose()
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарки горячих путей бота")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="10k")
+    parser.add_argument("--db", type=Path, help="готовая база (вместо пресета)")
+    parser.add_argument("--only", help="сценарии через запятую")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--out", type=Path, help=f"JSON с результатом (по умолчанию в {RESULTS_DIR})")
+    args = parser.parse_args(argv)
+
+    db = (args.db or _ensure_db(args.preset)).resolve()
+    label = db.stem if args.db else args.preset
+    workdir = Path(tempfile.mkdtemp(prefix="xmplus-bench-"))
+    (workdir / "data").mkdir()
+    # До импорта app: настройки читаются из окружения один раз
+    os.environ.update({
+        "DATABASE_URL": f"sqlite+aiosqlite:///{workdir / 'data' / 'data.db'}",
+        "BOT_TOKEN": os.environ.get("BOT_TOKEN", "1:bench"),
+        "OWNER_CHAT_ID": str(OWNER_CHAT_ID),
+        "BOT_MODE": "admin",
+        "SLOW_QUERY_MS": "0",
+    })
+    cwd = Path.cwd()
+    os.chdir(workdir)  # BACKUP_DIR и прочие относительные пути — внутри workdir
+    try:
+        names = [n.strip() for n in args.only.split(",")] if args.only else None
+        results = asyncio.run(run(db, names, args.repeat, args.warmup, workdir))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "label": label,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+            "rows": _row_counts(db),
+        },
+        "results": results,
+    }
+    out = args.out or RESULTS_DIR / f"{label}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Результат: {out}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# Тесты не трогают ./data/data.db: на весь прогон — своя временная база
+# (задаётся до первого импорта app.config, см. tests/dbcase.py)
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='xmplus-tests-'), 'data.db')}",
+)
@@ -0,0 +1,30 @@
+"""Базовый класс для тестов, которым нужна настоящая база SQLite."""
+
+from __future__ import annotations
+
+import os
+import unittest
+from pathlib import Path
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from app.db import engine, init_db, invalidate_caches  # noqa: E402
+
+DB_PATH = Path(engine.url.database)
+
+
+class DbTestCase(unittest.IsolatedAsyncioTestCase):
+    """Каждый тест начинается с пустой базы: файл удаляется, схема создаётся init_db."""
+
+    async def asyncSetUp(self) -> None:
+        await engine.dispose()
+        for suffix in ("", "-journal", "-wal", "-shm"):
+            Path(f"{DB_PATH}{suffix}").unlink(missing_ok=True)
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        await init_db()
+        invalidate_caches()
+
+    async def asyncTearDown(self) -> None:
+        # Соединения пула привязаны к циклу событий теста
+        await engine.dispose()
@@ -0,0 +1,101 @@
+"""Тесты для ротации автоматических бэкапов (gfs_keep) и манифеста архивов."""
+
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from app import backup  # noqa: E402
+from app.backup import gfs_keep  # noqa: E402
+
+
+class TestGfsKeep(unittest.TestCase):
+    def setUp(self):
+        # Бэкап каждые 6 часов за 60 дней
+        end = datetime(2025, 3, 1, 18, 0)
+        self.stamps = [end - timedelta(hours=6 * i) for i in range(60 * 4)]
+        self.newest = end
+
+    def test_newest_always_kept(self):
+        self.assertEqual(gfs_keep(self.stamps, 0, 0, 0), {self.newest})
+
+    def test_hourly(self):
+        keep = gfs_keep(self.stamps, 3, 0, 0)
+        self.assertEqual(sorted(keep, reverse=True), self.stamps[:3])
+
+    def test_daily_keeps_newest_of_each_day(self):
+        keep = gfs_keep(self.stamps, 0, 3, 0)
+        self.assertEqual(
+            sorted(keep, reverse=True),
+            [datetime(2025, 3, 1, 18), datetime(2025, 2, 28, 18), datetime(2025, 2, 27, 18)],
+        )
+
+    def test_weekly(self):
+        keep = gfs_keep(self.stamps, 0, 0, 4)
+        self.assertEqual(len(keep), 4)
+        weeks = {d.isocalendar()[:2] for d in keep}
+        self.assertEqual(len(weeks), 4)
+
+    def test_tiers_combined(self):
+        keep = gfs_keep(self.stamps, 24, 7, 4)
+        # 24 последних + дни/недели, не попавшие в почасовое окно
+        self.assertTrue(set(self.stamps[:24]) <= keep)
+        self.assertLess(len(keep), 24 + 7 + 4)
+        # самый старый — последний бэкап четвёртой недели назад (воскресенье)
+        self.assertEqual(min(keep), datetime(2025, 2, 9, 18))
+
+    def test_empty(self):
+        self.assertEqual(gfs_keep([], 5, 5, 5), set())
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp(prefix="xmplus-manifest-"))
+        self.addCleanup(shutil.rmtree, self.dir, True)
+        for name, value in (("BACKUP_DIR", self.dir), ("MANIFEST_PATH", self.dir / "manifest.json")):
+            patcher = mock.patch.object(backup, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _archive(self, ts: str) -> str:
+        name = f"{backup.BACKUP_PREFIX}{ts}.zip"
+        with zipfile.ZipFile(self.dir / name, "w") as zf:
+            zf.writestr(backup.ARCHIVE_DB, b"")
+        return name
+
+    def test_reconciles_with_directory(self):
+        first = self._archive("20260101_000000")
+        self.assertEqual(list(backup.load_manifest()), [first])
+
+        # Архивы положили и удалили руками, мимо бота
+        second = self._archive("20260102_000000")
+        (self.dir / first).unlink()
+        backups = backup.load_manifest()
+        self.assertEqual(list(backups), [second])
+        self.assertEqual(backups[second]["kind"], backup.KIND_FULL)
+        self.assertEqual(backups[second]["sha256"], backup._sha256(self.dir / second))
+
+        # Сверка записана в файл: следующий список не сканирует заново
+        with mock.patch.object(backup, "_scan_archive") as scan:
+            self.assertEqual(list(backup.load_manifest()), [second])
+        scan.assert_not_called()
+
+    def test_keeps_known_entries(self):
+        name = self._archive("20260101_000000")
+        backup.load_manifest()
+        backup.set_manifest_file_id(name, "file-1")
+        self._archive("20260102_000000")
+        self.assertEqual(backup.load_manifest()[name]["file_id"], "file-1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+"""Тесты для сборки каталога методов и видов оплаты."""
+
+from __future__ import annotations
+
+import os
+import unittest
+from types import SimpleNamespace
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from app.catalog import PaymentCatalog  # noqa: E402
+
+
+def _m(id, name, active=True):
+    return SimpleNamespace(id=id, name=name, requisites=None, active=active)
+
+
+def _v(id, method_id, name, active=True):
+    return SimpleNamespace(id=id, method_id=method_id, name=name, requisites="r", active=active)
+
+
+class TestPaymentCatalog(unittest.TestCase):
+    def setUp(self):
+        crypto, cash = _m(1, "Крипта"), _m(2, "Наличные", active=False)
+        # Строки LEFT JOIN: метод повторяется для каждого вида, без видов — (метод, None)
+        self.cat = PaymentCatalog.build([
+            (crypto, _v(10, 1, "TRC-20")),
+            (crypto, _v(11, 1, "BEP-20", active=False)),
+            (cash, None),
+        ])
+
+    def test_methods_keep_order_and_group_variants(self):
+        self.assertEqual([m.name for m in self.cat.methods], ["Крипта", "Наличные"])
+        self.assertEqual([v.name for v in self.cat.methods[0].variants], ["TRC-20", "BEP-20"])
+        self.assertEqual(self.cat.methods[1].variants, ())
+
+    def test_lookup_by_id(self):
+        self.assertEqual(self.cat.method_by_id[2].name, "Наличные")
+        self.assertEqual(self.cat.variant_by_id[11].method_id, 1)
+        self.assertIsNone(self.cat.variant_by_id.get(99))
+
+    def test_empty_requisites_become_strings(self):
+        self.assertEqual(self.cat.methods[0].requisites, "")
+
+    def test_immutable(self):
+        with self.assertRaises(Exception):
+            self.cat.methods[0].name = "x"
+        with self.assertRaises(TypeError):
+            self.cat.method_by_id[3] = self.cat.methods[0]
+
+    def test_empty(self):
+        self.assertEqual(PaymentCatalog.build([]).methods, ())
+
+
+if __name__ == "__main__":
+    unittest.main()
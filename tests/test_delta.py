@@ -0,0 +1,84 @@
+"""Тесты для выгрузки изменений (/delta): курсор и удаления."""
+
+from __future__ import annotations
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from sqlalchemy import delete, update  # noqa: E402
+
+from app import export  # noqa: E402
+from app.db import SessionLocal, Item, Tombstone  # noqa: E402
+from tests.dbcase import DbTestCase  # noqa: E402
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+async def _delta(since):
+    doc, count, cursor = await export.export_delta_jsonl(since, gzip_output=False)
+    try:
+        doc.fp.seek(0)
+        lines = [json.loads(line) for line in doc.fp.read().decode("utf-8").splitlines()]
+    finally:
+        doc.close()
+    assert len(lines) == count
+    return lines, cursor
+
+
+class TestDeltaCursor(DbTestCase):
+    async def _add(self, user_id: int, updated_at: datetime) -> int:
+        async with SessionLocal() as session:
+            it = Item(user_id=user_id, username=f"u{user_id}", due_date=datetime(2030, 1, 1), updated_at=updated_at)
+            session.add(it)
+            await session.commit()
+            return it.id
+
+    async def test_round_trip_does_not_skip_late_rows(self):
+        await self._add(1, _utcnow() - timedelta(minutes=1))
+        # Изменение «в полёте»: метка свежее границы выгрузки
+        late = await self._add(2, _utcnow())
+        lines, cursor = await _delta(None)
+        self.assertEqual([r["row"]["user_id"] for r in lines], [1])
+        self.assertLess(cursor, _utcnow())
+
+        with mock.patch.object(export, "DELTA_SETTLE_SECONDS", 0):
+            lines, cursor2 = await _delta(cursor)
+        self.assertEqual([(r["op"], r["row"]["id"]) for r in lines], [("upsert", late)])
+        self.assertGreater(cursor2, cursor)
+
+        # Повторная выгрузка с тем же курсором ничего не теряет и не дублирует
+        with mock.patch.object(export, "DELTA_SETTLE_SECONDS", 0):
+            lines, cursor3 = await _delta(cursor2)
+        self.assertEqual(lines, [])
+        self.assertGreaterEqual(cursor3, cursor2)
+
+    async def test_updates_and_deletes(self):
+        first = await self._add(1, _utcnow() - timedelta(minutes=2))
+        second = await self._add(2, _utcnow() - timedelta(minutes=2))
+        _, cursor = await _delta(None)
+        async with SessionLocal() as session:
+            await session.execute(update(Item).where(Item.id == first).values(username="renamed"))
+            await session.execute(delete(Item).where(Item.id == second))
+            await session.commit()
+        with mock.patch.object(export, "DELTA_SETTLE_SECONDS", 0):
+            lines, _ = await _delta(cursor)
+        by_op = {r["op"]: r for r in lines}
+        self.assertEqual(by_op["upsert"]["row"]["username"], "renamed")
+        self.assertEqual((by_op["delete"]["table"], by_op["delete"]["id"]), ("items", second))
+
+    async def test_expired_cursor_and_pruning(self):
+        with self.assertRaises(export.DeltaCursorExpired):
+            await _delta(_utcnow() - timedelta(days=export.settings.DELTA_KEEP_DAYS + 1))
+        async with SessionLocal() as session:
+            session.add(Tombstone(table_name="items", row_id=1, deleted_at=_utcnow() - timedelta(days=400)))
+            session.add(Tombstone(table_name="items", row_id=2, deleted_at=_utcnow()))
+            await session.commit()
+        self.assertEqual(await export.prune_tombstones(30), 1)
+        self.assertEqual(await export.prune_tombstones(30), 0)
@@ -0,0 +1,54 @@
+"""Тесты для прогноза продлений."""
+
+from __future__ import annotations
+
+import os
+import unittest
+from datetime import date
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from app.forecast import build_forecast, forecast_text  # noqa: E402
+
+START = date(2026, 10, 19)
+
+
+class TestBuildForecast(unittest.TestCase):
+    def setUp(self):
+        self.fc = build_forecast([
+            # (дилер, день, истекает) и (дилер, None, продлений)
+            ("d1", "2026-10-19", 4),
+            ("d1", "2026-10-21", 2),
+            ("d1", "2026-10-10", 1),   # истёк и не продлён
+            ("d1", "2026-10-25", 9),   # за горизонтом
+            ("d1", None, 3),
+            ("d2", "2026-10-20", 5),   # своей истории нет
+        ], START, days=3, price=5.0)
+
+    def test_due_by_day(self):
+        d1, d2 = self.fc.dealers
+        self.assertEqual(d1.due, (4, 0, 2))
+        self.assertEqual(d2.due, (0, 5, 0))
+
+    def test_rates(self):
+        d1, d2 = self.fc.dealers
+        self.assertAlmostEqual(d1.rate, 0.75)
+        # Без истории — средняя доля по всем дилерам
+        self.assertAlmostEqual(d2.rate, 0.75)
+        self.assertAlmostEqual(self.fc.expected, 11 * 0.75)
+
+    def test_no_history_assumes_renewal(self):
+        fc = build_forecast([("d1", "2026-10-19", 2)], START, days=1, price=5.0)
+        self.assertEqual(fc.dealers[0].rate, 1.0)
+
+    def test_text(self):
+        text = forecast_text(self.fc, {"d1": "Первый"})
+        self.assertIn("Истекает: 11", text)
+        self.assertIn("19.10", text)
+        self.assertIn("Первый: 6", text)
+        self.assertIn("Истечений в этот период нет", forecast_text(self.fc, {}, "d3"))
+
+
+if __name__ == "__main__":
+    unittest.main()
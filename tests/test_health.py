@@ -0,0 +1,67 @@
+"""Тесты для /health: проверка уведомлений после смены ведущего."""
+
+from __future__ import annotations
+
+import os
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from app import health  # noqa: E402
+
+HOUR = 3600.0
+
+
+class TestNotifierCheck(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.state = health.HealthState()
+        # Реплика работает давно: стартовая отсрочка позади
+        self.state.started = time.monotonic() - 10 * HOUR
+        self.lease = SimpleNamespace(is_leader=lambda: True, leader_since=None)
+        for target, name, value in (
+            (health, "health", self.state),
+            (health, "lease", self.lease),
+            (health, "_db_roundtrip", mock.AsyncMock(return_value=0.001)),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def _notifier(self) -> bool:
+        return (await health.collect())["checks"]["notifier"]
+
+    async def test_new_leader_gets_grace(self):
+        # Резерв только что взял аренду и ещё ни разу не проходил уведомления
+        self.lease.leader_since = time.monotonic() - 5
+        self.assertTrue(await self._notifier())
+        self.lease.leader_since = time.monotonic() - 10 * HOUR
+        self.assertFalse(await self._notifier())
+
+    async def test_stale_run_from_previous_term(self):
+        self.state.notifier_done(0.1, True)
+        self.state.notifier_finished = time.monotonic() - 5 * HOUR
+        # Аренду потеряли и снова получили: старый проход не в счёт
+        self.lease.leader_since = time.monotonic() - 5
+        self.assertTrue(await self._notifier())
+
+    async def test_runs_during_term(self):
+        self.lease.leader_since = time.monotonic() - 5 * HOUR
+        self.state.notifier_done(0.1, True)
+        self.assertTrue(await self._notifier())
+        self.state.notifier_finished = time.monotonic() - 4 * HOUR
+        self.assertFalse(await self._notifier())
+        self.state.notifier_done(0.1, False)
+        self.assertFalse(await self._notifier())
+
+    async def test_lease_disabled_counts_from_start(self):
+        self.assertFalse(await self._notifier())
+        self.state.started = time.monotonic() - 5
+        self.assertTrue(await self._notifier())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Тесты для инкрементальных бэкапов: полный бэкап → изменения → инкремент → восстановление."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from sqlalchemy import delete, update  # noqa: E402
+
+from app import backup  # noqa: E402
+from app.db import SessionLocal, Dealer, Item, apply_balance_change  # noqa: E402
+from tests.dbcase import DB_PATH, DbTestCase  # noqa: E402
+
+FULL = "xmplus_backup_20260101_000000.zip"
+INC = "xmplus_backup_20260101_010000_inc.zip"
+
+
+def _dump(db: Path) -> dict[str, list[tuple]]:
+    conn = sqlite3.connect(db)
+    try:
+        return {
+            "items": conn.execute("SELECT id, user_id, username, dealer FROM items ORDER BY id").fetchall(),
+            "dealers": conn.execute("SELECT id, code, balance FROM dealers ORDER BY id").fetchall(),
+            "balance_txns": conn.execute("SELECT id, dealer_code, amount, kind FROM balance_txns ORDER BY id").fetchall(),
+        }
+    finally:
+        conn.close()
+
+
+class TestIncrementalBackup(DbTestCase):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.dir = Path(tempfile.mkdtemp(prefix="xmplus-backups-"))
+        self.addCleanup(shutil.rmtree, self.dir, True)
+        for name, value in (("BACKUP_DIR", self.dir), ("MANIFEST_PATH", self.dir / "manifest.json")):
+            patcher = mock.patch.object(backup, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        async with SessionLocal() as session:
+            session.add(Dealer(code="d1", title="Первый"))
+            session.add_all([
+                Item(user_id=1, username="one", due_date=datetime(2030, 1, 1), dealer="d1"),
+                Item(user_id=2, username="two", due_date=datetime(2030, 1, 1), dealer="d1"),
+            ])
+            await session.commit()
+        await backup.create_backup(self.dir / FULL)
+
+    async def _change(self) -> None:
+        async with SessionLocal() as session:
+            await session.execute(update(Item).where(Item.user_id == 1).values(username="renamed"))
+            await session.execute(delete(Item).where(Item.user_id == 2))
+            session.add(Item(user_id=3, username="three", due_date=datetime(2030, 2, 1), dealer="d1"))
+            await session.commit()
+        await apply_balance_change("d1", 5.0, "renewal", "Продление: USERID=1")
+
+    async def test_restore_incremental_matches_live_db(self):
+        await self._change()
+        rows = await backup.create_incremental_backup(self.dir / INC)
+        self.assertGreater(rows, 0)
+        self.assertEqual(backup.load_manifest()[INC]["base"], FULL)
+
+        restored = self.dir / "restored.db"
+        meta = await asyncio.to_thread(backup.build_restored_db, self.dir / INC, restored)
+        self.assertEqual(meta["kind"], backup.KIND_INCREMENTAL)
+        self.assertEqual(meta["replayed"], rows)
+        self.assertEqual(_dump(restored), _dump(DB_PATH))
+
+    async def test_no_changes_no_archive(self):
+        self.assertEqual(await backup.create_incremental_backup(self.dir / INC), 0)
+        self.assertFalse((self.dir / INC).exists())
+
+    async def test_replay_is_idempotent(self):
+        await self._change()
+        await backup.create_incremental_backup(self.dir / INC)
+        restored = self.dir / "restored.db"
+        await asyncio.to_thread(backup.build_restored_db, self.dir / INC, restored)
+        with zipfile.ZipFile(self.dir / INC) as zf:
+            lines = zf.read(backup.ARCHIVE_JOURNAL).decode("utf-8").splitlines()
+        await asyncio.to_thread(backup.replay_journal, restored, lines)
+        self.assertEqual(_dump(restored), _dump(DB_PATH))
+
+    async def test_pruned_journal_requires_full_backup(self):
+        await self._change()
+        self.assertGreater(await backup.prune_journal(0, 1), 0)
+        self.assertIsNone(await backup.create_incremental_backup(self.dir / INC))
+
+    async def test_prune_keeps_recent_rows(self):
+        await self._change()
+        self.assertEqual(await backup.prune_journal(7, 0), 0)
+        self.assertGreater(await backup.create_incremental_backup(self.dir / INC), 0)
@@ -0,0 +1,114 @@
+"""Тесты для аренды ведущего планировщика: две реплики на одной базе."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from datetime import timedelta
+from unittest import mock
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from sqlalchemy import select  # noqa: E402
+
+from app import leader  # noqa: E402
+from app.db import SessionLocal, Lease  # noqa: E402
+from app.leader import LeaderLease  # noqa: E402
+from tests.dbcase import DbTestCase  # noqa: E402
+
+
+class TestLeaderLease(DbTestCase):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.a = LeaderLease(name="test", ttl=30, holder="a")
+        self.b = LeaderLease(name="test", ttl=30, holder="b")
+
+    async def _row(self) -> Lease:
+        async with SessionLocal() as session:
+            return (await session.execute(select(Lease).where(Lease.name == "test"))).scalar_one()
+
+    def _later(self, seconds: float):
+        """Часы реплики, ушедшие вперёд на seconds."""
+        now = leader._utcnow()
+        return mock.patch.object(leader, "_utcnow", lambda: now + timedelta(seconds=seconds))
+
+    async def test_acquire_and_standby(self):
+        self.assertTrue(await self.a.try_acquire())
+        self.assertTrue(self.a.is_leader())
+        self.assertFalse(await self.b.try_acquire())
+        self.assertFalse(self.b.is_leader())
+        self.assertEqual((await self._row()).holder, "a")
+
+    async def test_renew_extends_expiry(self):
+        await self.a.try_acquire()
+        first = (await self._row()).expires_at
+        with self._later(10):
+            self.assertTrue(await self.a.try_acquire())
+        row = await self._row()
+        self.assertEqual(row.holder, "a")
+        self.assertGreater(row.expires_at, first)
+        # До истечения продлённой аренды резерв её не получит
+        with self._later(35):
+            self.assertFalse(await self.b.try_acquire())
+
+    async def test_takeover_after_expiry(self):
+        await self.a.try_acquire()
+        with self._later(31):
+            self.assertTrue(await self.b.try_acquire())
+            # Бывший ведущий, очнувшись, аренду не отбирает и сам уходит в резерв
+            self.assertFalse(await self.a.try_acquire())
+        self.assertFalse(self.a.is_leader())
+        self.assertTrue(self.b.is_leader())
+        self.assertEqual((await self._row()).holder, "b")
+
+    async def test_leader_since(self):
+        self.assertIsNone(self.a.leader_since)
+        await self.a.try_acquire()
+        since = self.a.leader_since
+        self.assertIsNotNone(since)
+        # Продление не сдвигает начало срока
+        await self.a.try_acquire()
+        self.assertEqual(self.a.leader_since, since)
+        with self._later(31):
+            await self.b.try_acquire()
+            await self.a.try_acquire()
+        self.assertIsNone(self.a.leader_since)
+        self.assertIsNotNone(self.b.leader_since)
+        await self.b.release()
+        self.assertIsNone(self.b.leader_since)
+
+    async def test_local_expiry_without_heartbeat(self):
+        short = LeaderLease(name="short", ttl=0.2, holder="a")
+        self.assertTrue(await short.try_acquire())
+        await asyncio.sleep(0.3)
+        # Продлить не успели — ведущим себя не считаем, даже не спрашивая БД
+        self.assertFalse(short.is_leader())
+
+    async def test_release_hands_over_immediately(self):
+        await self.a.try_acquire()
+        await self.a.release()
+        self.assertFalse(self.a.is_leader())
+        self.assertTrue(await self.b.try_acquire())
+        before = await self._row()
+        # Реплика, ещё считающая себя ведущей, чужую аренду не отпускает
+        self.a._valid_until = float("inf")
+        await self.a.release()
+        after = await self._row()
+        self.assertEqual((after.holder, after.expires_at), ("b", before.expires_at))
+
+    async def test_leader_only(self):
+        calls = []
+
+        async def job() -> str:
+            calls.append(1)
+            return "done"
+
+        with mock.patch.object(leader, "lease", self.b):
+            await self.a.try_acquire()
+            await self.b.try_acquire()
+            self.assertIsNone(await leader.leader_only(job)())
+            await self.a.release()
+            await self.b.try_acquire()
+            self.assertEqual(await leader.leader_only(job)(), "done")
+        self.assertEqual(calls, [1])
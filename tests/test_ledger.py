@@ -0,0 +1,146 @@
+"""Тесты для снимков баланса и сверки с историей операций."""
+
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from sqlalchemy import select, update  # noqa: E402
+
+from app import ledger  # noqa: E402
+from app.db import SessionLocal, BalanceSnapshot, BalanceTxn, Dealer, apply_balance_change, delete_dealer  # noqa: E402
+from tests.dbcase import DbTestCase  # noqa: E402
+
+
+class TestLedger(DbTestCase):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        async with SessionLocal() as session:
+            session.add_all([Dealer(code="d1", title="Первый"), Dealer(code="d2", title="Второй")])
+            await session.commit()
+
+    async def _add(self, code: str, *amounts: float) -> None:
+        for amount in amounts:
+            await apply_balance_change(code, amount, "renewal")
+
+    async def _snapshots(self, code: str) -> list[tuple[int, float]]:
+        async with SessionLocal() as session:
+            return [tuple(r) for r in (await session.execute(
+                select(BalanceSnapshot.txn_id, BalanceSnapshot.balance)
+                .where(BalanceSnapshot.dealer_code == code)
+                .order_by(BalanceSnapshot.txn_id)
+            )).all()]
+
+    async def _last_txn(self, code: str) -> int:
+        async with SessionLocal() as session:
+            return (await session.execute(
+                select(BalanceTxn.id).where(BalanceTxn.dealer_code == code).order_by(BalanceTxn.id.desc()).limit(1)
+            )).scalar_one()
+
+    async def _set_balance(self, code: str, balance: float) -> None:
+        async with SessionLocal() as session:
+            await session.execute(update(Dealer).where(Dealer.code == code).values(balance=balance))
+            await session.commit()
+
+    async def test_snapshots_by_tail_length(self):
+        await self._add("d1", 1, 2, 3)
+        await self._add("d2", 10)
+        # У d2 хвост короче порога — снимка нет
+        self.assertEqual(await ledger.take_snapshots(min_tail=3), 1)
+        first = await self._last_txn("d1")
+        self.assertEqual(await self._snapshots("d1"), [(first, 6.0)])
+        self.assertEqual(await self._snapshots("d2"), [])
+        # Хвоста после снимка нет
+        self.assertEqual(await ledger.take_snapshots(min_tail=3), 0)
+
+        await self._add("d1", 4, 5)
+        self.assertEqual(await ledger.take_snapshots(min_tail=3), 0)
+        await self._add("d1", 6)
+        self.assertEqual(await ledger.take_snapshots(min_tail=3), 1)
+        await self._add("d1", 7, 8, 9)
+        self.assertEqual(await ledger.take_snapshots(min_tail=3), 1)
+        # Каждый снимок строится от последнего, а не от первого
+        self.assertEqual([b for _, b in await self._snapshots("d1")], [6.0, 21.0, 45.0])
+
+    async def test_balance_at_and_before(self):
+        await self._add("d1", 1, 2, 3)
+        mid = await self._last_txn("d1")
+        await ledger.take_snapshots(min_tail=1)
+        await self._add("d1", 4)
+        self.assertEqual(await ledger.balance_at("d1", mid), 6.0)
+        self.assertEqual(await ledger.balance_at("d1", await self._last_txn("d1")), 10.0)
+        # До снимка: хвост считается от более раннего снимка или с нуля
+        self.assertEqual(await ledger.balance_at("d1", mid - 1), 3.0)
+
+        now = datetime.now(timezone.utc)
+        self.assertEqual(await ledger.balance_before("d1", now + timedelta(minutes=1)), 10.0)
+        self.assertEqual(await ledger.balance_before("d1", now - timedelta(days=1)), 0.0)
+
+    async def test_balances_before_matches_per_dealer(self):
+        await self._add("d1", 1, 2, 3)
+        await ledger.take_snapshots(min_tail=1)
+        await self._add("d1", 4)
+        await ledger.take_snapshots(min_tail=1)
+        await self._add("d2", 10)
+        at = datetime.now(timezone.utc) + timedelta(minutes=1)
+        # Последний снимок — на операции позже at: берётся предыдущий снимок
+        async with SessionLocal() as session:
+            await session.execute(
+                update(BalanceTxn).where(BalanceTxn.id == await self._last_txn("d1")).values(
+                    created_at=at + timedelta(days=1),
+                )
+            )
+            await session.commit()
+            got = dict(await ledger.balances_before(session, at))
+            self.assertEqual(got, {"d1": 6.0, "d2": 10.0})
+            self.assertEqual(await ledger.balances_before(session, at, "d2"), [("d2", 10.0)])
+        for code, balance in got.items():
+            self.assertEqual(await ledger.balance_before(code, at), balance)
+
+    async def test_find_drift(self):
+        await self._add("d1", 5, 5)
+        await self._add("d2", 1)
+        self.assertEqual(await ledger.find_drift(), [])
+
+        await self._set_balance("d1", 12.0)
+        # Меньше порога — округление, не расхождение
+        await self._set_balance("d2", 1.001)
+        drift = await ledger.find_drift()
+        self.assertEqual([(d.code, d.stored, d.ledger) for d in drift], [("d1", 12.0, 10.0)])
+        self.assertAlmostEqual(drift[0].diff, 2.0)
+
+    async def test_find_drift_uses_latest_snapshot(self):
+        await self._add("d1", 1, 2)
+        await ledger.take_snapshots(min_tail=1)
+        await self._add("d1", 3)
+        await ledger.take_snapshots(min_tail=1)
+        await self._add("d1", 4)
+        self.assertEqual(await ledger.find_drift(), [])
+
+        # Испорченный старый снимок не учитывается, последний — учитывается
+        (old_id, _), (new_id, _) = await self._snapshots("d1")
+        async with SessionLocal() as session:
+            await session.execute(update(BalanceSnapshot).where(BalanceSnapshot.txn_id == old_id).values(balance=100))
+            await session.commit()
+        self.assertEqual(await ledger.find_drift(), [])
+        async with SessionLocal() as session:
+            await session.execute(update(BalanceSnapshot).where(BalanceSnapshot.txn_id == new_id).values(balance=100))
+            await session.commit()
+        self.assertEqual([(d.code, d.ledger) for d in await ledger.find_drift()], [("d1", 104.0)])
+
+    async def test_recreated_dealer_has_no_drift(self):
+        await self._add("d1", 5, 7)
+        await ledger.take_snapshots(min_tail=1)
+        self.assertEqual(await delete_dealer("d1"), ("Первый", 0))
+        self.assertIsNone(await delete_dealer("d1"))
+
+        async with SessionLocal() as session:
+            session.add(Dealer(code="d1", title="Первый снова"))
+            await session.commit()
+        self.assertEqual(await ledger.find_drift(), [])
+        await self._add("d1", 3)
+        self.assertEqual(await ledger.find_drift(), [])
+        self.assertEqual(await ledger.balance_at("d1", await self._last_txn("d1")), 3.0)
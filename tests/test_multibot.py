@@ -0,0 +1,70 @@
+"""Тесты для отправки дилеру через его бота с запасным путём через основной."""
+
+from __future__ import annotations
+
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from aiogram.exceptions import TelegramForbiddenError  # noqa: E402
+from aiogram.methods import SendMessage  # noqa: E402
+
+from app import multibot  # noqa: E402
+
+CHAT = 100
+
+
+def _forbidden() -> TelegramForbiddenError:
+    return TelegramForbiddenError(
+        method=SendMessage(chat_id=CHAT, text="x"), message="Forbidden: bot can't initiate conversation with a user",
+    )
+
+
+class TestSendToDealer(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.registry = multibot.BotRegistry()
+        patcher = mock.patch.object(multibot, "registry", self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.main = SimpleNamespace(id=1, send_message=mock.AsyncMock(return_value="main"))
+        self.own = SimpleNamespace(id=2, send_message=mock.AsyncMock(return_value="own"))
+        self.registry.set_main(self.main)
+        self.registry.add("d1", self.own, gateway=None)
+
+    async def test_own_bot(self):
+        self.assertEqual(await multibot.send_to_dealer("d1", self.main, CHAT, "hi"), "own")
+        self.main.send_message.assert_not_awaited()
+
+    async def test_without_own_bot(self):
+        self.assertEqual(await multibot.send_to_dealer("d2", self.main, CHAT, "hi"), "main")
+        self.assertEqual(await multibot.send_to_dealer(None, self.main, CHAT, "hi"), "main")
+
+    async def test_not_started_falls_back_and_remembers(self):
+        self.own.send_message.side_effect = _forbidden()
+        self.assertEqual(await multibot.send_to_dealer("d1", self.main, CHAT, "hi", parse_mode="HTML"), "main")
+        self.main.send_message.assert_awaited_once_with(CHAT, "hi", parse_mode="HTML")
+
+        # Следующие сообщения — сразу через основной бот
+        await multibot.send_to_dealer("d1", self.main, CHAT, "again")
+        self.assertEqual(self.own.send_message.await_count, 1)
+        self.assertEqual(self.main.send_message.await_count, 2)
+
+    async def test_started_after_update(self):
+        self.own.send_message.side_effect = _forbidden()
+        await multibot.send_to_dealer("d1", self.main, CHAT, "hi")
+        self.own.send_message.side_effect = None
+
+        # Дилер написал своему боту — бот снова пишет сам
+        handler = mock.AsyncMock()
+        await multibot.DealerScopeMiddleware()(
+            handler, SimpleNamespace(), {"bot": self.own, "event_chat": SimpleNamespace(id=CHAT)},
+        )
+        self.assertEqual(await multibot.send_to_dealer("d1", self.main, CHAT, "hi"), "own")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""Тесты для шлюза исходящих сообщений (token bucket, повтор после 429)."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import unittest
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+from aiogram.methods import SendMessage  # noqa: E402
+
+from app.outbound import TokenBucket, OutboundGateway, LANE_BULK  # noqa: E402
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_wait(self):
+        b = TokenBucket(rate=2.0, capacity=2.0, now=0.0)
+        self.assertEqual(b.delay(0.0), 0.0)
+        b.take(0.0)
+        b.take(0.0)
+        # токенов нет — ждать половину секунды (rate=2/с)
+        self.assertAlmostEqual(b.delay(0.0), 0.5)
+        self.assertEqual(b.delay(0.5), 0.0)
+
+    def test_refill_capped(self):
+        b = TokenBucket(rate=1.0, capacity=3.0, now=0.0)
+        for _ in range(3):
+            b.take(0.0)
+        b.delay(100.0)
+        self.assertEqual(b.tokens, 3.0)
+
+    def test_reserve(self):
+        b = TokenBucket(rate=10.0, capacity=10.0, now=0.0)
+        for _ in range(8):
+            b.take(0.0)
+        # осталось 2 токена: без резерва можно, с резервом 2 — нет
+        self.assertEqual(b.delay(0.0), 0.0)
+        self.assertAlmostEqual(b.delay(0.0, reserve=2.0), 0.1)
+
+    def test_block(self):
+        b = TokenBucket(rate=1.0, capacity=1.0, now=0.0)
+        b.block(0.0, 5)
+        self.assertEqual(b.delay(1.0), 4.0)
+
+
+class TestOutboundGateway(unittest.TestCase):
+    def test_retry_after_is_retried(self):
+        gw = OutboundGateway(global_rate=100, chat_rate=100, chat_burst=10, max_retries=2)
+        method = SendMessage(chat_id=42, text="hi")
+        calls = []
+
+        async def make_request(bot, m):
+            calls.append(m)
+            if len(calls) == 1:
+                raise TelegramRetryAfter(method=m, message="Too Many Requests", retry_after=0)
+            return "ok"
+
+        result = asyncio.run(gw(make_request, None, method))
+        self.assertEqual(result, "ok")
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(gw.metrics()["retry_after"], 1)
+        self.assertEqual(gw.metrics()["sent"], 1)
+
+    def test_retry_gives_up(self):
+        gw = OutboundGateway(global_rate=100, chat_rate=100, chat_burst=10, max_retries=1)
+        method = SendMessage(chat_id=42, text="hi")
+
+        async def make_request(bot, m):
+            raise TelegramRetryAfter(method=m, message="Too Many Requests", retry_after=0)
+
+        with self.assertRaises(TelegramRetryAfter):
+            asyncio.run(gw(make_request, None, method))
+        self.assertEqual(gw.metrics()["failed"], 1)
+
+    def test_bulk_does_not_use_reserve(self):
+        gw = OutboundGateway(global_rate=10, chat_rate=100, chat_burst=100)
+
+        async def run():
+            # рассылка выбирает общий bucket до резерва (20%)...
+            for i in range(8):
+                await gw.acquire(i, LANE_BULK)
+            bulk_wait = gw.global_bucket.delay(gw.global_bucket.updated, reserve=2.0)
+            # ...а интерактивный ответ проходит сразу
+            await asyncio.wait_for(gw.acquire(100), timeout=0.05)
+            return bulk_wait
+
+        self.assertGreater(asyncio.run(run()), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Тесты для подтверждения оплат: параллельные решения по одной заявке."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from sqlalchemy import func, select  # noqa: E402
+
+from app.db import SessionLocal, BalanceTxn, Dealer, Payment, resolve_payment  # noqa: E402
+from tests.dbcase import DbTestCase  # noqa: E402
+
+ROUNDS = 5
+
+
+class TestResolvePayment(DbTestCase):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        async with SessionLocal() as session:
+            session.add(Dealer(code="d1", title="Первый", balance=100.0))
+            await session.commit()
+
+    async def _pending(self, amount: float = 10.0) -> int:
+        async with SessionLocal() as session:
+            pay = Payment(dealer_code="d1", method="cash", amount=amount)
+            session.add(pay)
+            await session.commit()
+            return pay.id
+
+    async def _state(self, pay_id: int) -> tuple[str, float, int]:
+        async with SessionLocal() as session:
+            status = (await session.execute(select(Payment.status).where(Payment.id == pay_id))).scalar_one()
+            balance = (await session.execute(select(Dealer.balance).where(Dealer.code == "d1"))).scalar_one()
+            txns = (await session.execute(
+                select(func.count()).select_from(BalanceTxn).where(BalanceTxn.kind == "payment")
+            )).scalar_one()
+        return status, balance, txns
+
+    async def test_confirm_vs_confirm(self):
+        for i in range(ROUNDS):
+            pay_id = await self._pending()
+            results = await asyncio.gather(
+                resolve_payment(pay_id, "confirmed"), resolve_payment(pay_id, "confirmed"),
+            )
+            self.assertEqual(sorted(changed for _, _, changed in results), [False, True])
+            # Долг списан один раз за каждую заявку
+            self.assertEqual(await self._state(pay_id), ("confirmed", 100.0 - 10.0 * (i + 1), i + 1))
+
+    async def test_confirm_vs_reject(self):
+        confirmed = 0
+        for _ in range(ROUNDS):
+            pay_id = await self._pending()
+            results = await asyncio.gather(
+                resolve_payment(pay_id, "confirmed"), resolve_payment(pay_id, "rejected"),
+            )
+            winners = [status for status, (_, _, changed) in zip(("confirmed", "rejected"), results) if changed]
+            self.assertEqual(len(winners), 1)
+            confirmed += winners[0] == "confirmed"
+            # Победило одно решение; списание — только если это подтверждение
+            self.assertEqual(await self._state(pay_id), (winners[0], 100.0 - 10.0 * confirmed, confirmed))
+
+    async def test_missing_and_already_resolved(self):
+        self.assertEqual(await resolve_payment(999, "confirmed"), (None, None, False))
+        pay_id = await self._pending()
+        await resolve_payment(pay_id, "rejected")
+        pay, dealer, changed = await resolve_payment(pay_id, "confirmed")
+        self.assertFalse(changed)
+        self.assertEqual((pay.status, dealer.code), ("rejected", "d1"))
+        self.assertEqual(await self._state(pay_id), ("rejected", 100.0, 0))
@@ -0,0 +1,45 @@
+"""Тесты для гистограммы длительностей (/perf)."""
+
+from __future__ import annotations
+
+import os
+import unittest
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from app.perf import Histogram, HIST_FACTOR  # noqa: E402
+
+
+class TestHistogram(unittest.TestCase):
+    def test_empty(self):
+        h = Histogram()
+        self.assertEqual(h.quantile(0.5), 0.0)
+        self.assertEqual(h.mean, 0.0)
+
+    def test_quantiles_within_bucket_error(self):
+        h = Histogram()
+        # 1..1000 мс равномерно
+        for i in range(1, 1001):
+            h.add(i / 1000)
+        for q, exact in ((0.5, 0.5), (0.95, 0.95), (0.99, 0.99)):
+            got = h.quantile(q)
+            self.assertGreaterEqual(got, exact)
+            self.assertLessEqual(got, exact * HIST_FACTOR)
+        self.assertAlmostEqual(h.mean, 0.5005)
+
+    def test_capped_by_max(self):
+        h = Histogram()
+        for _ in range(10):
+            h.add(0.0123)
+        self.assertEqual(h.quantile(0.99), 0.0123)
+
+    def test_overflow_bucket(self):
+        h = Histogram()
+        h.add(1000.0)
+        self.assertEqual(h.quantile(0.5), 1000.0)
+        self.assertEqual(h.counts[-1], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+"""Тесты для восстановления из бэкапа: проверка архива, подмена файла под монопольным доступом."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from sqlalchemy import func, select  # noqa: E402
+
+from app import backup  # noqa: E402
+from app.db import SCHEMA_VERSION, SessionLocal, Dealer, Item, apply_balance_change, exclusive_db  # noqa: E402
+from tests.dbcase import DB_PATH, DbTestCase  # noqa: E402
+
+FULL = "xmplus_backup_20260101_000000.zip"
+
+
+def _make_db(path: Path, tables: tuple[str, ...], user_version: int = SCHEMA_VERSION) -> Path:
+    conn = sqlite3.connect(path)
+    try:
+        for t in tables:
+            conn.execute(f"CREATE TABLE {t} (id INTEGER PRIMARY KEY)")
+        conn.execute(f"PRAGMA user_version = {user_version}")
+        conn.commit()
+    finally:
+        conn.close()
+    return path
+
+
+class TestVerifyDb(DbTestCase):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.dir = Path(tempfile.mkdtemp(prefix="xmplus-verify-"))
+        self.addCleanup(shutil.rmtree, self.dir, True)
+
+    async def test_valid(self):
+        backup.verify_db(_make_db(self.dir / "ok.db", backup.REQUIRED_TABLES))
+
+    async def test_not_sqlite(self):
+        path = self.dir / "corrupt.db"
+        path.write_bytes(b"definitely not a database" * 200)
+        with self.assertRaisesRegex(ValueError, "не является базой SQLite"):
+            backup.verify_db(path)
+
+    async def test_newer_schema(self):
+        path = _make_db(self.dir / "new.db", backup.REQUIRED_TABLES, SCHEMA_VERSION + 1)
+        with self.assertRaisesRegex(ValueError, "более новой версией"):
+            backup.verify_db(path)
+
+    async def test_missing_table(self):
+        path = _make_db(self.dir / "partial.db", tuple(t for t in backup.REQUIRED_TABLES if t != "dealers"))
+        with self.assertRaisesRegex(ValueError, "нет таблиц: dealers"):
+            backup.verify_db(path)
+
+
+class TestRestore(DbTestCase):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.dir = Path(tempfile.mkdtemp(prefix="xmplus-backups-"))
+        self.addCleanup(shutil.rmtree, self.dir, True)
+        for name, value in (
+            ("BACKUP_DIR", self.dir),
+            ("MANIFEST_PATH", self.dir / "manifest.json"),
+            ("TZ_OVERRIDE_PATH", self.dir / ".tz_override"),
+        ):
+            patcher = mock.patch.object(backup, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self._remove_safety_copies)
+        async with SessionLocal() as session:
+            session.add(Dealer(code="d1", title="Первый"))
+            session.add(Item(user_id=1, username="one", due_date=datetime(2030, 1, 1), dealer="d1"))
+            await session.commit()
+        await apply_balance_change("d1", 5.0, "renewal", "Продление: USERID=1")
+        await backup.create_backup(self.dir / FULL)
+
+    @staticmethod
+    def _remove_safety_copies() -> None:
+        for p in DB_PATH.parent.glob(f"{DB_PATH.name}.pre_restore_*"):
+            p.unlink()
+
+    async def _counts(self) -> tuple[int, float]:
+        async with SessionLocal() as session:
+            items = (await session.execute(select(func.count()).select_from(Item))).scalar_one()
+            balance = (await session.execute(select(Dealer.balance).where(Dealer.code == "d1"))).scalar_one()
+        return items, balance
+
+    async def test_restore_then_read_through_sessions(self):
+        async with SessionLocal() as session:
+            session.add(Item(user_id=2, username="two", due_date=datetime(2030, 1, 1), dealer="d1"))
+            await session.commit()
+        await apply_balance_change("d1", 5.0, "renewal", "Продление: USERID=2")
+        self.assertEqual(await self._counts(), (2, 10.0))
+
+        # Журнал отката от прерванной записи в старый файл не должен попасть в новый
+        leftover = Path(f"{DB_PATH}-journal")
+        snapshot = backup.snapshot_sqlite
+
+        def snapshot_then_leave_journal(*args):
+            snapshot(*args)
+            leftover.write_bytes(b"stale")
+
+        with mock.patch.object(backup, "snapshot_sqlite", snapshot_then_leave_journal):
+            meta = await backup.restore_backup(self.dir / FULL)
+        self.assertEqual(meta["kind"], backup.KIND_FULL)
+        self.assertFalse(leftover.exists())
+        self.assertEqual(await self._counts(), (1, 5.0))
+        self.assertTrue(list(DB_PATH.parent.glob(f"{DB_PATH.name}.pre_restore_*")))
+
+        # После подмены база доступна на запись
+        await apply_balance_change("d1", 1.0, "admin_add", "")
+        self.assertEqual(await self._counts(), (1, 6.0))
+
+    async def test_restore_waits_for_open_session(self):
+        opened, release = asyncio.Event(), asyncio.Event()
+
+        async def reader() -> int:
+            async with SessionLocal() as session:
+                opened.set()
+                await release.wait()
+                return (await session.execute(select(func.count()).select_from(Item))).scalar_one()
+
+        task = asyncio.create_task(reader())
+        await opened.wait()
+        restore = asyncio.create_task(backup.restore_backup(self.dir / FULL))
+        await asyncio.sleep(0.2)
+        # Пока сессия открыта, файл не подменяется
+        self.assertFalse(restore.done())
+        self.assertFalse(list(DB_PATH.parent.glob(f"{DB_PATH.name}.pre_restore_*")))
+        release.set()
+        self.assertEqual(await task, 1)
+        await restore
+        self.assertEqual(await self._counts(), (1, 5.0))
+
+
+class TestExclusiveDb(DbTestCase):
+    async def test_new_sessions_wait(self):
+        entered = asyncio.Event()
+
+        async def reader() -> None:
+            async with SessionLocal() as session:
+                entered.set()
+                await session.execute(select(func.count()).select_from(Item))
+
+        async with exclusive_db():
+            task = asyncio.create_task(reader())
+            await asyncio.sleep(0.05)
+            self.assertFalse(entered.is_set())
+            # Сессии самой замены не ждут
+            async with SessionLocal() as session:
+                await session.execute(select(func.count()).select_from(Item))
+        await task
+        self.assertTrue(entered.is_set())
+
+    async def test_timeout(self):
+        release = asyncio.Event()
+        opened = asyncio.Event()
+
+        async def holder() -> None:
+            async with SessionLocal():
+                opened.set()
+                await release.wait()
+
+        task = asyncio.create_task(holder())
+        await opened.wait()
+        with self.assertRaisesRegex(RuntimeError, "База занята"):
+            async with exclusive_db(timeout=0.05):
+                pass
+        release.set()
+        await task
+        # После таймаута вход снова открыт
+        async with SessionLocal() as session:
+            await session.execute(select(func.count()).select_from(Item))
+
+    async def test_pauses_background_writers(self):
+        calls: list[str] = []
+
+        async def pause() -> None:
+            calls.append("pause")
+
+        with mock.patch("app.db._db_pauses", [(pause, lambda: calls.append("resume"))]):
+            async with exclusive_db():
+                self.assertEqual(calls, ["pause"])
+        self.assertEqual(calls, ["pause", "resume"])
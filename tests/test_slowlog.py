@@ -0,0 +1,42 @@
+"""Тесты для нормализации запросов в журнале медленных запросов."""
+
+from __future__ import annotations
+
+import os
+import unittest
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from app.slowlog import normalize_sql, params_shape  # noqa: E402
+
+
+class TestNormalizeSql(unittest.TestCase):
+    def test_literals_and_spaces(self):
+        self.assertEqual(
+            normalize_sql("SELECT *\n  FROM items WHERE user_id = 42 AND username = 'it''s'"),
+            "SELECT * FROM items WHERE user_id = ? AND username = ?",
+        )
+
+    def test_in_lists_collapse(self):
+        a = normalize_sql("SELECT id FROM items WHERE id IN (?, ?, ?)")
+        b = normalize_sql("SELECT id FROM items WHERE id IN (?,?)")
+        self.assertEqual(a, b)
+        self.assertIn("IN (?...)", a)
+
+    def test_identifiers_with_digits_kept(self):
+        self.assertEqual(
+            normalize_sql("SELECT anon_1.id FROM t2 AS anon_1 LIMIT 10"),
+            "SELECT anon_1.id FROM t2 AS anon_1 LIMIT ?",
+        )
+
+
+class TestParamsShape(unittest.TestCase):
+    def test_shapes(self):
+        self.assertEqual(params_shape((1, "a", None), False), "(int, str, NoneType)")
+        self.assertEqual(params_shape({"x": 1.5}, False), "{x: float}")
+        self.assertEqual(params_shape([(1,), (2,)], True), "2×(int)")
+
+
+if __name__ == "__main__":
+    unittest.main()
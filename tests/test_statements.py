@@ -0,0 +1,126 @@
+"""Тесты для выписок дилеров за месяц."""
+
+from __future__ import annotations
+
+import os
+import unittest
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from zoneinfo import ZoneInfo  # noqa: E402
+
+from sqlalchemy import event, func, select, update  # noqa: E402
+
+from app import statements  # noqa: E402
+from app.db import SessionLocal, BalanceTxn, Dealer, apply_balance_change, engine  # noqa: E402
+from app.statements import build_statements, month_bounds, parse_month, previous_month, statement_text  # noqa: E402
+from tests.dbcase import DbTestCase  # noqa: E402
+
+
+class TestMonths(unittest.TestCase):
+    def test_parse_month(self):
+        self.assertEqual(parse_month("2026-9"), "2026-09")
+        self.assertEqual(parse_month(" 2026-10 "), "2026-10")
+        self.assertIsNone(parse_month("2026-13"))
+        self.assertIsNone(parse_month("09.2026"))
+
+    def test_previous_month(self):
+        self.assertEqual(previous_month(date(2026, 10, 19)), "2026-09")
+        self.assertEqual(previous_month(date(2026, 1, 1)), "2025-12")
+
+    def test_month_bounds_in_utc(self):
+        start, end = month_bounds("2026-12", ZoneInfo("Asia/Ashgabat"))
+        self.assertEqual(start, datetime(2026, 11, 30, 19, 0))
+        self.assertEqual(end, datetime(2026, 12, 31, 19, 0))
+
+
+class TestBuildStatements(unittest.TestCase):
+    def test_opening_and_closing(self):
+        rows = [
+            # (код, вид, метод, операций за месяц, сумма за месяц)
+            ("d1", "renewal", "", 2, 10.0),
+            ("d1", "order", "", 1, 5.0),
+            ("d1", "payment", "Оплата: Крипта → TRC-20", 1, -7.0),
+            ("d1", "admin_add", "", 1, 2.0),
+        ]
+        st = build_statements("2026-09", [("d1", 10.0), ("d2", 4.0)], rows)
+        d1 = st["d1"]
+        self.assertEqual(d1.opening, 10.0)
+        self.assertEqual((d1.renewals.count, d1.renewals.amount), (2, 10.0))
+        # Заказ ключей — начисление отдельной строкой, не корректировка
+        self.assertEqual((d1.orders.label, d1.orders.count, d1.orders.amount), ("заказы ключей", 1, 5.0))
+        self.assertEqual([(p.label, p.count, p.amount) for p in d1.payments], [("Крипта → TRC-20", 1, -7.0)])
+        self.assertEqual([a.label for a in d1.adjustments], ["начисление (админ)"])
+        self.assertEqual(d1.closing, 20.0)
+        self.assertIn("Заказы ключей: 1 на $5", statement_text(d1, "Первый"))
+        # Без операций: долг не менялся, выписка не пустая
+        self.assertEqual((st["d2"].opening, st["d2"].closing), (4.0, 4.0))
+        self.assertFalse(st["d2"].is_empty)
+
+    def test_empty(self):
+        st = build_statements("2026-09", [("d1", 0.0)], [])
+        self.assertTrue(st["d1"].is_empty)
+
+
+class TestStatementsFromLedger(DbTestCase):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        async with SessionLocal() as session:
+            session.add(Dealer(code="d1", title="Первый"))
+            await session.commit()
+        tz = mock.patch.object(statements, "get_active_timezone", lambda: timezone.utc)
+        tz.start()
+        self.addCleanup(tz.stop)
+
+    async def _txn(self, amount: float, kind: str, at: datetime) -> None:
+        await apply_balance_change("d1", amount, kind)
+        async with SessionLocal() as session:
+            last = (await session.execute(select(func.max(BalanceTxn.id)))).scalar_one()
+            await session.execute(update(BalanceTxn).where(BalanceTxn.id == last).values(created_at=at))
+            await session.commit()
+
+    async def test_opening_from_ledger_not_current_balance(self):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        this_month = now.strftime("%Y-%m")
+        month_start = datetime(now.year, now.month, 1)
+        await self._txn(10.0, "renewal", month_start - timedelta(days=40))
+        await self._txn(4.0, "order", month_start - timedelta(days=1))
+        await self._txn(5.0, "renewal", now)
+        # Баланс разошёлся с историей — выписка это не подхватывает
+        async with SessionLocal() as session:
+            await session.execute(update(Dealer).where(Dealer.code == "d1").values(balance=100.0))
+            await session.commit()
+
+        st = (await statements.get_statements(this_month, "d1"))["d1"]
+        self.assertEqual((st.opening, st.closing), (14.0, 19.0))
+        self.assertEqual(st.orders.count, 0)
+
+        prev = previous_month(month_start.date())
+        st = (await statements.get_statements(prev, "d1"))["d1"]
+        self.assertEqual((st.orders.count, st.orders.amount), (1, 4.0))
+        self.assertEqual(st.closing, 14.0)
+
+    async def test_one_query_for_all_openings(self):
+        async with SessionLocal() as session:
+            session.add_all([Dealer(code=f"x{i}", title=f"Дилер {i}") for i in range(20)])
+            await session.commit()
+        queries: list[str] = []
+
+        def count(conn, cursor, statement, *args):
+            queries.append(statement)
+
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+        try:
+            result = await statements.get_statements(datetime.now(timezone.utc).strftime("%Y-%m"))
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", count)
+        self.assertEqual(len(result), 21)
+        # Долг на начало всех дилеров и операции месяца — по одному запросу
+        self.assertEqual(len(queries), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Тесты для фоновых задач админа (TaskRunner)."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("OWNER_CHAT_ID", "1")
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter  # noqa: E402
+from aiogram.methods import EditMessageText  # noqa: E402
+
+from app.tasks import STATUS_DONE, TaskRunner  # noqa: E402
+
+
+class _Bot:
+    def __init__(self, send_delay: float = 0.0) -> None:
+        self.send_delay = send_delay
+        self.sent: list[str] = []
+        self.edit_message_text = mock.AsyncMock()
+
+    async def send_message(self, chat_id: int, text: str) -> SimpleNamespace:
+        # Ожидание в шлюзе исходящих
+        await asyncio.sleep(self.send_delay)
+        self.sent.append(text)
+        return SimpleNamespace(message_id=len(self.sent))
+
+
+async def _finished(runner: TaskRunner) -> None:
+    while runner.running():
+        await asyncio.sleep(0.01)
+
+
+class TestTaskRunner(unittest.IsolatedAsyncioTestCase):
+    async def test_same_key_started_once(self):
+        runner, bot = TaskRunner(), _Bot(send_delay=0.05)
+        release = asyncio.Event()
+
+        async def body(job) -> str:
+            await release.wait()
+            return "ok"
+
+        jobs = await asyncio.gather(
+            runner.start(bot, 1, "Бэкап", body, key="backup"),
+            runner.start(bot, 1, "Бэкап", body, key="backup"),
+        )
+        self.assertEqual(sum(job is not None for job in jobs), 1)
+        self.assertEqual(len(runner.running()), 1)
+        release.set()
+        await _finished(runner)
+
+    async def test_failed_send_frees_key(self):
+        runner, bot = TaskRunner(), _Bot()
+        method = EditMessageText(text="x")
+        with mock.patch.object(bot, "send_message", side_effect=TelegramNetworkError(method, "timeout")):
+            with self.assertRaises(TelegramNetworkError):
+                await runner.start(bot, 1, "Бэкап", mock.AsyncMock(), key="backup")
+        self.assertIsNone(runner.find_running("backup"))
+
+    async def test_progress_errors_do_not_fail_job(self):
+        runner, bot = TaskRunner(), _Bot()
+        method = EditMessageText(text="x")
+        bot.edit_message_text.side_effect = [
+            TelegramNetworkError(method, "timeout"),
+            TelegramRetryAfter(method, "Too Many Requests", 5),
+            None,
+        ]
+
+        async def body(job) -> str:
+            await job.progress("1", force=True)
+            await job.progress("2", force=True)
+            return "готово"
+
+        job = await runner.start(bot, 1, "Рассылка", body)
+        await _finished(runner)
+        self.assertEqual((job.status, job.text), (STATUS_DONE, "готово"))
+
+
+if __name__ == "__main__":
+    unittest.main()